@@ -0,0 +1,232 @@
+"""
+Times the voter roll's hot paths on synthetic rolls and writes the results as JSON.
+
+Run from the repository root:
+
+    python -m benchmarks.hot_paths --sizes 10000,100000
+    python -m benchmarks.hot_paths --compare benchmarks/results/<baseline>.json
+
+Each case is timed `--repeats` times (min and median are kept) and run once more under tracemalloc
+for its peak Python allocation. With --compare, cases whose median grew by more than --threshold
+over the baseline are listed and the exit status is 1.
+"""
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_roll import load_template, synthetic_roll, voter_table
+from pop_analysis import compact_roll
+from pop_analysis import data_analyzer as da
+from pop_analysis import roll_cache, roll_duckdb, storage, summary_cache, voter_query, write_queue
+
+DEFAULT_SIZES = [10_000, 100_000, 1_000_000, 5_000_000]
+RESULTS_DIR = os.path.join("benchmarks", "results")
+# read_excel takes ~4s per 10k rows, so larger workbooks are skipped (xlsx stops at 1,048,576 rows anyway)
+EXCEL_MAX_ROWS = 20_000
+VOTE_BATCH = 100
+FILTERS = [{"column": "الجنس", "values": ["الإناث"]}, {"column": "مذهب الشخصي", "values": ["ماروني", "روم كاثوليك"]}]
+SUMMARY_COLUMN = "الشهرة"
+
+
+def measure(func, repeats: int) -> dict:
+    """Runs func `repeats` times for timing, then once under tracemalloc for its peak allocation."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        "seconds_min": min(seconds),
+        "seconds_median": statistics.median(seconds),
+        "repeats": repeats,
+        "peak_memory_bytes": peak,
+    }
+
+
+def _vote_changes(n_rows: int, rng: np.random.Generator) -> dict:
+    voter_ids = rng.choice(n_rows, size=min(VOTE_BATCH, n_rows), replace=False)
+    return {int(pid): bool(rng.integers(2)) for pid in voter_ids}
+
+
+def _update_voted_loop(db_file: str, changes: dict):
+    # The pre-batching write path: one UPDATE and one commit per changed voter
+    conn = sqlite3.connect(db_file)
+    try:
+        for pid, voted in changes.items():
+            conn.execute(storage.UPDATE_VOTED_SQL, (bool(voted), pid))
+            conn.commit()
+    finally:
+        conn.close()
+
+
+def bench_size(n_rows: int, template: pd.DataFrame, workdir: str, repeats: int, excel_max_rows: int) -> list[dict]:
+    """Times every case on one synthetic roll of n_rows voters."""
+    results = []
+    rng = np.random.default_rng(n_rows)
+
+    def record(case: str, func, **extra):
+        result = {"case": case, "rows": n_rows, **measure(func, repeats), **extra}
+        results.append(result)
+        peak_mib = result["peak_memory_bytes"] / 2**20
+        print(f"{n_rows:>9} {case:<24} {result['seconds_median']:9.4f}s  peak {peak_mib:8.1f} MiB")
+
+    plain = synthetic_roll(n_rows, template)
+
+    # --- Load ---
+    parquet_path = os.path.join(workdir, f"roll-{n_rows}.parquet")
+    compact = roll_cache.to_categoricals(plain)
+    compact.to_parquet(parquet_path, index=False)
+    record("load_parquet", lambda: pd.read_parquet(parquet_path), memory_bytes=roll_cache.frame_memory(compact))
+    if n_rows <= excel_max_rows:
+        excel_path = os.path.join(workdir, f"roll-{n_rows}.xlsx")
+        plain.to_excel(excel_path, index=False)
+        record("load_excel", lambda: pd.read_excel(excel_path), memory_bytes=roll_cache.frame_memory(plain))
+
+    # --- Filter ---
+    record("filter_by_column", lambda: da.filter_by_column(plain, FILTERS[0]["column"], FILTERS[0]["values"]))
+    index = da.ColumnIndex(compact)
+    for filt in FILTERS:
+        index.codes(filt["column"])  # Built once per dataset in the apps, not per filter
+    record("filter_view_indexed", lambda: da.filter_view(compact, FILTERS, index))
+    # The analyzer's DuckDB engine queries the same Parquet file in place; len() runs the filter
+    duckdb_roll = roll_duckdb.DuckDBRoll(parquet_path) if roll_duckdb.available() else None
+    if duckdb_roll is not None:
+        for filt in FILTERS:
+            duckdb_roll.options(filt["column"])  # Label lookups are built once per file, like the index codes
+        record("filter_view_duckdb", lambda: len(duckdb_roll.filter_view(FILTERS)[0]))
+
+    # --- Summarize ---
+    record("summarize_by_column", lambda: da.summarize_by_column(plain, SUMMARY_COLUMN))
+    view, _ = da.filter_view(compact, FILTERS, index)
+    record("summary_filtered_pandas", lambda: da.summarize_by_column(view.frame(), SUMMARY_COLUMN))
+    if duckdb_roll is not None:
+        duckdb_view, _ = duckdb_roll.filter_view(FILTERS)
+        record("summarize_duckdb", lambda: roll_duckdb.DuckDBView(duckdb_roll).summarize(SUMMARY_COLUMN))
+        record("summary_filtered_duckdb", lambda: duckdb_view.summarize(SUMMARY_COLUMN))
+    record(
+        "summary_cube_cold",
+        lambda: summary_cache.SummaryCache().summarize(compact, view, SUMMARY_COLUMN, FILTERS, n_rows),
+    )
+    warm_cache = summary_cache.SummaryCache()
+    warm_cache.summarize(compact, view, SUMMARY_COLUMN, FILTERS, n_rows)
+    record("summary_cached", lambda: warm_cache.summarize(compact, view, SUMMARY_COLUMN, FILTERS, n_rows))
+
+    # --- Vote updates and the reload after an edit ---
+    db_file = os.path.join(workdir, f"votes-{n_rows}.db")
+    table = voter_table(synthetic_roll(n_rows, template, plain=False))
+    pool = storage.get_pool(db_file)
+    try:
+        storage.write_table(pool, table.astype({col: object for col in table.select_dtypes("category").columns}))
+        changes = _vote_changes(n_rows, rng)
+        record("update_voted_batch", lambda: storage.update_voted(pool, changes), changes=len(changes))
+        record("update_voted_loop", lambda: _update_voted_loop(db_file, changes), changes=len(changes))
+        # What a volunteer's click waits for with the background writer: the commit happens after it returns
+        writer = write_queue.VoteWriter(db_file)
+        record("submit_voted_queued", lambda: writer.submit(changes), changes=len(changes))
+        writer.close()
+        record("reload_after_edit", lambda: storage.read_table(pool))
+        roll = compact_roll.SharedRoll(table)
+        record("patch_shared_roll", lambda: roll.apply_voted(changes), changes=len(changes))
+        # Push-down: the filters become one WHERE over the covering indexes; only counts and a page are read
+        voter_query.ensure_indexes(pool)
+        sql_view = voter_query.SqlView.from_filters(pool, voter_query.compile_filters(FILTERS, list(table.columns)))
+        record("filter_sql_counts", lambda: sql_view.counts())
+        record("filter_sql_page", lambda: sql_view.take(0, 100))
+    finally:
+        storage.close_pool(db_file)
+        storage.remove_database(db_file)
+    return results
+
+
+def run_metadata() -> dict:
+    """Describes the code and environment the results were measured on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def compare(results: list[dict], baseline_path: str, threshold: float) -> list[str]:
+    """Returns a line for every case that got slower than the baseline by more than threshold (a ratio)."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(r["case"], r["rows"]): r for r in json.load(f)["results"]}
+    regressions = []
+    for result in results:
+        before = baseline.get((result["case"], result["rows"]))
+        if before and before["seconds_median"] > 0:
+            ratio = result["seconds_median"] / before["seconds_median"]
+            if ratio > threshold:
+                regressions.append(
+                    f"{result['case']} at {result['rows']} rows: {before['seconds_median']:.4f}s -> "
+                    f"{result['seconds_median']:.4f}s ({ratio:.2f}x)"
+                )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma-separated roll sizes.")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--excel-max-rows", type=int, default=EXCEL_MAX_ROWS)
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>-<commit>.json).")
+    parser.add_argument("--compare", help="A previous results file to check for regressions.")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    template = load_template()
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n_rows in sizes:
+            results.extend(bench_size(n_rows, template, workdir, args.repeats, args.excel_max_rows))
+
+    meta = run_metadata()
+    output = args.output
+    if output is None:
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        output = os.path.join(RESULTS_DIR, f"{stamp}-{meta['commit'] or 'nogit'}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": results}, f, ensure_ascii=False, indent=2)
+    print(f"Wrote {len(results)} results to {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from pop_analysis import roll_cache
+
+TEMPLATE_FILE = "data/final--القاع-2025-filtered.xlsx"
+# Columns init_db drops before writing the tracking database
+DROPPED_COLUMNS = ["البلدة أو الحي", "القضاء", "المحافظة", "الدائرة الانتخابية"]
+
+
+def load_template(path: str = TEMPLATE_FILE) -> pd.DataFrame:
+    """Reads the real roll whose schema and value frequencies synthetic rolls reproduce."""
+    df, _ = roll_cache.read_roll(path)
+    return df
+
+
+def synthetic_roll(n_rows: int, template: pd.DataFrame, seed: int = 0, plain: bool = True) -> pd.DataFrame:
+    """
+    Generates a voter roll with the template's columns and per-column value frequencies.
+
+    Each column is sampled independently from the template's observed values (missing values
+    included), so group sizes scale with n_rows while the vocabulary of names, families and
+    registries stays that of the real roll.
+
+    Args:
+        n_rows: Number of voters to generate.
+        template: The real roll, e.g. from load_template.
+        seed: Random seed; the same seed and template always give the same roll.
+        plain: Return object-dtype strings as read_excel would, instead of categoricals.
+
+    Returns:
+        A DataFrame with n_rows rows and the template's columns and dtypes.
+    """
+    rng = np.random.default_rng(seed)
+    columns = {}
+    for col in template.columns:
+        counts = template[col].value_counts(dropna=False)
+        codes = rng.choice(len(counts), size=n_rows, p=(counts / counts.sum()).to_numpy())
+        if isinstance(template[col].dtype, pd.CategoricalDtype):
+            category_codes = template[col].cat.categories.get_indexer(counts.index)  # Missing values map to -1
+            column = pd.Categorical.from_codes(category_codes[codes], dtype=template[col].dtype)
+            columns[col] = np.asarray(column, dtype=object) if plain else column
+        else:
+            columns[col] = counts.index.to_numpy()[codes]
+    return pd.DataFrame(columns)
+
+
+def voter_table(roll: pd.DataFrame, voted_share: float = 0.0, seed: int = 0) -> pd.DataFrame:
+    """Shapes a roll the way init_db stores it: local columns dropped, voter_id first and a 'voted' flag."""
+    df = roll.drop(columns=DROPPED_COLUMNS, errors="ignore")
+    df.insert(0, "voter_id", range(len(df)))
+    df["voted"] = np.random.default_rng(seed).random(len(df)) < voted_share
+    return df
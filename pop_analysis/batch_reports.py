@@ -0,0 +1,282 @@
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import pandas as pd
+
+try:
+    from . import data_analyzer as da
+    from . import storage
+    from .summary_cache import CountCube
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import data_analyzer as da
+    import storage
+    from summary_cache import CountCube
+
+# Columns a batch can be split by: one report per family name or per registry number
+SPLIT_COLUMNS = {"family": "الشهرة", "registry": "رقم السجل"}
+FORMATS = ["pdf", "csv"]
+# Fonts tried in order when --font is not given; the PDF needs one with Arabic glyphs
+FONT_CANDIDATES = [
+    os.environ.get("REPORT_FONT", ""),
+    "/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+    "/usr/share/fonts/truetype/noto/NotoNaskhArabic-Regular.ttf",
+    "/Library/Fonts/Arial Unicode.ttf",
+    "C:/Windows/Fonts/arial.ttf",
+]
+# Jobs handed to each worker at a time; families are many and small
+CHUNK_SIZE = 16
+
+
+@dataclass
+class SummarySpec:
+    """One summary of a report: counts grouped by some columns, over the rows matching some filters."""
+
+    name: str
+    group_by: list[str]
+    filters: list[dict] = field(default_factory=list)  # Same {'column', 'values'} dicts as the apps use
+
+    @classmethod
+    def from_dict(cls, spec: dict) -> "SummarySpec":
+        group_by = spec["group_by"]
+        return cls(
+            name=spec.get("name") or "_".join(group_by if isinstance(group_by, list) else [group_by]),
+            group_by=group_by if isinstance(group_by, list) else [group_by],
+            filters=spec.get("filters", []),
+        )
+
+    @property
+    def columns(self) -> list[str]:
+        """Every column the summary reads: its group columns and filter columns."""
+        return [*self.group_by, *(filt["column"] for filt in self.filters if filt.get("values"))]
+
+
+DEFAULT_SPECS = [
+    SummarySpec("gender", ["الجنس"]),
+    SummarySpec("religion", ["مذهب الشخصي"]),
+    SummarySpec("registry", ["رقم السجل"]),
+    SummarySpec("father", ["اسم الاب"]),
+]
+
+
+@dataclass
+class BatchReport:
+    """What a batch run produced and how long it took."""
+
+    partitions: int
+    files: list[str]
+    seconds: float
+    cube_cells: int
+
+    def __str__(self) -> str:
+        return (
+            f"{self.partitions} reports, {len(self.files)} files in {self.seconds:.2f}s "
+            f"(summarized from {self.cube_cells} cube cells)"
+        )
+
+
+def load_specs(path: str | None) -> list[SummarySpec]:
+    """Reads summary specs from a JSON list of {'name', 'group_by', 'filters'} objects (defaults if no path)."""
+    if path is None:
+        return list(DEFAULT_SPECS)
+    with open(path, encoding="utf-8") as f:
+        return [SummarySpec.from_dict(spec) for spec in json.load(f)]
+
+
+def build_cube(df: pd.DataFrame, specs: list[SummarySpec], split_by: str | None) -> CountCube:
+    """
+    Counts the roll once over every column any spec needs, plus the split column.
+
+    This is the only pass over voter rows; every summary of every report is then rolled up from
+    the cube's cells.
+    """
+    dimensions = [split_by] if split_by else []
+    for spec in specs:
+        dimensions += [col for col in spec.columns if col not in dimensions]
+    missing = [col for col in dimensions if col not in df.columns]
+    if missing:
+        raise ValueError(f"Column(s) {missing} not found in the roll. Available columns: {df.columns.tolist()}")
+    return CountCube(df, dimensions)
+
+
+def summarize_cells(cube: CountCube, specs: list[SummarySpec]) -> dict[str, pd.DataFrame]:
+    """Computes every spec from one cube (the whole roll or one partition's slice)."""
+    return {spec.name: cube.summarize(spec.group_by, spec.filters) for spec in specs}
+
+
+def safe_filename(value: object) -> str:
+    """Turns a family name or registry number into a file name, keeping Arabic letters."""
+    return re.sub(r"[^\w\-]+", "_", str(value)).strip("_") or "empty"
+
+
+def write_csv(path: str, summaries: dict[str, pd.DataFrame]):
+    """Writes all summaries of one report to a single long-format CSV (summary, group, count)."""
+    parts = []
+    for name, summary_df in summaries.items():
+        group_columns = [col for col in summary_df.columns if col != "count"]
+        group = summary_df[group_columns].astype(str).agg(" - ".join, axis=1) if len(summary_df) else []
+        parts.append(pd.DataFrame({"summary": name, "group": group, "count": summary_df["count"]}))
+    report = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=["summary", "group", "count"])
+    report.to_csv(path, index=False, encoding="utf-8-sig")  # The BOM makes Excel read Arabic correctly
+
+
+def write_pdf(path: str, title: str, summaries: dict[str, pd.DataFrame], font_path: str):
+    """Renders the summaries of one report as tables in a PDF."""
+    from fpdf import FPDF
+    from fpdf.fonts import FontFace
+
+    pdf = FPDF()
+    pdf.add_font("report", fname=font_path)
+    try:
+        pdf.set_text_shaping(use_shaping_engine=True, direction="rtl")  # Joined, right-to-left Arabic
+    except Exception:
+        pass  # Shaping needs uharfbuzz; without it letters are drawn unjoined but still legible
+    pdf.add_page()
+    pdf.set_font("report", size=16)
+    pdf.cell(text=title, new_x="LMARGIN", new_y="NEXT", align="R")
+    for name, summary_df in summaries.items():
+        pdf.set_font("report", size=12)
+        pdf.ln(4)
+        pdf.cell(
+            text=f"{name} ({int(summary_df['count'].sum()) if len(summary_df) else 0})", new_x="LMARGIN", new_y="NEXT"
+        )
+        if summary_df.empty:
+            continue
+        pdf.set_font("report", size=9)
+        # Headings are shaded rather than bold: only the regular style of the font is loaded
+        headings_style = FontFace(emphasis="", fill_color=(225, 225, 225))
+        with pdf.table(text_align="RIGHT", headings_style=headings_style) as table:
+            table.row([str(col) for col in summary_df.columns])
+            for values in summary_df.itertuples(index=False):
+                table.row([str(value) for value in values])
+    pdf.output(path)
+
+
+def _render_report(job: tuple) -> list[str]:
+    # Runs in a worker process: roll one partition's cells up into every spec and write its files
+    key, cells, dimensions, specs, out_dir, formats, font_path, title = job
+    summaries = summarize_cells(CountCube.from_cells(cells, dimensions), specs)
+    written = []
+    if "csv" in formats:
+        written.append(os.path.join(out_dir, f"{key}.csv"))
+        write_csv(written[-1], summaries)
+    if "pdf" in formats:
+        written.append(os.path.join(out_dir, f"{key}.pdf"))
+        write_pdf(written[-1], title, summaries, font_path)
+    return written
+
+
+def find_font(font_path: str | None = None) -> str | None:
+    """Returns the given font, or the first installed candidate that can draw Arabic."""
+    for candidate in [font_path, *FONT_CANDIDATES]:
+        if candidate and os.path.exists(candidate):
+            return candidate
+    return None
+
+
+def generate_reports(
+    df: pd.DataFrame,
+    specs: list[SummarySpec],
+    out_dir: str,
+    split_by: str | None = SPLIT_COLUMNS["family"],
+    formats: list[str] = FORMATS,
+    workers: int | None = None,
+    font_path: str | None = None,
+) -> BatchReport:
+    """
+    Writes one report per value of split_by (or a single report for the whole roll).
+
+    Args:
+        df: The voter roll.
+        specs: The summaries every report contains.
+        out_dir: Directory receiving '<split>-<value>.pdf' / '.csv' files.
+        split_by: Column to split the roll by, e.g. the family name; None for one overall report.
+        formats: Any of 'pdf' and 'csv'.
+        workers: Size of the process pool rendering reports (default: one per CPU).
+        font_path: A TrueType font with Arabic glyphs for the PDFs (default: first of FONT_CANDIDATES).
+
+    Returns:
+        A BatchReport listing the files written.
+    """
+    start = time.perf_counter()
+    if "pdf" in formats:
+        font_path = find_font(font_path)
+        if font_path is None:
+            raise FileNotFoundError("No font with Arabic glyphs found for the PDFs; pass --font or set REPORT_FONT.")
+    os.makedirs(out_dir, exist_ok=True)
+
+    cube = build_cube(df, specs, split_by)
+    dimensions = cube.dimensions
+    if split_by:
+        prefix = next((key for key, col in SPLIT_COLUMNS.items() if col == split_by), safe_filename(split_by))
+        jobs = [
+            (
+                f"{prefix}-{safe_filename(value)}",
+                cells,
+                dimensions,
+                specs,
+                out_dir,
+                formats,
+                font_path,
+                f"{split_by}: {value}",
+            )
+            for value, cells in cube.cells.groupby(split_by, observed=True, sort=True)
+        ]
+    else:
+        jobs = [("all", cube.cells, dimensions, specs, out_dir, formats, font_path, "All voters")]
+
+    files = []
+    if workers == 1 or len(jobs) == 1:
+        for job in jobs:
+            files += _render_report(job)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for written in executor.map(_render_report, jobs, chunksize=CHUNK_SIZE):
+                files += written
+    return BatchReport(
+        partitions=len(jobs), files=files, seconds=time.perf_counter() - start, cube_cells=len(cube.cells)
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Write per-family or per-registry summary reports (PDF and CSV).")
+    parser.add_argument("roll", nargs="?", help="Roll workbook (.xlsx); omit when using --db.")
+    parser.add_argument("--db", help="Read the voters table of a votes database instead (includes 'voted').")
+    parser.add_argument("--specs", help="JSON list of summary specs; defaults to gender, religion, registry, father.")
+    parser.add_argument("--split", choices=[*SPLIT_COLUMNS, "none"], default="family")
+    parser.add_argument("--out", default="reports", help="Output directory.")
+    parser.add_argument("--formats", default=",".join(FORMATS), help="Comma-separated: pdf, csv.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU).")
+    parser.add_argument("--font", help="TrueType font with Arabic glyphs for the PDFs.")
+    args = parser.parse_args(argv)
+
+    if args.db:
+        df = storage.read_table(storage.get_pool(args.db))
+    elif args.roll:
+        df = da.load_data(args.roll)
+        if df is None:
+            return 1
+    else:
+        parser.error("give a roll workbook or --db")
+
+    formats = [fmt.strip() for fmt in args.formats.split(",") if fmt.strip() in FORMATS]
+    report = generate_reports(
+        df,
+        load_specs(args.specs),
+        args.out,
+        split_by=None if args.split == "none" else SPLIT_COLUMNS[args.split],
+        formats=formats,
+        workers=args.workers,
+        font_path=args.font,
+    )
+    print(f"Wrote {report} to {args.out}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
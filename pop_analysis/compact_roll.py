@@ -0,0 +1,210 @@
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .filter_engine import ColumnIndex
+    from .roll_cache import CATEGORICAL_MAX_RATIO, frame_memory, to_categoricals
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    from filter_engine import ColumnIndex
+    from roll_cache import CATEGORICAL_MAX_RATIO, frame_memory, to_categoricals
+
+# Batches of logged changes a roll remembers, so sessions can ask which voters changed since their last look
+CHANGE_HISTORY_BATCHES = 256
+
+
+@dataclass
+class MemoryReport:
+    """Memory held by the shared voter roll versus what one session keeps for itself."""
+
+    rows: int
+    plain_bytes: int  # The roll as read from the database: object strings and 64-bit integers
+    shared_bytes: int  # The compact roll and its column index, held once per process
+    session_bytes: int = 0  # Data owned by the current session (e.g. its filtered row positions)
+
+    @property
+    def reduction(self) -> float | None:
+        per_session = self.session_bytes or None
+        return self.plain_bytes / per_session if per_session else None
+
+    def __str__(self) -> str:
+        text = f"{self.rows} rows: {self.shared_bytes / 2**20:.1f} MiB shared per process"
+        text += f" (plain frame: {self.plain_bytes / 2**20:.1f} MiB)"
+        text += f", {self.session_bytes / 2**10:.1f} KiB in this session"
+        if self.reduction:
+            text += f" ({self.reduction:.0f}x less than a plain copy)"
+        return text
+
+
+def owned_memory(df: pd.DataFrame) -> int:
+    """
+    Returns the bytes a frame holds on its own, not counting categories it shares with the roll.
+
+    A row selection of the compact roll keeps references to the roll's category arrays, so only its
+    codes and non-categorical columns are really its own.
+    """
+    total = int(df.index.memory_usage(deep=True))
+    for col in df.columns:
+        column = df[col]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            total += column.cat.codes.nbytes
+        else:
+            total += int(column.memory_usage(index=False, deep=True))
+    return total
+
+
+def compact_frame(df: pd.DataFrame, max_ratio: float = CATEGORICAL_MAX_RATIO) -> pd.DataFrame:
+    """
+    Returns a low-memory copy of a voter table.
+
+    Repetitive string columns become categoricals, the remaining strings are stored as Arrow strings
+    (one buffer instead of a Python object per cell), integers are downcast and 'voted' becomes a bool
+    array.
+
+    Args:
+        df: The voter table, e.g. as read by storage.read_table.
+        max_ratio: Largest distinct/total ratio for a string column to become a categorical.
+
+    Returns:
+        A DataFrame with the same columns, rows and values.
+    """
+    df = to_categoricals(df, max_ratio)
+    converted = {}
+    for col in df.columns:
+        column = df[col]
+        if col == "voted":
+            converted[col] = column.fillna(0).astype(bool)
+        elif column.dtype == object:
+            try:
+                converted[col] = column.astype("string[pyarrow]")
+            except (ImportError, TypeError, ValueError):
+                pass  # No pyarrow, or mixed values Arrow cannot hold: keep the column as is
+        elif pd.api.types.is_integer_dtype(column.dtype):
+            converted[col] = pd.to_numeric(column, downcast="integer")
+    return df.assign(**converted) if converted else df
+
+
+class SharedRoll:
+    """
+    One compact copy of the voter roll and its filter index, shared by every session of a process.
+
+    Sessions must treat `df` as read-only, apart from recording votes through apply_voted, which
+    patches the shared 'voted' array under a lock so every session sees the tick. Ticks written by
+    other processes reach the roll through apply_logged, which follows the vote change log from the
+    seq the roll was read at.
+    """
+
+    def __init__(self, df: pd.DataFrame, version: object = None, id_column: str = "voter_id", last_seq: int = 0):
+        self.version = version
+        self.last_seq = last_seq  # The vote change log entry the roll's votes include
+        self.synced_at = 0.0
+        self._history: deque[tuple[np.ndarray, np.ndarray]] = deque()  # (seqs, voter_ids) per applied batch
+        self._history_floor = last_seq  # changed_since() can answer for any seq from here on
+        self._sync_lock = threading.Lock()
+        self.id_column = id_column
+        self.plain_bytes = frame_memory(df)
+        self.df = compact_frame(df)
+        self.index = ColumnIndex(self.df)
+        # Every filterable column is coded once here, off the first filter's rerun (ids are never filtered on)
+        self.index.prepare([col for col in self.df.columns if col != id_column])
+        # Kept as int64 (not the downcast column) so lookups by Python ints reuse the index's hash table
+        self._positions = pd.Index(df[id_column], dtype="int64") if id_column in df.columns else None
+        self._lock = threading.Lock()
+
+    @property
+    def shared_bytes(self) -> int:
+        return frame_memory(self.df) + self.index.nbytes
+
+    def positions(self, voter_ids: list) -> np.ndarray:
+        """Returns the row positions of the given voter_ids (-1 for unknown ids), in the same order."""
+        if self._positions is None:
+            return np.full(len(voter_ids), -1, dtype=np.intp)
+        return self._positions.get_indexer(voter_ids)
+
+    def apply_voted(self, changes: dict) -> np.ndarray:
+        """
+        Records {voter_id: voted} changes in the shared roll.
+
+        Returns:
+            The row positions that were patched.
+        """
+        if self._positions is None or "voted" not in self.df.columns or not changes:
+            return np.empty(0, dtype=np.intp)
+        positions = self.positions(list(changes.keys()))
+        found = positions >= 0
+        positions = positions[found]
+        values = np.fromiter(changes.values(), dtype=bool, count=len(changes))[found]
+        with self._lock:
+            self.df.iloc[positions, self.df.columns.get_loc("voted")] = values  # In place, seen by every session
+            self.index.update("voted", positions, values.tolist())
+        return positions
+
+    def apply_logged(self, changes: pd.DataFrame, skip: object = ()) -> int:
+        """
+        Brings the roll's votes up to date with entries of the vote change log.
+
+        Entries at or below last_seq are ignored, so several sessions may hand in the same batch; the
+        roll only moves forward.
+
+        Args:
+            changes: Log entries (seq, voter_id, voted), oldest first, as storage.read_changes returns.
+            skip: voter_ids to leave alone, e.g. toggles this process queued but has not committed yet,
+                so an older logged value does not undo them.
+
+        Returns:
+            The number of log entries applied.
+        """
+        with self._sync_lock:
+            self.synced_at = time.monotonic()
+            changes = changes[changes["seq"] > self.last_seq]
+            if changes.empty:
+                return 0
+            seqs = changes["seq"].to_numpy(dtype=np.int64)
+            ids = changes["voter_id"].to_numpy(dtype=np.int64)
+            # The log is in seq order, so the last entry of a voter is their current vote
+            latest = dict(zip(ids.tolist(), changes["voted"].astype(bool).tolist()))
+            for voter_id in skip:
+                latest.pop(voter_id, None)
+            self.apply_voted(latest)
+            self.last_seq = int(seqs[-1])
+            self._history.append((seqs, ids))
+            if len(self._history) > CHANGE_HISTORY_BATCHES:
+                dropped, _ = self._history.popleft()
+                self._history_floor = int(dropped[-1])
+            return len(changes)
+
+    def changed_since(self, seq: int) -> np.ndarray | None:
+        """
+        Returns the voter_ids whose vote changed in log entries after seq, as applied to the roll; None if
+        seq is older than the history the roll keeps.
+        """
+        with self._sync_lock:
+            if seq < self._history_floor:
+                return None
+            changed = [ids[seqs > seq] for seqs, ids in self._history if seqs[-1] > seq]
+        return np.concatenate(changed) if changed else np.empty(0, dtype=np.int64)
+
+    def memory_report(self, *session_objects: object) -> MemoryReport:
+        """
+        Describes the shared footprint and the memory a session holds on its own.
+
+        Args:
+            session_objects: The session's frames and row views (anything with nbytes); None and
+                the shared frame itself are ignored.
+        """
+        session_bytes = 0
+        for obj in session_objects:
+            if isinstance(obj, pd.DataFrame):
+                session_bytes += 0 if obj is self.df else owned_memory(obj)
+            elif obj is not None:
+                session_bytes += obj.nbytes
+        return MemoryReport(
+            rows=len(self.df),
+            plain_bytes=self.plain_bytes,
+            shared_bytes=self.shared_bytes,
+            session_bytes=session_bytes,
+        )
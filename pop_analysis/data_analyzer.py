@@ -1,19 +1,31 @@
 import pandas as pd
 
+try:
+    from . import roll_cache
+    from .filter_engine import ColumnIndex, FilterMask, RowView, build_mask
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import roll_cache
+    from filter_engine import ColumnIndex, FilterMask, RowView, build_mask
 
-def load_data(file_path: str) -> pd.DataFrame | None:
+
+def load_data(file_path: str, use_cache: bool = True) -> pd.DataFrame | None:
     """
     Loads data from an Excel file into a pandas DataFrame.
 
     Args:
         file_path: The path to the Excel file.
+        use_cache: Whether to go through the columnar Parquet cache (see roll_cache.read_roll).
 
     Returns:
         A pandas DataFrame containing the loaded data, or None if an error occurs.
     """
     try:
-        df = pd.read_excel(file_path)
-        print(f"Successfully loaded data from: {file_path}")
+        if use_cache:
+            df, report = roll_cache.read_roll(file_path)
+            print(f"Successfully loaded data from: {report}")
+        else:
+            df = pd.read_excel(file_path)
+            print(f"Successfully loaded data from: {file_path}")
         return df
     except FileNotFoundError:
         print(f"Error: File not found at {file_path}")
@@ -24,12 +36,48 @@ def load_data(file_path: str) -> pd.DataFrame | None:
         return None
 
 
-def filter_by_column(df: pd.DataFrame, column_name: str, values: list[str] | str) -> pd.DataFrame:
+def filter_by_column(
+    df: pd.DataFrame, column_name: str, values: list[str] | str, index: ColumnIndex | None = None
+) -> pd.DataFrame:
     """Filters the DataFrame based on whether a column's value is in the provided list."""
     if not isinstance(values, list):
         values = [values]  # Ensure values is always a list for consistent filtering
-    # Convert DataFrame column to string to handle potential mixed types during comparison
-    return df[df[column_name].astype(str).isin([str(v) for v in values])]
+    return apply_filters(df, [{"column": column_name, "values": values}], index)
+
+
+def filter_mask(df: pd.DataFrame, filters: list[dict], index: ColumnIndex | None = None) -> FilterMask:
+    """
+    Compiles a list of filters into a single boolean row mask.
+
+    Values are compared by their string form (as shown in the filter dropdowns), but the comparison
+    runs on integer column codes, so the column itself is never converted to strings.
+
+    Args:
+        df: The input DataFrame.
+        filters: Filter dicts with 'column' and 'values' keys.
+        index: A ColumnIndex built for df, reused across calls to avoid recomputing column codes.
+
+    Returns:
+        A FilterMask with the row mask, the number of filters applied and any unknown columns.
+    """
+    if index is None or index.df is not df:
+        index = ColumnIndex(df)
+    return build_mask(index, filters)
+
+
+def apply_filters(df: pd.DataFrame, filters: list[dict], index: ColumnIndex | None = None) -> pd.DataFrame:
+    """Returns the rows of df matching every filter in the list (see filter_mask)."""
+    result = filter_mask(df, filters, index)
+    return df[result.mask] if result.applied else df
+
+
+def filter_view(df: pd.DataFrame, filters: list[dict], index: ColumnIndex | None = None) -> tuple[RowView, FilterMask]:
+    """
+    Returns the rows of df matching every filter as a RowView (row positions, not a copy), together
+    with the FilterMask it was built from. With no applicable filter the view selects every row.
+    """
+    result = filter_mask(df, filters, index)
+    return (RowView.from_mask(df, result.mask) if result.applied else RowView(df)), result
 
 
 def summarize_by_column(df: pd.DataFrame, column_name: str | list[str]) -> pd.DataFrame:
@@ -54,7 +102,8 @@ def summarize_by_column(df: pd.DataFrame, column_name: str | list[str]) -> pd.Da
         return pd.DataFrame()  # Return empty DataFrame
 
     # Group by the specified column(s), count occurrences
-    summary_df = df.groupby(columns).size().reset_index(name="count")  # type: ignore
+    # observed=True keeps categorical columns from expanding into every category combination
+    summary_df = df.groupby(columns, observed=True).size().reset_index(name="count")  # type: ignore
 
     # Sort by count descending
     summary_df = summary_df.sort_values(by="count", ascending=False)
@@ -0,0 +1,321 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import instrumentation
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import instrumentation
+
+
+# Integer columns spanning at most this many values per row are coded by offset from their minimum
+INT_RANGE_MAX_RATIO = 4
+
+
+def _smallest_codes(codes: np.ndarray, n_codes: int) -> np.ndarray:
+    """Stores codes (with -1 for missing) in the narrowest signed integer type that holds n_codes."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_codes <= np.iinfo(dtype).max:
+            return codes.astype(dtype, copy=False)
+    return codes.astype(np.int64, copy=False)
+
+
+class ColumnIndex:
+    """
+    Integer codes for the columns of one DataFrame, computed once and reused by every filter.
+
+    Each column is coded by a kernel suited to its dtype: categorical columns reuse their category
+    codes (without copying them until a value changes), booleans are their own 0/1 codes, integer
+    columns of a narrow range are coded by their offset from the minimum, and anything else is
+    factorized. Codes use the narrowest integer type that fits.
+
+    Per column the index also keeps a typed value dictionary (code -> value), a lookup from the
+    string label shown in the filter dropdowns (str(value)) to its codes, so selected values
+    translate to codes without touching the column again, and a per-code value count that orders
+    the dropdown options by frequency. Distinct values sharing a label (1 and "1" in a mixed
+    column) keep their own codes and are all matched by that label.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self._codes: dict[str, np.ndarray] = {}
+        self._values: dict[str, np.ndarray] = {}
+        self._labels: dict[str, dict[str, list[int]]] = {}
+        self._counts: dict[str, np.ndarray] = {}
+        self._options: dict[str, list[str]] = {}
+        self._borrowed: set[str] = set()  # Columns whose codes are the categorical's own array
+        self._ranges: dict[str, tuple[int, int]] = {}  # Integer columns coded by offset: (min, max) at build
+
+    def _encode(self, column: str) -> tuple[np.ndarray, np.ndarray, bool]:
+        # Returns (codes, typed value of each code, whether codes may stand for absent values)
+        series = self.df[column]
+        dtype = series.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            self._borrowed.add(column)
+            # Values stay boxed (Timestamps, not datetime64), so labels read like str() of the cell
+            return series.cat.codes.to_numpy(), series.cat.categories.to_numpy(dtype=object), False
+        if dtype == bool:
+            return series.to_numpy().astype(np.int8), np.array([False, True]), False
+        if isinstance(dtype, np.dtype) and dtype.kind in "iu" and len(series):  # Nullable Int64 is factorized
+            values = series.to_numpy()
+            low, high = int(values.min()), int(values.max())
+            if high - low < INT_RANGE_MAX_RATIO * len(values):
+                self._ranges[column] = (low, high)
+                return values.astype(np.int64) - low, np.arange(low, high + 1, dtype=values.dtype), True
+        codes, uniques = pd.factorize(series, use_na_sentinel=True)
+        return codes, np.asarray(uniques, dtype=object), False
+
+    def _build(self, column: str):
+        codes, values, sparse = self._encode(column)
+        codes = codes if column in self._borrowed else _smallest_codes(codes, len(values))
+        counts = np.bincount(codes[codes >= 0], minlength=len(values))
+        self._codes[column] = codes
+        self._values[column] = values
+        self._counts[column] = counts
+        # An integer range has codes for values no row holds; only the values present on the roll get a label
+        present = np.flatnonzero(counts) if sparse else range(len(values))
+        labels: dict[str, list[int]] = {}
+        for code in present:
+            labels.setdefault(str(values[code]), []).append(int(code))
+        self._labels[column] = labels
+
+    def prepare(self, columns: list[str] | None = None):
+        """Builds the codes of the given columns (default: all) up front, e.g. once when the roll loads."""
+        for column in self.df.columns if columns is None else columns:
+            if column not in self._codes:
+                self._build(column)
+
+    def codes(self, column: str) -> np.ndarray:
+        """Returns the code array of a column; missing values are coded -1."""
+        if column not in self._codes:
+            self._build(column)
+        return self._codes[column]
+
+    def values(self, column: str) -> np.ndarray:
+        """Returns the typed value dictionary of a column: the value each code stands for."""
+        if column not in self._values:
+            self._build(column)
+        return self._values[column]
+
+    def labels(self, column: str) -> dict[str, list[int]]:
+        """Returns the {display label: codes} lookup of a column."""
+        if column not in self._labels:
+            self._build(column)
+        return self._labels[column]
+
+    def counts(self, column: str) -> np.ndarray:
+        """Returns the number of rows holding each code of a column."""
+        if column not in self._counts:
+            self._build(column)
+        return self._counts[column]
+
+    def options(self, column: str) -> list[str]:
+        """
+        Returns the display labels of a column's values, most frequent first.
+
+        This is the order value_counts() gives, without scanning the column on every rerun.
+        """
+        if column not in self._options:
+            counts = self.counts(column)
+            # A label standing for several values counts all their rows, ranked at its first code
+            totals = {label: (-int(counts[codes].sum()), min(codes)) for label, codes in self.labels(column).items()}
+            self._options[column] = [label for label in sorted(totals, key=totals.get) if totals[label][0] < 0]
+        return self._options[column]
+
+    def _wanted(self, column: str, values: list) -> list[int]:
+        # The codes of every value carrying one of the selected labels
+        labels = self.labels(column)
+        return [code for v in values for code in labels.get(str(v), ())]
+
+    def lookup_table(self, column: str, values: list) -> np.ndarray:
+        """
+        Returns a boolean table indexed by code that is True for the selected values.
+
+        The table has one extra trailing False entry so that the missing-value code -1 never matches.
+        """
+        table = np.zeros(len(self.counts(column)) + 1, dtype=bool)
+        table[self._wanted(column, values)] = True
+        return table
+
+    def match(self, column: str, values: list) -> np.ndarray:
+        """Returns the row mask of a column holding any of the given values (display labels or typed values)."""
+        codes = self.codes(column)
+        wanted = self._wanted(column, values)
+        if len(wanted) == 1:
+            return codes == wanted[0]  # One value: a single comparison on the narrow codes
+        # Gathering from a per-code table is a single vectorized pass, whatever the number of values
+        return self.lookup_table(column, values)[codes]
+
+    def update(self, column: str, positions: np.ndarray, values: list):
+        """
+        Records that the rows at the given positions now hold new values, adjusting codes and counts
+        in proportion to the number of changed rows rather than rebuilding the column.
+
+        Args:
+            column: The modified column.
+            positions: Row positions (not index labels) of the modified rows.
+            values: The new values of those rows, in the same order.
+        """
+        if column not in self._codes:
+            return  # Not built yet; the first use will read the current values
+        codes, labels, counts = self._codes[column], self._labels[column], self._counts[column]
+        new_codes = np.empty(len(positions), dtype=np.int64)
+        added = []
+        for i, value in enumerate(values):
+            if pd.isna(value):
+                new_codes[i] = -1
+                continue
+            code = self._code_of(column, value, added)
+            if code is None:
+                code = len(counts) + len(added)  # New codes go after every existing one
+                labels.setdefault(str(value), []).append(code)
+                added.append(value)
+            new_codes[i] = code
+        if added:
+            counts = self._counts[column] = np.concatenate([counts, np.zeros(len(added), counts.dtype)])
+            self._values[column] = np.concatenate([self._values[column], np.array(added, dtype=object)])
+        if column in self._borrowed:
+            codes = self._codes[column] = codes.copy()  # Copy on first write: the categorical's codes are not ours
+            self._borrowed.discard(column)
+        if new_codes.max(initial=-1) > np.iinfo(codes.dtype).max:
+            codes = self._codes[column] = codes.astype(np.int64)
+        old_codes = codes[positions]
+        np.subtract.at(counts, old_codes[old_codes >= 0], 1)
+        np.add.at(counts, new_codes[new_codes >= 0], 1)
+        codes[positions] = new_codes
+        self._options.pop(column, None)
+
+    def _code_of(self, column: str, value: object, added: list) -> int | None:
+        # The existing code of a value, or None if it needs a new one
+        values, n_codes = self._values[column], len(self._counts[column])
+        low, high = self._ranges.get(column, (None, None))
+        if low is not None and isinstance(value, (int, float, np.number)) and not isinstance(value, (bool, np.bool_)):
+            if float(value).is_integer() and low <= int(value) <= high:  # An integer range: code by offset
+                code = int(value) - low
+                label = str(values[code])
+                if code not in self._labels[column].get(label, ()):  # A value no row held when the column was coded
+                    self._labels[column].setdefault(label, []).append(code)
+                return code
+        for code in self._labels[column].get(str(value), ()):
+            known = values[code] if code < n_codes else added[code - n_codes]
+            if type(known) is type(value) or (known == value and not isinstance(known, str)):
+                return code
+        return None
+
+    @property
+    def nbytes(self) -> int:
+        """Returns the memory held by the code and count arrays built so far (borrowed codes excluded)."""
+        owned = [codes for column, codes in self._codes.items() if column not in self._borrowed]
+        return sum(arr.nbytes for arr in [*owned, *self._counts.values()])
+
+    def invalidate(self, column: str | None = None):
+        """Drops cached codes for one column (or all of them) after the data was modified in place."""
+        caches = (self._codes, self._values, self._labels, self._counts, self._options, self._ranges)
+        for cache in caches:
+            if column is None:
+                cache.clear()
+            else:
+                cache.pop(column, None)
+        if column is None:
+            self._borrowed.clear()
+        else:
+            self._borrowed.discard(column)
+
+
+@dataclass
+class FilterMask:
+    """The result of compiling a filter list: a row mask and what went into it."""
+
+    mask: np.ndarray
+    applied: int = 0
+    skipped_columns: list[str] = field(default_factory=list)
+
+
+def build_mask(index: ColumnIndex, filters: list[dict]) -> FilterMask:
+    """
+    Combines a list of filters into one boolean row mask.
+
+    Args:
+        index: The ColumnIndex of the DataFrame being filtered.
+        filters: Filter dicts with 'column' and 'values' keys, as kept in the apps' session state.
+            Filters without values are ignored; filters naming a column the DataFrame lacks are
+            reported in skipped_columns.
+
+    Returns:
+        A FilterMask whose mask selects the rows matching every applied filter.
+    """
+    mask = np.ones(len(index.df), dtype=bool)
+    result = FilterMask(mask=mask)
+    for filt in filters:
+        column, values = filt.get("column"), filt.get("values")
+        if not values:
+            continue
+        if column not in index.df.columns:
+            result.skipped_columns.append(column)
+            continue
+        values = values if isinstance(values, list) else [values]
+        mask &= index.match(column, values)
+        result.applied += 1
+    return result
+
+
+@dataclass
+class RowView:
+    """
+    A selection of rows of one base DataFrame, kept as row positions instead of a copy.
+
+    Narrowing a view (by a filter mask, the vote-status choice or a search) intersects positions;
+    rows are only materialized for what is shown, e.g. one page of the grid.
+    """
+
+    df: pd.DataFrame
+    rows: np.ndarray | None = None  # Row positions into df, in display order; None selects every row
+
+    @classmethod
+    def from_mask(cls, df: pd.DataFrame, mask: np.ndarray) -> "RowView":
+        """Returns the view of the rows where a full-length boolean mask holds."""
+        return cls(df, np.flatnonzero(mask))
+
+    def __len__(self) -> int:
+        return len(self.df) if self.rows is None else len(self.rows)
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def is_full(self) -> bool:
+        return self.rows is None
+
+    @property
+    def positions(self) -> np.ndarray:
+        """Returns the selected row positions (all of them for a full view)."""
+        return np.arange(len(self.df)) if self.rows is None else self.rows
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.rows is None else self.rows.nbytes
+
+    def where(self, mask: np.ndarray) -> "RowView":
+        """Narrows the view to the rows where a full-length boolean mask over df holds."""
+        if self.rows is None:
+            return RowView.from_mask(self.df, mask)
+        return RowView(self.df, self.rows[mask[self.rows]])
+
+    def values(self, column: str) -> np.ndarray:
+        """Returns the values of one column for the selected rows."""
+        values = self.df[column].to_numpy()
+        return values if self.rows is None else values[self.rows]
+
+    def take(self, start: int = 0, stop: int | None = None) -> pd.DataFrame:
+        """Materializes the selected rows in [start, stop), e.g. the visible page."""
+        if self.rows is None:
+            return self.df.iloc[start:stop]
+        rows = self.df.iloc[self.rows[start:stop]]
+        instrumentation.note_copy("RowView.take", rows)
+        return rows
+
+    def frame(self) -> pd.DataFrame:
+        """Materializes every selected row; only needed by computations that scan the rows."""
+        return self.take()
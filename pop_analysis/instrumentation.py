@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+METRICS_FILE = os.environ.get("RERUN_METRICS_FILE", "rerun_metrics.jsonl")
+# Reruns slower than this are flagged in the log and the debug panel
+SLOW_RERUN_SECONDS = float(os.environ.get("SLOW_RERUN_SECONDS", "1.0"))
+
+_active = threading.local()  # The profile of the script run on this thread (Streamlit runs each session in one)
+
+
+class RerunProfile:
+    """
+    Timings and data-movement counters for one Streamlit script run.
+
+    Stages are timed with stage(); SQLite statements, rows read and written, and DataFrame copies are
+    counted by hooks in storage and filter_engine while the profile is active on the running thread.
+    """
+
+    def __init__(self, script: str):
+        self.script = script
+        self.started_at = datetime.now(timezone.utc)
+        self._start = time.perf_counter()
+        self._last_stage_end = self._start
+        self.seconds: float | None = None  # Set by finish()
+        self.stages: list[dict] = []
+        self.queries = 0
+        self.rows_read = 0
+        self.rows_written = 0
+        self.copies: list[dict] = []
+        self.outcome = "completed"
+
+    @contextmanager
+    def stage(self, name: str):
+        """Times the with block as one stage, also when it ends in st.rerun() or st.stop()."""
+        start = time.perf_counter()
+        queries, rows_read, rows_written = self.queries, self.rows_read, self.rows_written
+        try:
+            yield
+        finally:
+            self._last_stage_end = time.perf_counter()
+            self.stages.append(
+                {
+                    "stage": name,
+                    "seconds": self._last_stage_end - start,
+                    "queries": self.queries - queries,
+                    "rows_read": self.rows_read - rows_read,
+                    "rows_written": self.rows_written - rows_written,
+                }
+            )
+
+    @property
+    def slow(self) -> bool:
+        return self.seconds is not None and self.seconds >= SLOW_RERUN_SECONDS
+
+    def to_dict(self) -> dict:
+        return {
+            "script": self.script,
+            "started_at": self.started_at.isoformat(timespec="milliseconds"),
+            "seconds": self.seconds,
+            "outcome": self.outcome,
+            "slow": self.slow,
+            "queries": self.queries,
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "copies": len(self.copies),
+            "copied_bytes": sum(copy["bytes"] for copy in self.copies),
+            "stages": self.stages,
+            "copy_sites": self.copies,
+        }
+
+    def stage_frame(self) -> pd.DataFrame:
+        """Returns the stages as a table for the debug panel."""
+        return pd.DataFrame(self.stages, columns=["stage", "seconds", "queries", "rows_read", "rows_written"])
+
+
+def start(script: str, previous: RerunProfile | None = None, metrics_file: str | None = METRICS_FILE) -> RerunProfile:
+    """
+    Starts profiling a script run on the current thread.
+
+    Args:
+        script: Name of the Streamlit script, recorded with each run.
+        previous: The profile of the session's previous run. If that run never reached finish()
+            (it ended in st.rerun() or st.stop()), it is finished and logged now.
+        metrics_file: Where finished runs are appended as JSON lines; None disables the log.
+    """
+    if previous is not None and previous.seconds is None:
+        # Ended early by st.rerun()/st.stop(): it lasted until its last stage ended, not until this run began
+        previous.outcome = "interrupted"
+        previous.seconds = previous._last_stage_end - previous._start
+        finish(previous, metrics_file)
+    profile = RerunProfile(script)
+    _active.profile = profile
+    return profile
+
+
+def finish(profile: RerunProfile, metrics_file: str | None = METRICS_FILE) -> RerunProfile:
+    """Stops the profile's clock and appends it to the metrics file."""
+    if profile.seconds is None:
+        profile.seconds = time.perf_counter() - profile._start
+    if getattr(_active, "profile", None) is profile:
+        _active.profile = None
+    if metrics_file:
+        try:
+            with open(metrics_file, "a", encoding="utf-8") as f:
+                f.write(json.dumps(profile.to_dict(), ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Could not write rerun metrics to {metrics_file}: {e}")
+    return profile
+
+
+def current() -> RerunProfile | None:
+    """Returns the profile active on this thread, if any."""
+    return getattr(_active, "profile", None)
+
+
+@contextmanager
+def stage(name: str):
+    """Times a stage of the active profile; a no-op when nothing is being profiled."""
+    profile = current()
+    if profile is None:
+        yield
+        return
+    with profile.stage(name):
+        yield
+
+
+def count_query(_statement: str = ""):
+    """SQLite trace callback: counts one executed statement against the active profile."""
+    profile = current()
+    if profile is not None:
+        profile.queries += 1
+
+
+def add_rows(read: int = 0, written: int = 0):
+    """Counts rows moved between SQLite and pandas by the active profile's run."""
+    profile = current()
+    if profile is not None:
+        profile.rows_read += read
+        profile.rows_written += written
+
+
+def note_copy(label: str, df: pd.DataFrame):
+    """Records that rows were materialized into a new DataFrame (a page, a filtered frame...)."""
+    profile = current()
+    if profile is not None:
+        profile.copies.append({"label": label, "rows": len(df), "bytes": int(df.memory_usage(deep=False).sum())})
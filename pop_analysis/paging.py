@@ -0,0 +1,20 @@
+import math
+
+PAGE_SIZES = [50, 100, 250, 500]
+DEFAULT_PAGE_SIZE = 100
+
+
+def page_count(n_rows: int, page_size: int) -> int:
+    """Returns the number of pages needed for n_rows (at least one, so an empty view still has a page)."""
+    return max(1, math.ceil(n_rows / page_size))
+
+
+def clamp_page(page: int, n_rows: int, page_size: int) -> int:
+    """Brings a zero-based page number back into range after the view shrank or grew."""
+    return min(max(page, 0), page_count(n_rows, page_size) - 1)
+
+
+def page_bounds(page: int, n_rows: int, page_size: int) -> tuple[int, int]:
+    """Returns the [start, stop) row positions of a zero-based page."""
+    start = clamp_page(page, n_rows, page_size) * page_size
+    return start, min(start + page_size, n_rows)
@@ -0,0 +1,214 @@
+import hashlib
+import io
+import json
+import os
+import time
+import uuid
+from dataclasses import dataclass
+from typing import IO
+
+import pandas as pd
+
+CACHE_DIR = os.environ.get("ROLL_CACHE_DIR", ".roll_cache")
+# Object columns whose distinct/total ratio is at or below this are stored as categoricals
+CATEGORICAL_MAX_RATIO = 0.5
+
+
+@dataclass
+class LoadReport:
+    """Timing and memory figures for a single roll load."""
+
+    source: str
+    digest: str  # SHA-256 of the workbook bytes; identifies the dataset version
+    cache_hit: bool
+    seconds: float
+    rows: int
+    memory_bytes: int
+    excel_seconds: float | None = None  # Time the raw Excel parse took when the cache entry was built
+    excel_memory_bytes: int | None = None  # Memory of the frame as read_excel returned it
+
+    @property
+    def speedup(self) -> float | None:
+        if not self.excel_seconds or not self.seconds:
+            return None
+        return self.excel_seconds / self.seconds
+
+    def __str__(self) -> str:
+        origin = "cache" if self.cache_hit else "excel"
+        text = f"{self.source}: {self.rows} rows from {origin} in {self.seconds:.3f}s"
+        text += f", {self.memory_bytes / 2**20:.1f} MiB"
+        if self.excel_seconds is not None and self.excel_memory_bytes is not None:
+            text += f" (excel: {self.excel_seconds:.3f}s, {self.excel_memory_bytes / 2**20:.1f} MiB"
+            if self.cache_hit and self.speedup:
+                text += f", {self.speedup:.0f}x faster"
+            text += ")"
+        return text
+
+
+def frame_memory(df: pd.DataFrame) -> int:
+    """Returns the deep memory usage of a DataFrame in bytes."""
+    return int(df.memory_usage(deep=True).sum())
+
+
+def content_hash(data: bytes) -> str:
+    """Returns the hex SHA-256 digest used to key cache entries."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def to_categoricals(df: pd.DataFrame, max_ratio: float = CATEGORICAL_MAX_RATIO) -> pd.DataFrame:
+    """
+    Converts low-cardinality string columns to the pandas 'category' dtype.
+
+    Args:
+        df: The input DataFrame.
+        max_ratio: Largest distinct/total ratio for a column to be converted.
+
+    Returns:
+        A DataFrame where repetitive object columns (family, religion, gender...) are categoricals.
+    """
+    if df.empty:
+        return df
+    converted = {}
+    for col in df.columns:
+        if df[col].dtype == object and df[col].nunique(dropna=True) / len(df) <= max_ratio:
+            converted[col] = df[col].astype("category")
+    return df.assign(**converted) if converted else df
+
+
+def _read_source(source: str | bytes | IO[bytes]) -> tuple[bytes, str]:
+    """Returns the raw bytes of a workbook and a printable name for it."""
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as f:
+            return f.read(), str(source)
+    if isinstance(source, bytes):
+        return source, "<bytes>"
+    # Streamlit's UploadedFile exposes getvalue(); plain file objects only read()
+    data = source.getvalue() if hasattr(source, "getvalue") else source.read()
+    return data, getattr(source, "name", "<upload>")
+
+
+def cache_paths(digest: str, cache_dir: str = CACHE_DIR) -> tuple[str, str]:
+    """Returns the Parquet file and the metadata file of a workbook's cache entry."""
+    return os.path.join(cache_dir, f"{digest}.parquet"), os.path.join(cache_dir, f"{digest}.json")
+
+
+def read_roll(source: str | bytes | IO[bytes], cache_dir: str = CACHE_DIR) -> tuple[pd.DataFrame, LoadReport]:
+    """
+    Loads a voter roll workbook, going through the columnar cache.
+
+    The first load of a given workbook parses it with read_excel, converts repetitive columns to
+    categoricals and writes the result to '<cache_dir>/<sha256>.parquet'. Later loads of the same
+    content read the Parquet file instead.
+
+    Args:
+        source: A path to an .xlsx file, its raw bytes, or an uploaded file object.
+        cache_dir: Directory holding the Parquet files.
+
+    Returns:
+        The loaded DataFrame and a LoadReport describing the load.
+    """
+    start = time.perf_counter()
+    data, name = _read_source(source)
+    return _load(data, name, cache_dir, start)
+
+
+def _load(data: bytes, name: str, cache_dir: str, start: float) -> tuple[pd.DataFrame, LoadReport]:
+    digest = content_hash(data)
+    parquet_path, meta_path = cache_paths(digest, cache_dir)
+
+    if os.path.exists(parquet_path):
+        try:
+            df = pd.read_parquet(parquet_path)
+            meta = {}
+            if os.path.exists(meta_path):
+                with open(meta_path, encoding="utf-8") as f:
+                    meta = json.load(f)
+            report = LoadReport(
+                source=name,
+                digest=digest,
+                cache_hit=True,
+                seconds=time.perf_counter() - start,
+                rows=len(df),
+                memory_bytes=frame_memory(df),
+                excel_seconds=meta.get("excel_seconds"),
+                excel_memory_bytes=meta.get("excel_memory_bytes"),
+            )
+            return df, report
+        except Exception as e:
+            # A truncated or unreadable cache entry is rebuilt from the workbook below
+            print(f"Ignoring unreadable cache entry {parquet_path}: {e}")
+
+    df = pd.read_excel(io.BytesIO(data))
+    excel_seconds = time.perf_counter() - start
+    excel_memory = frame_memory(df)
+    df = to_categoricals(df)
+
+    # Every writer gets its own temp files (sessions and worker processes may load the same workbook at
+    # once), and os.replace swaps them in whole, so concurrent loaders never see a half-written entry
+    suffix = f"{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    tmp_parquet, tmp_meta = f"{parquet_path}.{suffix}", f"{meta_path}.{suffix}"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump({"source": name, "excel_seconds": excel_seconds, "excel_memory_bytes": excel_memory}, f)
+        os.replace(tmp_meta, meta_path)
+        df.to_parquet(tmp_parquet, index=False)
+        os.replace(tmp_parquet, parquet_path)
+    except Exception as e:
+        # No Parquet engine or a column Arrow cannot encode: serve the frame uncached
+        print(f"Could not write roll cache for {name}: {e}")
+        for path in (tmp_parquet, tmp_meta):
+            if os.path.exists(path):
+                os.remove(path)
+
+    report = LoadReport(
+        source=name,
+        digest=digest,
+        cache_hit=False,
+        seconds=time.perf_counter() - start,
+        rows=len(df),
+        memory_bytes=frame_memory(df),
+        excel_seconds=excel_seconds,
+        excel_memory_bytes=excel_memory,
+    )
+    return df, report
+
+
+def ensure_cached(source: str | bytes | IO[bytes], cache_dir: str = CACHE_DIR) -> tuple[str, LoadReport]:
+    """
+    Makes sure a workbook has a cache entry and returns the entry's Parquet path, for engines that
+    query the file in place (see roll_duckdb).
+
+    On a cache hit nothing is read into pandas: the row count comes from the Parquet footer and the
+    report's memory_bytes is 0.
+
+    Raises:
+        RuntimeError: The cache entry could not be written.
+    """
+    start = time.perf_counter()
+    data, name = _read_source(source)
+    digest = content_hash(data)
+    parquet_path, meta_path = cache_paths(digest, cache_dir)
+    if not os.path.exists(parquet_path):
+        _, report = _load(data, name, cache_dir, start)
+        if not os.path.exists(parquet_path):
+            raise RuntimeError(f"No Parquet cache entry could be written for {name}")
+        return parquet_path, report
+
+    import pyarrow.parquet as pq  # The Parquet engine pandas already writes the cache with
+
+    meta = {}
+    if os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            meta = json.load(f)
+    report = LoadReport(
+        source=name,
+        digest=digest,
+        cache_hit=True,
+        seconds=time.perf_counter() - start,
+        rows=pq.read_metadata(parquet_path).num_rows,
+        memory_bytes=0,
+        excel_seconds=meta.get("excel_seconds"),
+        excel_memory_bytes=meta.get("excel_memory_bytes"),
+    )
+    return parquet_path, report
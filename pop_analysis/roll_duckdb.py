@@ -0,0 +1,188 @@
+from dataclasses import dataclass, field
+from typing import IO
+
+import pandas as pd
+
+try:
+    import duckdb
+except ImportError:  # Optional: without it the analyzer keeps to its pandas engine
+    duckdb = None
+
+try:
+    from . import roll_cache
+    from .voter_query import SqlFilter
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import roll_cache
+    from voter_query import SqlFilter
+
+VIEW_NAME = "roll"
+
+
+def available() -> bool:
+    """Tells whether the DuckDB engine can be used (the duckdb package is installed)."""
+    return duckdb is not None
+
+
+def _quote(column: str) -> str:
+    return '"' + column.replace('"', '""') + '"'
+
+
+class DuckDBRoll:
+    """
+    A roll queried in place by DuckDB from its Parquet cache entry, instead of loaded into pandas.
+
+    Filters and group-by summaries run as vectorized queries over all cores; only the visible page
+    and the summaries come back as DataFrames. Every query runs on its own cursor, so the reruns of
+    several sessions can share one roll.
+    """
+
+    def __init__(self, parquet_path: str, threads: int | None = None):
+        if duckdb is None:
+            raise ImportError("The DuckDB engine needs the 'duckdb' package (pip install duckdb).")
+        self.parquet_path = parquet_path
+        self._conn = duckdb.connect(":memory:")
+        if threads:
+            self._conn.execute(f"SET threads = {int(threads)}")
+        path = parquet_path.replace("'", "''")
+        self._conn.execute(f"CREATE VIEW {VIEW_NAME} AS SELECT * FROM read_parquet('{path}')")
+        self.schema = self.query(f"SELECT * FROM {VIEW_NAME} LIMIT 0")  # The columns, without rows
+        self.columns = self.schema.columns.tolist()
+        self._labels: dict[str, dict[str, object]] = {}
+        self._options: dict[str, list[str]] = {}
+
+    def execute(self, sql: str, params: list | tuple = ()):
+        """Runs a statement on a fresh cursor and returns the cursor to fetch from."""
+        return self._conn.cursor().execute(sql, list(params))
+
+    def query(self, sql: str, params: list | tuple = ()) -> pd.DataFrame:
+        """Runs a query and returns its result as a DataFrame."""
+        return self.execute(sql, params).df()
+
+    def _build(self, column: str):
+        counts = self.execute(
+            f"SELECT {_quote(column)}, COUNT(*) AS n FROM {VIEW_NAME} WHERE {_quote(column)} IS NOT NULL "
+            f"GROUP BY ALL ORDER BY n DESC, {_quote(column)}"  # Ties in value order, as categoricals have it
+        ).fetchall()
+        self._options[column] = [str(value) for value, _ in counts]
+        self._labels[column] = {str(value): value for value, _ in counts}
+
+    def options(self, column: str) -> list[str]:
+        """Returns the display labels (str(value)) of a column's values, most frequent first."""
+        if column not in self._options:
+            self._build(column)
+        return self._options[column]
+
+    def compile_filters(self, filters: list[dict]) -> SqlFilter:
+        """
+        Translates a list of filters into DuckDB conditions.
+
+        Selected labels are mapped back to the column's typed values, like ColumnIndex does with its
+        codes, so the comparison is on the column's own type and Parquet statistics can skip row groups.
+        """
+        result = SqlFilter()
+        for filt in filters:
+            column, values = filt.get("column"), filt.get("values")
+            if not values:
+                continue
+            if column not in self.columns:
+                result.skipped_columns.append(column)
+                continue
+            values = values if isinstance(values, list) else [values]
+            if column not in self._labels:
+                self._build(column)
+            wanted = [self._labels[column][str(v)] for v in values if str(v) in self._labels[column]]
+            if wanted:
+                result.conditions.append(f'{_quote(column)} IN ({", ".join("?" * len(wanted))})')
+                result.params.extend(wanted)
+            else:
+                result.conditions.append("FALSE")  # None of the selected values occurs
+            result.applied += 1
+        return result
+
+    def filter_view(self, filters: list[dict]) -> tuple["DuckDBView", SqlFilter]:
+        """The DuckDB counterpart of data_analyzer.filter_view: the rows matching every filter, as a query."""
+        result = self.compile_filters(filters)
+        return DuckDBView(self, tuple(result.conditions), tuple(result.params)), result
+
+
+@dataclass
+class DuckDBView:
+    """
+    A selection of rows of a DuckDBRoll, kept as a WHERE condition.
+
+    Offers what the analyzer uses of a RowView (len, take, frame) plus summarize(), which groups
+    inside DuckDB instead of materializing the rows.
+    """
+
+    roll: DuckDBRoll
+    conditions: tuple[str, ...] = ()
+    params: tuple = ()
+    _rows: int | None = field(default=None, repr=False, compare=False)
+
+    @property
+    def _where(self) -> str:
+        return " WHERE " + " AND ".join(self.conditions) if self.conditions else ""
+
+    def __len__(self) -> int:
+        if self._rows is None:  # The Parquet file never changes under a roll, so the count is kept
+            self._rows = self.roll.execute(f"SELECT COUNT(*) FROM {VIEW_NAME}{self._where}", self.params).fetchone()[0]
+        return self._rows
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def is_full(self) -> bool:
+        return not self.conditions
+
+    @property
+    def nbytes(self) -> int:
+        return 0
+
+    def take(self, start: int = 0, stop: int | None = None) -> pd.DataFrame:
+        """Reads the selected rows in [start, stop), in file order, e.g. the visible page."""
+        limit = "" if stop is None else f" LIMIT {max(int(stop) - int(start), 0)}"
+        return self.roll.query(f"SELECT * FROM {VIEW_NAME}{self._where}{limit} OFFSET {int(start)}", self.params)
+
+    def frame(self) -> pd.DataFrame:
+        """Materializes every selected row."""
+        return self.take()
+
+    def summarize(self, column_name: str | list[str]) -> pd.DataFrame:
+        """
+        Groups the selected rows by one or more columns and counts them, like
+        data_analyzer.summarize_by_column: a 'count' column, largest first, rows with a missing
+        group value left out. Returns an empty frame if a column is unknown.
+        """
+        columns = [column_name] if isinstance(column_name, str) else list(column_name)
+        if not columns or any(col not in self.roll.columns for col in columns):
+            return pd.DataFrame()
+        selected = ", ".join(_quote(col) for col in columns)
+        conditions = [*self.conditions, *(f"{_quote(col)} IS NOT NULL" for col in columns)]
+        return self.roll.query(
+            f"SELECT {selected}, COUNT(*) AS count FROM {VIEW_NAME} WHERE {' AND '.join(conditions)} "
+            f"GROUP BY {selected} ORDER BY count DESC",
+            self.params,
+        )
+
+
+def open_roll(
+    source: str | bytes | IO[bytes], cache_dir: str = roll_cache.CACHE_DIR, threads: int | None = None
+) -> tuple[DuckDBRoll, roll_cache.LoadReport]:
+    """
+    Opens a roll workbook for the DuckDB engine through the columnar cache.
+
+    A workbook seen before is not read into pandas at all; a new one is parsed once to write its
+    cache entry (see roll_cache.read_roll).
+
+    Args:
+        source: A path to an .xlsx file, its raw bytes, or an uploaded file object.
+        cache_dir: Directory holding the Parquet files.
+        threads: DuckDB worker threads (default: one per core).
+
+    Returns:
+        The DuckDBRoll and a LoadReport describing the load.
+    """
+    parquet_path, report = roll_cache.ensure_cached(source, cache_dir)
+    return DuckDBRoll(parquet_path, threads), report
@@ -0,0 +1,270 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import IO
+
+import pandas as pd
+
+try:
+    from . import roll_cache
+    from .voter_ids import VILLAGE_COLUMN, stable_ids
+    from .voter_search import normalize_arabic
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import roll_cache
+    from voter_ids import VILLAGE_COLUMN, stable_ids
+    from voter_search import normalize_arabic
+
+STORE_DIR = os.environ.get("ROLL_STORE_DIR", "roll_store")
+MANIFEST_FILE = "manifest.json"
+# The columns every partition of the store has, in this order
+ROLL_COLUMNS = [
+    "الاسم",
+    "الشهرة",
+    "اسم الاب",
+    "إسم الام وشهرتها",
+    "تاريخ الولادة",
+    "مذهب الشخصي",
+    "الجنس",
+    "رقم السجل",
+    "مذهب السجل",
+]
+# Location columns: constant within a village's workbook, so they are dropped once the village key is taken
+LOCATION_COLUMNS = ["البلدة أو الحي", "القضاء", "المحافظة", "الدائرة الانتخابية"]
+# Headers are matched after folding spelling variants, so "اسم الام وشهرتها" finds "إسم الام وشهرتها"
+_CANONICAL_HEADERS = {normalize_arabic(col): col for col in [*ROLL_COLUMNS, *LOCATION_COLUMNS]}
+
+
+@dataclass
+class FileReport:
+    """What one workbook contributed to the store."""
+
+    path: str
+    village: str
+    rows: int
+    digest: str
+    seconds: float
+    missing_columns: list[str] = field(default_factory=list)
+    dropped_columns: list[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        text = f"{os.path.basename(self.path)}: {self.rows} rows for '{self.village}' in {self.seconds:.2f}s"
+        if self.missing_columns:
+            text += f", missing {self.missing_columns}"
+        if self.dropped_columns:
+            text += f", dropped {self.dropped_columns}"
+        return text
+
+
+@dataclass
+class IngestReport:
+    """What an ingestion run read and wrote."""
+
+    files: list[FileReport]
+    villages: dict[str, int]  # Village key -> rows in its partition
+    seconds: float
+
+    @property
+    def rows(self) -> int:
+        return sum(self.villages.values())
+
+    def __str__(self) -> str:
+        return f"{len(self.files)} workbooks, {len(self.villages)} villages, {self.rows} voters in {self.seconds:.2f}s"
+
+
+def discover(directory: str) -> list[str]:
+    """Returns the roll workbooks of a directory, skipping Excel's '~$' lock files."""
+    return sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.lower().endswith(".xlsx") and not name.startswith("~$")
+    )
+
+
+def normalize_schema(df: pd.DataFrame) -> tuple[pd.DataFrame, list[str], list[str]]:
+    """
+    Renames a workbook's headers to the canonical ones and aligns it on ROLL_COLUMNS.
+
+    Columns a workbook lacks are added empty; columns the roll does not know are dropped. Location
+    columns are kept so the village key can be read from them.
+
+    Returns:
+        The aligned frame, the canonical columns that were missing and the headers that were dropped.
+    """
+    renames, dropped = {}, []
+    for col in df.columns:
+        canonical = _CANONICAL_HEADERS.get(normalize_arabic(col))
+        if canonical is None:
+            dropped.append(str(col))
+        elif canonical != col:
+            renames[col] = canonical
+    df = df.rename(columns=renames)
+    missing = [col for col in ROLL_COLUMNS if col not in df.columns]
+    df = df.reindex(columns=[*ROLL_COLUMNS, *(col for col in LOCATION_COLUMNS if col in df.columns)])
+    registry = pd.to_numeric(df["رقم السجل"], errors="coerce")
+    # Blank registry cells must not turn the whole column into floats
+    df["رقم السجل"] = registry.astype("int64") if registry.notna().all() else registry.astype("Int64")
+    return df, missing, dropped
+
+
+def village_key(df: pd.DataFrame, path: str) -> str:
+    """The village a workbook covers: its single 'البلدة أو الحي' value, or else the file name."""
+    if "البلدة أو الحي" in df.columns:
+        values = df["البلدة أو الحي"].dropna().astype(str).str.strip().unique()
+        if len(values) == 1 and values[0]:
+            return values[0]
+    return os.path.splitext(os.path.basename(path))[0].strip()
+
+
+def load_workbook(
+    source: str | bytes | IO[bytes], cache_dir: str = roll_cache.CACHE_DIR
+) -> tuple[pd.DataFrame, FileReport]:
+    """
+    Reads one roll workbook with canonical columns and takes its village key.
+
+    Args:
+        source: A path to an .xlsx file or an uploaded file object.
+        cache_dir: The roll_cache directory.
+
+    Returns:
+        The roll without its location columns, and a FileReport naming its village.
+    """
+    start = time.perf_counter()
+    df, load_report = roll_cache.read_roll(source, cache_dir=cache_dir)
+    df, missing, dropped = normalize_schema(df)
+    village = village_key(df, load_report.source)
+    df = df.drop(columns=LOCATION_COLUMNS, errors="ignore")
+    seconds = time.perf_counter() - start
+    return df, FileReport(load_report.source, village, len(df), load_report.digest, seconds, missing, dropped)
+
+
+def _parse_workbook(job: tuple) -> tuple[pd.DataFrame, FileReport]:
+    # Runs in a worker process: read one workbook (through the Parquet cache) and normalize it
+    path, cache_dir = job
+    return load_workbook(path, cache_dir)
+
+
+def partition_path(store_dir: str, village: str) -> str:
+    """The Parquet file holding one village: '<store_dir>/village=<key>/part-0.parquet' (Hive layout)."""
+    return os.path.join(store_dir, f"{VILLAGE_COLUMN}={village}", "part-0.parquet")
+
+
+def write_partition(store_dir: str, village: str, df: pd.DataFrame):
+    """Replaces one village's partition; the file is swapped in whole so readers never see half of it."""
+    path = partition_path(store_dir, village)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(store_dir: str = STORE_DIR) -> dict:
+    """Returns the store's {'villages': {key: {'rows', 'sources'}}} record, empty if there is none."""
+    path = os.path.join(store_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {"villages": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def ingest_directory(
+    directory: str, store_dir: str = STORE_DIR, workers: int | None = None, cache_dir: str = roll_cache.CACHE_DIR
+) -> IngestReport:
+    """
+    Parses every roll workbook of a directory in parallel and appends them into the partitioned store.
+
+    Each village gets one partition (several workbooks of the same village are combined into it);
+    re-ingesting a village replaces its partition and leaves the others alone. voter_ids are derived
+    from each voter's village and identity columns, so they are the same on every ingestion.
+
+    Args:
+        directory: Directory of .xlsx roll workbooks, one or more per village.
+        store_dir: Root of the partitioned Parquet store.
+        workers: Size of the process pool parsing workbooks (default: one per CPU).
+        cache_dir: The roll_cache directory; workbooks seen before are read from their Parquet copy.
+
+    Returns:
+        An IngestReport with one FileReport per workbook.
+    """
+    start = time.perf_counter()
+    paths = discover(directory)
+    if not paths:
+        raise FileNotFoundError(f"No .xlsx roll workbooks found in {directory}")
+
+    jobs = [(path, cache_dir) for path in paths]
+    if workers == 1 or len(jobs) == 1:
+        parsed = [_parse_workbook(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parsed = list(executor.map(_parse_workbook, jobs))
+
+    by_village: dict[str, list[tuple[pd.DataFrame, FileReport]]] = {}
+    for df, file_report in parsed:
+        by_village.setdefault(file_report.village, []).append((df, file_report))
+
+    manifest = read_manifest(store_dir)
+    villages = {}
+    for village, parts in by_village.items():
+        # Categories differ between workbooks, so they are combined as plain values and re-derived
+        frames = [df.astype({col: object for col in df.select_dtypes("category").columns}) for df, _ in parts]
+        df = roll_cache.to_categoricals(pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0])
+        df.insert(0, "voter_id", stable_ids(df, namespace=village))
+        write_partition(store_dir, village, df)
+        villages[village] = len(df)
+        manifest["villages"][village] = {
+            "rows": len(df),
+            "sources": [{"file": os.path.basename(report.path), "digest": report.digest} for _, report in parts],
+        }
+
+    manifest_path = os.path.join(store_dir, MANIFEST_FILE)
+    with open(f"{manifest_path}.tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(f"{manifest_path}.tmp", manifest_path)
+    return IngestReport([report for _, report in parsed], villages, time.perf_counter() - start)
+
+
+def read_store(store_dir: str = STORE_DIR, villages: list[str] | None = None) -> pd.DataFrame:
+    """
+    Reads the partitioned store into one roll with a 'village' column.
+
+    Args:
+        store_dir: Root of the store written by ingest_directory().
+        villages: Only read these village keys (default: all).
+
+    Returns:
+        The roll, voter_id first, with repetitive columns as categoricals.
+    """
+    keys = villages if villages is not None else list(read_manifest(store_dir)["villages"])
+    frames = []
+    for village in keys:
+        path = partition_path(store_dir, village)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Village '{village}' is not in the store {store_dir}")
+        df = pd.read_parquet(path)
+        df = df.astype({col: object for col in df.select_dtypes("category").columns})
+        df.insert(1, VILLAGE_COLUMN, village)
+        frames.append(df)
+    if not frames:
+        return pd.DataFrame(columns=["voter_id", VILLAGE_COLUMN, *ROLL_COLUMNS])
+    return roll_cache.to_categoricals(pd.concat(frames, ignore_index=True))
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest a directory of roll workbooks into the partitioned store.")
+    parser.add_argument("directory", help="Directory of .xlsx roll workbooks.")
+    parser.add_argument("--store", default=STORE_DIR, help="Root of the partitioned Parquet store.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: one per CPU).")
+    args = parser.parse_args(argv)
+
+    report = ingest_directory(args.directory, args.store, args.workers)
+    for file_report in report.files:
+        print(file_report)
+    print(f"Ingested {report} into {args.store}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
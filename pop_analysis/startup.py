@@ -0,0 +1,74 @@
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class BackgroundBuild:
+    """
+    Runs a startup step once on a background thread and records its outcome and per-phase timings.
+
+    Meant to be held in st.cache_resource, so one server process builds its dataset once while every
+    session that arrives in the meantime watches the same build instead of starting its own.
+    """
+
+    def __init__(self, name: str, target: Callable[["BackgroundBuild"], object]):
+        self.name = name
+        self.state = RUNNING
+        self.result: object = None
+        self.error: str | None = None
+        self.phases: dict[str, float] = {}
+        self.current_phase: str | None = None
+        self._start = time.perf_counter()
+        self.seconds: float | None = None  # Set when the build ends
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(target,), name=f"startup:{name}", daemon=True)
+        self._thread.start()
+
+    @contextmanager
+    def phase(self, name: str):
+        """Times one phase of the build; the current phase is shown to waiting sessions."""
+        self.current_phase = name
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    @property
+    def running(self) -> bool:
+        return self.state == RUNNING
+
+    @property
+    def elapsed(self) -> float:
+        return self.seconds if self.seconds is not None else time.perf_counter() - self._start
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Blocks until the build has ended; False if it is still running after timeout seconds."""
+        return self._done.wait(timeout)
+
+    def _run(self, target: Callable[["BackgroundBuild"], object]):
+        try:
+            self.result = target(self)
+            self.state = DONE
+        except Exception as e:
+            self.error = str(e)
+            self.state = FAILED
+        finally:
+            self.seconds = time.perf_counter() - self._start
+            self.current_phase = None
+            self._done.set()
+            print(self)
+
+    def __str__(self) -> str:
+        phases = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.phases.items())
+        text = f"{self.name}: {self.state} after {self.elapsed:.2f}s"
+        if phases:
+            text += f" ({phases})"
+        if self.error:
+            text += f": {self.error}"
+        return text
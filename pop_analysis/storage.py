@@ -0,0 +1,756 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import IO
+
+import pandas as pd
+
+try:
+    from . import instrumentation
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import instrumentation
+
+TABLE_NAME = "voters"
+ID_COLUMN = "voter_id"
+ID_INDEX_NAME = "idx_voters_voter_id"
+STAGING_TABLE_NAME = "voters_import"
+REQUIRED_COLUMNS = [ID_COLUMN, "voted"]
+IMPORT_CHUNK_ROWS = 50_000
+TURNOUT_TABLE_NAME = "turnout"
+# Turnout is kept per group of these voter columns: family name, registry number, gender, religion
+TURNOUT_DIMENSIONS = {"family": "الشهرة", "registry": "رقم السجل", "gender": "الجنس", "religion": "مذهب الشخصي"}
+CHANGES_TABLE_NAME = "vote_changes"
+META_TABLE_NAME = "app_meta"
+# Spellings of the voted flag accepted on import, compared after strip() and lower()
+VOTED_VALUES = {"true": True, "1": True, "1.0": True, "false": False, "0": False, "0.0": False, "": False}
+
+POOL_SIZE = 8
+BUSY_TIMEOUT_MS = 10_000
+STATEMENT_CACHE_SIZE = 256
+
+# Statements are kept as module constants so each pooled connection's statement cache
+# compiles them once and reuses the prepared form on every call.
+CREATE_ID_INDEX_SQL = f'CREATE UNIQUE INDEX IF NOT EXISTS {ID_INDEX_NAME} ON {TABLE_NAME} ("{ID_COLUMN}")'
+SELECT_ALL_SQL = f"SELECT * FROM {TABLE_NAME}"
+UPDATE_VOTED_SQL = f'UPDATE {TABLE_NAME} SET voted = ? WHERE "{ID_COLUMN}" = ?'
+
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections to one database file, shared by every session of the process.
+
+    Connections run in WAL mode so readers never block the writer and vice versa, and wait on a busy
+    timeout instead of failing with "database is locked" when another writer holds the lock. Writes go
+    through transaction(), which takes the write lock up front (BEGIN IMMEDIATE) so concurrent writers
+    queue on the busy timeout rather than deadlocking on a lock upgrade.
+    """
+
+    def __init__(self, db_file: str, size: int = POOL_SIZE, busy_timeout_ms: int = BUSY_TIMEOUT_MS):
+        self.db_file = db_file
+        self.size = size
+        self.busy_timeout_ms = busy_timeout_ms
+        self._idle: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._all: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=self.busy_timeout_ms / 1000,
+            isolation_level=None,  # Autocommit; transactions are opened explicitly
+            check_same_thread=False,  # Streamlit serves each session from its own thread
+            cached_statements=STATEMENT_CACHE_SIZE,
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # Durable across app crashes; WAL makes this safe
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.set_trace_callback(instrumentation.count_query)  # Counts statements of profiled reruns
+        with self._lock:
+            self._all.append(conn)
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Borrows a connection from the pool for the duration of the with block."""
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+            changes_before = conn.total_changes
+            try:
+                yield conn
+            finally:
+                if conn.in_transaction:
+                    conn.rollback()
+                instrumentation.add_rows(written=conn.total_changes - changes_before)
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """Borrows a connection and runs the with block in one write transaction."""
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            conn.commit()
+
+    def close(self):
+        """Closes every connection the pool has opened."""
+        with self._lock:
+            for conn in self._all:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+            self._all.clear()
+        while not self._idle.empty():
+            self._idle.get_nowait()
+
+
+_pools: dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file: str) -> ConnectionPool:
+    """Returns the process-wide pool for a database file, creating it on first use."""
+    key = os.path.abspath(db_file)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = ConnectionPool(db_file)
+        return pool
+
+
+def close_pool(db_file: str):
+    """Closes and forgets the pool for a database file, if there is one."""
+    with _pools_lock:
+        pool = _pools.pop(os.path.abspath(db_file), None)
+    if pool is not None:
+        pool.close()
+
+
+def remove_database(db_file: str):
+    """Closes pooled connections and deletes the database together with its WAL side files."""
+    close_pool(db_file)
+    for path in (db_file, f"{db_file}-wal", f"{db_file}-shm"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def ensure_id_index(conn: sqlite3.Connection):
+    """Creates the unique index on voter_id used by vote updates, if it is missing."""
+    conn.execute(CREATE_ID_INDEX_SQL)
+
+
+def _turnout_group_match(row: str) -> str:
+    """SQL condition selecting the turnout group of the NEW or OLD voter row inside a trigger."""
+    return " AND ".join(f'{key} IS {row}."{col}"' for key, col in TURNOUT_DIMENSIONS.items())
+
+
+def ensure_turnout(conn: sqlite3.Connection, rebuild: bool = False):
+    """
+    Creates the turnout table, one row per (family, registry, gender, religion) group with its total
+    and voted counts, together with the triggers that keep it current.
+
+    The triggers run inside the transaction of every write to the voters table, so a vote flip adjusts
+    its group's counter in the same commit and readers never see the two disagree. Databases whose
+    voters table lacks one of the dimension columns (e.g. a partial CSV import) get no turnout table.
+
+    Args:
+        conn: A connection to the votes database.
+        rebuild: Recompute the table from the voters rows even if it exists (after the table was replaced).
+    """
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE_NAME})")}
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (TURNOUT_TABLE_NAME,)).fetchone()
+    if exists and not rebuild:
+        return
+    conn.execute(f"DROP TABLE IF EXISTS {TURNOUT_TABLE_NAME}")
+    if not all(col in present for col in [*TURNOUT_DIMENSIONS.values(), "voted"]):
+        return
+
+    keys = ", ".join(TURNOUT_DIMENSIONS)
+    source = ", ".join(f'"{col}"' for col in TURNOUT_DIMENSIONS.values())
+    conn.execute(f"CREATE TABLE {TURNOUT_TABLE_NAME} ({keys}, total INTEGER NOT NULL, voted INTEGER NOT NULL)")
+    conn.execute(f"CREATE INDEX idx_{TURNOUT_TABLE_NAME}_group ON {TURNOUT_TABLE_NAME} ({keys})")
+    conn.execute(
+        f"INSERT INTO {TURNOUT_TABLE_NAME} ({keys}, total, voted) "
+        f"SELECT {source}, COUNT(*), COALESCE(SUM(voted != 0), 0) FROM {TABLE_NAME} GROUP BY {source}"
+    )
+
+    def add_row(row: str) -> str:
+        # Creates the group if this voter is its first member, then counts the voter in
+        values = ", ".join(f'{row}."{col}"' for col in TURNOUT_DIMENSIONS.values())
+        return (
+            f"INSERT INTO {TURNOUT_TABLE_NAME} ({keys}, total, voted) SELECT {values}, 0, 0 "
+            f"WHERE NOT EXISTS (SELECT 1 FROM {TURNOUT_TABLE_NAME} WHERE {_turnout_group_match(row)}); "
+            f"UPDATE {TURNOUT_TABLE_NAME} SET total = total + 1, voted = voted + ({row}.voted != 0) "
+            f"WHERE {_turnout_group_match(row)};"
+        )
+
+    def remove_row(row: str) -> str:
+        return (
+            f"UPDATE {TURNOUT_TABLE_NAME} SET total = total - 1, voted = voted - ({row}.voted != 0) "
+            f"WHERE {_turnout_group_match(row)};"
+        )
+
+    watched = ", ".join(f'"{col}"' for col in [*TURNOUT_DIMENSIONS.values(), "voted"])
+    conn.execute(f"DROP TRIGGER IF EXISTS {TABLE_NAME}_turnout_insert")
+    conn.execute(f"DROP TRIGGER IF EXISTS {TABLE_NAME}_turnout_update")
+    conn.execute(f"DROP TRIGGER IF EXISTS {TABLE_NAME}_turnout_delete")
+    conn.execute(f"CREATE TRIGGER {TABLE_NAME}_turnout_insert AFTER INSERT ON {TABLE_NAME} BEGIN {add_row('NEW')} END")
+    conn.execute(
+        f"CREATE TRIGGER {TABLE_NAME}_turnout_update AFTER UPDATE OF {watched} ON {TABLE_NAME} "
+        f"BEGIN {remove_row('OLD')} {add_row('NEW')} END"
+    )
+    conn.execute(
+        f"CREATE TRIGGER {TABLE_NAME}_turnout_delete AFTER DELETE ON {TABLE_NAME} BEGIN {remove_row('OLD')} END"
+    )
+
+
+def ensure_change_log(conn: sqlite3.Connection, rebuild: bool = False):
+    """
+    Creates the vote_changes log and the trigger that appends to it.
+
+    Every flip of a voter's voted flag appends a row with a monotonically increasing seq, the new
+    value and the voter's turnout group, in the same transaction as the flip. Readers such as the
+    turnout dashboard remember the last seq they saw and fetch only newer rows.
+
+    Args:
+        conn: A connection to the votes database.
+        rebuild: Empty the log (after the voters table was replaced, old entries no longer apply).
+    """
+    present = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE_NAME})")}
+    if rebuild:
+        conn.execute(f"DROP TABLE IF EXISTS {CHANGES_TABLE_NAME}")
+    keys = ", ".join(TURNOUT_DIMENSIONS)
+    conn.execute(
+        f"CREATE TABLE IF NOT EXISTS {CHANGES_TABLE_NAME} (seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+        f"voter_id INTEGER NOT NULL, voted INTEGER NOT NULL, {keys}, changed_at REAL NOT NULL)"
+    )
+    values = ", ".join(f'NEW."{col}"' if col in present else "NULL" for col in TURNOUT_DIMENSIONS.values())
+    conn.execute(f"DROP TRIGGER IF EXISTS {TABLE_NAME}_change_log")
+    conn.execute(
+        f"CREATE TRIGGER {TABLE_NAME}_change_log AFTER UPDATE OF voted ON {TABLE_NAME} "
+        f"WHEN (OLD.voted != 0) IS NOT (NEW.voted != 0) BEGIN "
+        f"INSERT INTO {CHANGES_TABLE_NAME} (voter_id, voted, {keys}, changed_at) "
+        f"VALUES (NEW.\"{ID_COLUMN}\", NEW.voted != 0, {values}, (julianday('now') - 2440587.5) * 86400.0); END"
+    )
+
+
+def data_version(conn: sqlite3.Connection) -> int:
+    """Returns the number of times the voters table has been replaced; 0 for a database that predates it."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (META_TABLE_NAME,)).fetchone()
+    if not exists:
+        return 0
+    row = conn.execute(f"SELECT value FROM {META_TABLE_NAME} WHERE key = 'data_version'").fetchone()
+    return int(row[0]) if row else 0
+
+
+def last_change_seq(conn: sqlite3.Connection) -> int:
+    """Returns the seq of the newest vote_changes entry; 0 if the log is empty or the database predates it."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (CHANGES_TABLE_NAME,)).fetchone()
+    if not exists:
+        return 0
+    return int(conn.execute(f"SELECT COALESCE(MAX(seq), 0) FROM {CHANGES_TABLE_NAME}").fetchone()[0])
+
+
+def _bump_data_version(conn: sqlite3.Connection):
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE_NAME} (key TEXT PRIMARY KEY, value)")
+    conn.execute(
+        f"INSERT INTO {META_TABLE_NAME} (key, value) VALUES ('data_version', 1) "
+        "ON CONFLICT(key) DO UPDATE SET value = value + 1"
+    )
+
+
+def read_meta(conn: sqlite3.Connection, key: str) -> object | None:
+    """Returns a value of the app_meta table, or None if it was never set."""
+    exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (META_TABLE_NAME,)).fetchone()
+    if not exists:
+        return None
+    row = conn.execute(f"SELECT value FROM {META_TABLE_NAME} WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+
+def write_meta(conn: sqlite3.Connection, key: str, value: object | None):
+    """Sets (or with None, removes) a value of the app_meta table."""
+    conn.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE_NAME} (key TEXT PRIMARY KEY, value)")
+    if value is None:
+        conn.execute(f"DELETE FROM {META_TABLE_NAME} WHERE key = ?", (key,))
+    else:
+        conn.execute(
+            f"INSERT INTO {META_TABLE_NAME} (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = ?",
+            (key, value, value),
+        )
+
+
+def ensure_schema(conn: sqlite3.Connection, rebuild: bool = False):
+    """
+    Creates the indexes, turnout table, change log and triggers the app expects on the voters table.
+
+    Args:
+        conn: A connection to the votes database.
+        rebuild: Recompute derived tables and bump the data version; required right after the
+            voters table was replaced.
+    """
+    ensure_id_index(conn)
+    ensure_turnout(conn, rebuild)
+    ensure_change_log(conn, rebuild)
+    if rebuild:
+        _bump_data_version(conn)
+        write_meta(conn, "id_scheme", None)  # Unknown until the writer of the new table records it
+
+
+def upgrade_schema(pool: ConnectionPool):
+    """Adds schema objects missing from a database created by an older version of the app."""
+    with pool.transaction() as conn:
+        ensure_schema(conn)
+
+
+def _staging_name(prefix: str = STAGING_TABLE_NAME) -> str:
+    # A staging table of its own per call, so concurrent imports or merges never drop each other's rows
+    return f"{prefix}_{uuid.uuid4().hex}"
+
+
+def _swap_in(conn: sqlite3.Connection, staging: str):
+    """Replaces the voters table with a staging table and rebuilds its schema, in one write transaction."""
+    conn.execute("BEGIN IMMEDIATE")
+    conn.execute(f"DROP TABLE IF EXISTS {TABLE_NAME}")
+    conn.execute(f'ALTER TABLE "{staging}" RENAME TO {TABLE_NAME}')
+    ensure_schema(conn, rebuild=True)
+    conn.commit()
+
+
+def write_table(pool: ConnectionPool, df: pd.DataFrame):
+    """
+    Replaces the voters table with the contents of a DataFrame.
+
+    The rows are written to a staging table first (to_sql commits as it goes), then swapped in with
+    the schema rebuild and version bump in a single transaction, so sessions see either the old table
+    or the complete new one.
+    """
+    staging = _staging_name()
+    with pool.connection() as conn:
+        try:
+            df.to_sql(staging, conn, index=False)
+            _swap_in(conn, staging)
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(f'DROP TABLE IF EXISTS "{staging}"')
+
+
+def read_table(pool: ConnectionPool) -> pd.DataFrame:
+    """Reads the whole voters table."""
+    with pool.connection() as conn:
+        df = pd.read_sql_query(SELECT_ALL_SQL, conn)
+    instrumentation.add_rows(read=len(df))
+    return df
+
+
+def read_table_snapshot(pool: ConnectionPool) -> tuple[pd.DataFrame, int]:
+    """
+    Reads the whole voters table together with the vote change log position it corresponds to.
+
+    Both are read in one transaction, so applying the changes logged after the returned seq brings
+    the rows up to date (see compact_roll.SharedRoll.apply_logged).
+
+    Returns:
+        The voters table and the last change seq included in it (0 if the database has no change log).
+    """
+    with pool.connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            df = pd.read_sql_query(SELECT_ALL_SQL, conn)
+            last_seq = last_change_seq(conn)
+        finally:
+            conn.rollback()
+    instrumentation.add_rows(read=len(df))
+    return df, last_seq
+
+
+def fetch_rows(pool: ConnectionPool, voter_ids: list[int]) -> pd.DataFrame:
+    """
+    Reads the current rows of the given voters, in the order given.
+
+    Used to fetch one page of the voter grid through the voter_id index, so only the visible
+    window crosses from the database into the page.
+    """
+    voter_ids = [int(pid) for pid in voter_ids]
+    if not voter_ids:
+        return read_empty(pool)
+    placeholders = ", ".join("?" * len(voter_ids))
+    with pool.connection() as conn:
+        rows = pd.read_sql_query(f'{SELECT_ALL_SQL} WHERE "{ID_COLUMN}" IN ({placeholders})', conn, params=voter_ids)
+    instrumentation.add_rows(read=len(rows))
+    return pd.DataFrame({ID_COLUMN: voter_ids}).merge(rows, on=ID_COLUMN, how="inner")
+
+
+def read_empty(pool: ConnectionPool) -> pd.DataFrame:
+    """Returns an empty frame with the columns of the voters table."""
+    with pool.connection() as conn:
+        return pd.read_sql_query(f"{SELECT_ALL_SQL} LIMIT 0", conn)
+
+
+class CsvImportError(ValueError):
+    """Raised when an imported CSV fails validation; reason is one of 'missing_columns', 'voter_id' or 'voted'."""
+
+    def __init__(self, reason: str, detail: str):
+        super().__init__(f"{reason}: {detail}")
+        self.reason = reason
+        self.detail = detail
+
+
+@dataclass
+class ImportReport:
+    """Throughput and memory figures of a CSV import."""
+
+    rows: int
+    chunks: int
+    seconds: float
+    peak_memory_bytes: int  # The largest chunk held at once; memory stays bounded by it
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds else float(self.rows)
+
+    def __str__(self) -> str:
+        return (
+            f"{self.rows} rows in {self.chunks} chunk(s), {self.seconds:.2f}s "
+            f"({self.rows_per_second:,.0f} rows/s), peak chunk {self.peak_memory_bytes / 2**20:.1f} MiB"
+        )
+
+
+def _validate_chunk(chunk: pd.DataFrame, first_row: int) -> pd.DataFrame:
+    """Checks and converts the voter_id and voted columns of one CSV chunk with vectorized operations."""
+    missing_cols = [col for col in REQUIRED_COLUMNS if col not in chunk.columns]
+    if missing_cols:
+        raise CsvImportError("missing_columns", ", ".join(missing_cols))
+
+    ids = pd.to_numeric(chunk[ID_COLUMN], errors="coerce")
+    bad_ids = ids.isna() | (ids % 1 != 0)
+    if bad_ids.any():
+        row = first_row + int(bad_ids.to_numpy().argmax())
+        raise CsvImportError(ID_COLUMN, f"row {row}: {chunk[ID_COLUMN].iloc[row - first_row]!r}")
+
+    voted = chunk["voted"]
+    if voted.dtype != bool:
+        voted = voted.astype("string").fillna("").str.strip().str.lower().map(VOTED_VALUES)
+        bad_voted = voted.isna()
+        if bad_voted.any():
+            row = first_row + int(bad_voted.to_numpy().argmax())
+            raise CsvImportError("voted", f"row {row}: {chunk['voted'].iloc[row - first_row]!r}")
+    return chunk.assign(**{ID_COLUMN: ids.astype("int64"), "voted": voted.astype(bool)})
+
+
+def import_csv(pool: ConnectionPool, source: str | IO, chunk_rows: int = IMPORT_CHUNK_ROWS) -> ImportReport:
+    """
+    Replaces the voters table with the rows of a CSV file, streaming it in chunks.
+
+    Each chunk is validated and appended to a staging table, so memory stays bounded by the chunk
+    size. Once every chunk is in, the staging table is swapped in for the voters table in a single
+    transaction; until then (and if anything fails) sessions keep reading and writing the old table.
+
+    Args:
+        pool: The pool of the votes database.
+        source: A path or file object holding the CSV.
+        chunk_rows: Number of rows read, validated and written at a time.
+
+    Returns:
+        An ImportReport with the row count, rows per second and the memory of the largest chunk.
+
+    Raises:
+        CsvImportError: A chunk failed validation, or voter_id values are not unique.
+        pandas.errors.EmptyDataError: The file is empty.
+    """
+    start = time.perf_counter()
+    staging = _staging_name()  # Concurrent imports (two admin sessions) each fill their own table
+    rows = chunks = peak = 0
+    with pool.connection() as conn:
+        try:
+            for chunk in pd.read_csv(source, chunksize=chunk_rows):
+                chunk = _validate_chunk(chunk, first_row=rows)
+                chunk.to_sql(staging, conn, if_exists="append", index=False)
+                peak = max(peak, int(chunk.memory_usage(index=True, deep=True).sum()))
+                rows += len(chunk)
+                chunks += 1
+            if not chunks:
+                raise pd.errors.EmptyDataError("No rows to import")
+            try:
+                _swap_in(conn, staging)
+            except sqlite3.IntegrityError as e:
+                raise CsvImportError(ID_COLUMN, f"duplicate values ({e})") from e
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(f'DROP TABLE IF EXISTS "{staging}"')
+    return ImportReport(rows=rows, chunks=chunks, seconds=time.perf_counter() - start, peak_memory_bytes=peak)
+
+
+@dataclass
+class MergeReport:
+    """What merging a revised roll into the voters table changed."""
+
+    inserted: int
+    updated: int
+    removed: int
+    removed_voted: int  # Removed voters who had already been marked as voted
+    unchanged: int
+    seconds: float
+
+    @property
+    def changed(self) -> bool:
+        return bool(self.inserted or self.updated or self.removed)
+
+    def __str__(self) -> str:
+        text = (
+            f"{self.inserted} inserted, {self.updated} updated, {self.removed} removed, "
+            f"{self.unchanged} unchanged in {self.seconds:.2f}s"
+        )
+        if self.removed_voted:
+            text += f" ({self.removed_voted} removed voters had voted)"
+        return text
+
+
+def merge_roll(pool: ConnectionPool, df: pd.DataFrame, scope_column: str | None = None) -> MergeReport:
+    """
+    Upserts a revised roll into the voters table, keeping every voter's voted flag.
+
+    Rows are matched on voter_id, which must be derived from the voters' identity rather than their
+    position (see voter_ids). Matched rows are rewritten only if a column differs, new voters are
+    inserted as not voted, and voters missing from the revised roll are removed. The turnout table
+    follows through its triggers, all in one transaction; the data version is bumped only if
+    something changed.
+
+    Args:
+        pool: The pool of the votes database.
+        df: The revised roll with a voter_id column; a 'voted' column, if any, is ignored.
+        scope_column: Only remove missing voters whose value of this column (e.g. the village)
+            appears in df, so a roll covering part of the table leaves the rest alone.
+
+    Returns:
+        A MergeReport with the row counts.
+
+    Raises:
+        CsvImportError: voter_id values of df are not unique.
+    """
+    start = time.perf_counter()
+    df = df.drop(columns=["voted"], errors="ignore")
+    columns = [col for col in df.columns if col != ID_COLUMN]
+    staging = _staging_name("voters_merge")
+    with pool.connection() as conn:
+        try:
+            df.to_sql(staging, conn, index=False)
+            try:
+                conn.execute(f'CREATE UNIQUE INDEX idx_{staging}_id ON {staging} ("{ID_COLUMN}")')
+            except sqlite3.IntegrityError as e:
+                raise CsvImportError(ID_COLUMN, f"duplicate values ({e})") from e
+
+            conn.execute("BEGIN IMMEDIATE")
+            present = {row[1] for row in conn.execute(f"PRAGMA table_info({TABLE_NAME})")}
+            for col in columns:
+                if col not in present:  # The revised roll brings a new column
+                    conn.execute(f'ALTER TABLE {TABLE_NAME} ADD COLUMN "{col}"')
+            matched = f'{TABLE_NAME}."{ID_COLUMN}" = {staging}."{ID_COLUMN}"'
+
+            differs = " OR ".join(f'{TABLE_NAME}."{col}" IS NOT {staging}."{col}"' for col in columns)
+            updated = 0
+            if columns:
+                assignments = ", ".join(f'"{col}" = {staging}."{col}"' for col in columns)
+                updated = conn.execute(
+                    f"UPDATE {TABLE_NAME} SET {assignments} FROM {staging} WHERE {matched} AND ({differs})"
+                ).rowcount
+
+            listed = ", ".join(f'"{col}"' for col in [ID_COLUMN, *columns])
+            inserted = conn.execute(
+                f"INSERT INTO {TABLE_NAME} ({listed}, voted) SELECT {listed}, 0 FROM {staging} "
+                f"WHERE NOT EXISTS (SELECT 1 FROM {TABLE_NAME} WHERE {matched})"
+            ).rowcount
+
+            missing = f"NOT EXISTS (SELECT 1 FROM {staging} WHERE {matched})"
+            if scope_column is not None:
+                missing += f' AND "{scope_column}" IN (SELECT DISTINCT "{scope_column}" FROM {staging})'
+            removed_voted = conn.execute(f"SELECT COUNT(*) FROM {TABLE_NAME} WHERE {missing} AND voted != 0")
+            removed_voted = removed_voted.fetchone()[0]
+            removed = conn.execute(f"DELETE FROM {TABLE_NAME} WHERE {missing}").rowcount
+
+            report = MergeReport(
+                inserted=inserted,
+                updated=updated,
+                removed=removed,
+                removed_voted=removed_voted,
+                unchanged=len(df) - inserted - updated,
+                seconds=0.0,
+            )
+            if report.changed:
+                _bump_data_version(conn)
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+    report.seconds = time.perf_counter() - start
+    return report
+
+
+def rekey(pool: ConnectionPool, new_ids: dict, id_scheme: str):
+    """
+    Replaces the voter_id of every voter, keeping their rows and voted flags.
+
+    Used once to move a table numbered by row position onto identity-derived ids before its first
+    merge. The vote change log refers to the old ids, so it is emptied.
+
+    Args:
+        pool: The pool of the votes database.
+        new_ids: Mapping of every current voter_id to its new, unique voter_id.
+        id_scheme: Recorded in app_meta, so later merges know the table already uses it.
+    """
+    staging = _staging_name("voters_rekey")
+    with pool.connection() as conn:
+        try:
+            conn.execute(f"CREATE TABLE {staging} (old_id INTEGER PRIMARY KEY, new_id INTEGER NOT NULL)")
+            conn.executemany(
+                f"INSERT INTO {staging} (old_id, new_id) VALUES (?, ?)",
+                [(int(old), int(new)) for old, new in new_ids.items()],
+            )
+            conn.execute("BEGIN IMMEDIATE")
+            # Old and new ids may overlap mid-update, so uniqueness is checked once all rows are renumbered
+            conn.execute(f"DROP INDEX IF EXISTS {ID_INDEX_NAME}")
+            conn.execute(
+                f'UPDATE {TABLE_NAME} SET "{ID_COLUMN}" = {staging}.new_id FROM {staging} '
+                f'WHERE {TABLE_NAME}."{ID_COLUMN}" = {staging}.old_id'
+            )
+            ensure_id_index(conn)
+            ensure_change_log(conn, rebuild=True)
+            _bump_data_version(conn)
+            write_meta(conn, "id_scheme", id_scheme)
+            conn.commit()
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            conn.execute(f"DROP TABLE IF EXISTS {staging}")
+
+
+def update_voted(pool: ConnectionPool, changes: dict) -> int:
+    """
+    Writes a batch of vote flips in a single transaction.
+
+    Args:
+        pool: The pool of the votes database.
+        changes: Mapping of voter_id to the new voted value.
+
+    Returns:
+        The number of rows updated.
+    """
+    if not changes:
+        return 0
+    with pool.transaction() as conn:
+        ensure_id_index(conn)
+        cursor = conn.executemany(UPDATE_VOTED_SQL, [(bool(voted), int(pid)) for pid, voted in changes.items()])
+        return cursor.rowcount
+
+
+def read_turnout(
+    pool: ConnectionPool, filters: list[dict] | None = None, group_by: list[str] | None = None
+) -> pd.DataFrame | None:
+    """
+    Reads turnout counts from the turnout table, optionally restricted and grouped.
+
+    Args:
+        pool: The pool of the votes database.
+        filters: Filter dicts ({'column': voter column, 'values': [labels]}) on turnout dimensions;
+            values are compared by their string form, like the column filters of the apps.
+        group_by: Voter columns among the turnout dimensions to break the counts down by.
+
+    Returns:
+        A DataFrame with the group_by columns (if any) and 'total' and 'voted' columns, or None if the
+        database has no turnout table or a filter or group column is not a turnout dimension.
+    """
+    keys = {col: key for key, col in TURNOUT_DIMENSIONS.items()}
+    group_by = group_by or []
+    conditions, params = [], []
+    for filt in filters or []:
+        values = filt.get("values")
+        if not values:
+            continue
+        if filt.get("column") not in keys:
+            return None
+        values = values if isinstance(values, list) else [values]
+        conditions.append(f"CAST({keys[filt['column']]} AS TEXT) IN ({', '.join('?' * len(values))})")
+        params.extend(str(v) for v in values)
+    if any(col not in keys for col in group_by):
+        return None
+
+    selected = [f'{keys[col]} AS "{col}"' for col in group_by]
+    query = f"SELECT {', '.join([*selected, 'SUM(total) AS total', 'SUM(voted) AS voted'])} FROM {TURNOUT_TABLE_NAME}"
+    if conditions:
+        query += " WHERE " + " AND ".join(conditions)
+    if group_by:
+        query += " GROUP BY " + ", ".join(keys[col] for col in group_by) + " HAVING SUM(total) > 0"
+        query += " ORDER BY SUM(total) DESC"
+    with pool.connection() as conn:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (TURNOUT_TABLE_NAME,)).fetchone()
+        if not exists:
+            return None
+        turnout = pd.read_sql_query(query, conn, params=params)
+    instrumentation.add_rows(read=len(turnout))
+    return turnout.fillna({"total": 0, "voted": 0}).astype({"total": "int64", "voted": "int64"})
+
+
+def turnout_snapshot(pool: ConnectionPool) -> tuple[pd.DataFrame | None, int, int]:
+    """
+    Reads turnout for every group together with the change-log position it corresponds to.
+
+    Both are read in one transaction, so applying the changes after the returned seq to the snapshot
+    gives the exact current turnout.
+
+    Returns:
+        The turnout per (family, registry, gender, religion) group (None if the database predates the
+        turnout table or change log), the last change seq included in it, and the data version.
+    """
+    keys = ", ".join(f'{key} AS "{col}"' for key, col in TURNOUT_DIMENSIONS.items())
+    with pool.connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            tables = (TURNOUT_TABLE_NAME, CHANGES_TABLE_NAME)
+            found = conn.execute("SELECT COUNT(*) FROM sqlite_master WHERE name IN (?, ?)", tables).fetchone()[0]
+            if found < len(tables):
+                return None, 0, data_version(conn)
+            turnout = pd.read_sql_query(f"SELECT {keys}, total, voted FROM {TURNOUT_TABLE_NAME}", conn)
+            return turnout, last_change_seq(conn), data_version(conn)
+        finally:
+            conn.rollback()
+
+
+def read_changes(pool: ConnectionPool, since_seq: int, limit: int = 100_000) -> tuple[pd.DataFrame, int]:
+    """
+    Reads the vote flips logged after a given seq.
+
+    Returns:
+        The changes (seq, voter_id, voted and the turnout dimension columns), oldest first, and the
+        current data version so callers can tell when the table was replaced and the log restarted.
+    """
+    keys = ", ".join(f'{key} AS "{col}"' for key, col in TURNOUT_DIMENSIONS.items())
+    with pool.connection() as conn:
+        conn.execute("BEGIN")
+        try:
+            changes = pd.read_sql_query(
+                f"SELECT seq, voter_id, voted, {keys} FROM {CHANGES_TABLE_NAME} WHERE seq > ? ORDER BY seq LIMIT ?",
+                conn,
+                params=(since_seq, limit),
+            )
+            return changes, data_version(conn)
+        finally:
+            conn.rollback()
@@ -1,9 +1,15 @@
-# Assuming data_analyzer.py is in the same directory or Python path
-import data_analyzer as da
+import os
+
 import pandas as pd
 import plotly.express as px
 import streamlit as st
 
+# Assuming data_analyzer.py is in the same directory or Python path
+import data_analyzer as da
+import paging
+import roll_duckdb
+import summary_cache
+
 st.set_page_config(layout="wide")
 
 st.title("Excel Data Analyzer")
@@ -12,15 +18,38 @@ st.title("Excel Data Analyzer")
 # Persists variables across reruns
 if "df" not in st.session_state:
     st.session_state.df = None  # Stores the original DataFrame
-if "filtered_df" not in st.session_state:
-    st.session_state.filtered_df = None  # Stores the filtered (or original) DataFrame for display/analysis
+if "filtered_view" not in st.session_state:
+    st.session_state.filtered_view = None  # The filtered (or all) rows of df, as row positions (RowView)
 if "uploaded_filename" not in st.session_state:
     st.session_state.uploaded_filename = None  # Tracks the name of the uploaded file
+if "load_report" not in st.session_state:
+    st.session_state.load_report = None  # Load time and memory of the current file (roll_cache.LoadReport)
+if "column_index" not in st.session_state:
+    st.session_state.column_index = None  # Column codes of the original DataFrame, shared by all filters
+if "summary_cache" not in st.session_state:
+    st.session_state.summary_cache = summary_cache.SummaryCache()  # Memoized summaries and count cube
+if "applied_filters" not in st.session_state:
+    st.session_state.applied_filters = []  # The filters that produced filtered_view, keying cached summaries
+if "duckdb_roll" not in st.session_state:
+    st.session_state.duckdb_roll = None  # The DuckDBRoll queried instead of df when the DuckDB engine is on
+if "engine" not in st.session_state:
+    st.session_state.engine = None  # The engine the current file was loaded with
 if "active_filters" not in st.session_state:
     st.session_state.active_filters = (
         []
     )  # List to store filter dicts: {'id': unique_id, 'column': col, 'values': [vals]}
 
+# --- Engine ---
+# pandas holds the workbook in memory; DuckDB queries its Parquet cache file in place, on all cores
+use_duckdb = st.sidebar.toggle(
+    "DuckDB engine (large rolls)",
+    value=roll_duckdb.available() and os.environ.get("ANALYZER_ENGINE") == "duckdb",
+    disabled=not roll_duckdb.available(),
+    key="use_duckdb",
+    help="Filters and summaries run as DuckDB queries over the cached Parquet file instead of in pandas.",
+)
+engine = "duckdb" if use_duckdb else "pandas"
+
 # --- File Upload ---
 # Place the uploader at the top
 uploaded_file = st.file_uploader("Choose an Excel file (.xlsx)", type="xlsx")
@@ -29,20 +58,41 @@ uploaded_file = st.file_uploader("Choose an Excel file (.xlsx)", type="xlsx")
 # This block executes when a file is uploaded
 if uploaded_file is not None:
     # Load data only if it's a new file or not loaded yet
-    if st.session_state.df is None or st.session_state.uploaded_filename != uploaded_file.name:
+    if (
+        st.session_state.df is None
+        or st.session_state.uploaded_filename != uploaded_file.name
+        or st.session_state.engine != engine
+    ):
         try:
-            # Use pandas directly to read the uploaded file object
-            df = pd.read_excel(uploaded_file)
-            st.session_state.df = df
-            st.session_state.filtered_df = df  # Initialize filtered_df with the full df
+            if use_duckdb:
+                # Only the cache entry is ensured; df keeps the column names and the rows stay in the Parquet file
+                duckdb_roll, load_report = roll_duckdb.open_roll(uploaded_file)
+                st.session_state.df = duckdb_roll.schema
+                st.session_state.filtered_view = roll_duckdb.DuckDBView(duckdb_roll)
+                st.session_state.column_index = None
+            else:
+                # Go through the columnar cache so re-uploading the same workbook skips the Excel parse
+                df, load_report = da.roll_cache.read_roll(uploaded_file)
+                duckdb_roll = None
+                st.session_state.df = df
+                st.session_state.filtered_view = da.RowView(df)  # Initialize the view with every row
+                st.session_state.column_index = da.ColumnIndex(df)
+            st.session_state.duckdb_roll = duckdb_roll
+            st.session_state.engine = engine
             st.session_state.uploaded_filename = uploaded_file.name
+            st.session_state.load_report = load_report
+            st.session_state.applied_filters = []
             st.success(f"Successfully loaded '{uploaded_file.name}'")
         except Exception as e:
             st.error(f"Error loading file: {e}")
             # Reset state on loading error
             st.session_state.df = None
-            st.session_state.filtered_df = None
+            st.session_state.filtered_view = None
             st.session_state.uploaded_filename = None
+            st.session_state.load_report = None
+            st.session_state.column_index = None
+            st.session_state.duckdb_roll = None
+            st.session_state.engine = None
             st.stop()  # Stop script execution if file loading fails
 
 # --- Main App Logic (only runs if data is successfully loaded) ---
@@ -50,6 +100,9 @@ if st.session_state.df is not None:
     df = st.session_state.df  # Get the original dataframe
     columns = df.columns.tolist()  # Get column names for UI widgets
 
+    if st.session_state.load_report is not None:
+        st.caption(str(st.session_state.load_report))
+
     st.sidebar.header("Analysis Options")
 
     # --- Filtering Section ---
@@ -84,18 +137,15 @@ if st.session_state.df is not None:
 
         selected_values = []
         if selected_column != "None":
-            # Calculate value counts and sort unique values by frequency
+            # Unique values sorted by frequency
             if selected_column in df.columns:
-                value_counts = df[selected_column].value_counts()
-                sorted_unique_values = value_counts.index.tolist()
-
-                if sorted_unique_values:
-                    try:
-                        display_values = [str(v) for v in sorted_unique_values]
-                    except TypeError:
-                        unique_values_fallback = df[selected_column].unique()
-                        display_values = [str(v) for v in unique_values_fallback]
+                # Options come from the value-count index built once per loaded file (a GROUP BY with DuckDB)
+                if st.session_state.duckdb_roll is not None:
+                    display_values = st.session_state.duckdb_roll.options(selected_column)
+                else:
+                    display_values = st.session_state.column_index.options(selected_column)
 
+                if display_values:
                     selected_values = st.sidebar.multiselect(
                         f"Select value(s) for '{selected_column}' (ordered by count):",
                         options=display_values,
@@ -130,32 +180,35 @@ if st.session_state.df is not None:
     # --- Apply / Reset Logic --- #
     # This logic needs to be updated to handle the new structure
     if apply_filters_button:
-        temp_df = df.copy()
-        filters_applied_count = 0
         try:
-            for filt in st.session_state.active_filters:
-                col = filt["column"]
-                vals = filt["values"]
-                if col != "None" and vals:
-                    temp_df = da.filter_by_column(temp_df, col, vals)
-                    filters_applied_count += 1
-
-            st.session_state.filtered_df = temp_df
+            # All filters are combined into one row mask over precomputed column codes (one WHERE with DuckDB)
+            if st.session_state.duckdb_roll is not None:
+                filtered_view, filter_result = st.session_state.duckdb_roll.filter_view(st.session_state.active_filters)
+            else:
+                filtered_view, filter_result = da.filter_view(
+                    df, st.session_state.active_filters, st.session_state.column_index
+                )
+            filters_applied_count = filter_result.applied
+            st.session_state.filtered_view = filtered_view
+            st.session_state.applied_filters = [
+                dict(filt, values=list(filt["values"])) for filt in st.session_state.active_filters
+            ]
             if filters_applied_count > 0:
                 st.sidebar.success(f"Applied {filters_applied_count} filter(s).")
             else:
                 st.sidebar.info("No active filters to apply. Showing all data.")
-                # Ensure filtered_df is reset if no filters were applied but it wasn't the original
-                if st.session_state.filtered_df is not df:
-                    st.session_state.filtered_df = df
             st.rerun()
         except Exception as e:
             st.sidebar.error(f"Error applying filters: {e}")
 
     if reset_filters_button:
-        if st.session_state.active_filters or st.session_state.filtered_df is not df:
+        if st.session_state.active_filters or not st.session_state.filtered_view.is_full:
             st.session_state.active_filters = []
-            st.session_state.filtered_df = df
+            st.session_state.applied_filters = []
+            if st.session_state.duckdb_roll is not None:
+                st.session_state.filtered_view = roll_duckdb.DuckDBView(st.session_state.duckdb_roll)
+            else:
+                st.session_state.filtered_view = da.RowView(df)
             st.sidebar.info("All filters reset. Showing all data.")
             st.rerun()
         else:
@@ -171,21 +224,48 @@ if st.session_state.df is not None:
     # --- Display Area ---
     st.header("Active Data")
     st.write("Data currently being analyzed (filtered or original).")
-    # Always display the dataframe stored in st.session_state.filtered_df
-    # Add a check to ensure filtered_df is not None before using it
-    if st.session_state.filtered_df is not None:
-        active_df = st.session_state.filtered_df
-        st.dataframe(active_df)
-        st.write(f"Showing {len(active_df)} rows.")  # Safe now as active_df is not None
+    # Always display the rows selected by st.session_state.filtered_view
+    # Add a check to ensure filtered_view is not None before using it
+    if st.session_state.filtered_view is not None:
+        active_view = st.session_state.filtered_view
+        # Only one page of rows is materialized and sent to the browser
+        page_col1, page_col2 = st.columns(2)
+        page_size = page_col1.selectbox(
+            "Rows per page:",
+            paging.PAGE_SIZES,
+            index=paging.PAGE_SIZES.index(paging.DEFAULT_PAGE_SIZE),
+            key="page_size",
+        )
+        n_pages = paging.page_count(len(active_view), page_size)
+        if "page_number" not in st.session_state:
+            st.session_state.page_number = 1
+        elif st.session_state.page_number > n_pages:  # The active data shrank after filtering
+            st.session_state.page_number = n_pages
+        page_number = page_col2.number_input(
+            f"Page (of {n_pages}):", min_value=1, max_value=n_pages, step=1, key="page_number"
+        )
+        page_start, page_stop = paging.page_bounds(page_number - 1, len(active_view), page_size)
+        st.dataframe(active_view.take(page_start, page_stop))
+        st.write(f"Showing {len(active_view)} rows.")  # Safe now as active_view is not None
 
         # --- Display Summary Results ---
         # This block executes when the summarize button is clicked
         if summarize_button:
             if summarize_columns:
                 try:
-                    # Use the *currently active* dataframe (active_df) for summarization
-                    # active_df is guaranteed not None here
-                    summary_df = da.summarize_by_column(active_df, summarize_columns)
+                    # Summarize the *currently active* rows; repeated requests come from the summary cache
+                    # active_view is guaranteed not None here; its rows are only copied if the cube cannot answer
+                    if st.session_state.duckdb_roll is not None:
+                        # Grouped and counted by DuckDB over the Parquet file; no rows are materialized
+                        summary_df = active_view.summarize(summarize_columns)
+                    else:
+                        summary_df = st.session_state.summary_cache.summarize(
+                            df,
+                            active_view,
+                            summarize_columns,
+                            st.session_state.applied_filters,
+                            st.session_state.load_report.digest,
+                        )
 
                     st.header("Summary Statistics")
                     if not summary_df.empty:
@@ -241,14 +321,14 @@ if st.session_state.df is not None:
 
                         except Exception as chart_error:
                             st.error(f"Could not generate bar chart: {chart_error}")
-                    # Check active_df.empty instead of st.session_state.filtered_df.empty
-                    elif active_df.empty:
+                    # Check active_view.empty instead of materializing the filtered rows
+                    elif active_view.empty:
                         st.warning(
                             "Cannot generate summary or"
                             + " chart because the active data table is empty (due to filtering)."
                         )
                     else:
-                        # This might happen if selected columns don't exist in the filtered_df (shouldn't happen here)
+                        # This might happen if selected columns don't exist in the filtered rows (shouldn't happen here)
                         # or if summarize_by_column itself returns empty for valid reasons.
                         st.info("Summary generated successfully, but the result is empty.")
 
@@ -258,7 +338,7 @@ if st.session_state.df is not None:
                 # If button is clicked without selecting columns
                 st.warning("Please select at least one column to group by for summarization.")
     else:
-        # This case handles if filtered_df somehow became None after initial load
+        # This case handles if filtered_view somehow became None after initial load
         st.warning("No active data to display. Try reloading the file.")
 
 # --- Initial Prompt ---
@@ -0,0 +1,146 @@
+from collections import OrderedDict
+
+import pandas as pd
+
+try:
+    from . import data_analyzer as da
+    from .filter_engine import ColumnIndex, RowView, build_mask
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import data_analyzer as da
+    from filter_engine import ColumnIndex, RowView, build_mask
+
+# Dimensions most summaries group or filter by: gender, religion, family name, registry number
+CUBE_DIMENSIONS = ["الجنس", "مذهب الشخصي", "الشهرة", "رقم السجل"]
+MAX_ENTRIES = 64
+
+
+def filter_signature(filters: list[dict]) -> tuple:
+    """Returns a hashable, order-independent key for the filters that actually select rows."""
+    terms = []
+    for filt in filters:
+        values = filt.get("values")
+        if values:
+            values = values if isinstance(values, list) else [values]
+            terms.append((filt.get("column"), tuple(sorted(str(v) for v in values))))
+    return tuple(sorted(terms))
+
+
+def sort_summary(summary_df: pd.DataFrame) -> pd.DataFrame:
+    """Orders a grouped count frame the way summarize_by_column does: by count, descending, on a fresh index."""
+    return summary_df.sort_values(by="count", ascending=False).reset_index(drop=True)
+
+
+class CountCube:
+    """
+    Row counts for every observed combination of a few dimensions.
+
+    Any summary that groups and filters only on cube dimensions can be answered by summing cube cells,
+    which are far fewer than voter rows.
+    """
+
+    def __init__(self, df: pd.DataFrame, dimensions: list[str] = CUBE_DIMENSIONS):
+        self.dimensions = [col for col in dimensions if col in df.columns]
+        if self.dimensions:
+            # dropna=False keeps rows with a missing family or registry in the totals of the other dimensions
+            self.cells = df.groupby(self.dimensions, observed=True, dropna=False).size().reset_index(name="count")
+        else:
+            self.cells = pd.DataFrame(columns=["count"])
+        self.index = ColumnIndex(self.cells)
+
+    @classmethod
+    def from_cells(cls, cells: pd.DataFrame, dimensions: list[str]) -> "CountCube":
+        """Wraps already aggregated cells (the dimension columns plus 'count'), e.g. one slice of a larger cube."""
+        cube = cls.__new__(cls)
+        cube.dimensions = [col for col in dimensions if col in cells.columns]
+        cube.cells = cells.reset_index(drop=True)
+        cube.index = ColumnIndex(cube.cells)
+        return cube
+
+    def covers(self, columns: list[str], filters: list[dict]) -> bool:
+        """Tells whether a summary over these group columns and filters can be rolled up from the cube."""
+        filter_columns = [column for column, _ in filter_signature(filters)]
+        return bool(columns) and all(col in self.dimensions for col in [*columns, *filter_columns])
+
+    def summarize(self, columns: list[str], filters: list[dict]) -> pd.DataFrame:
+        """Rolls the cube up to the given group columns, keeping only cells that match the filters."""
+        cells = self.cells
+        result = build_mask(self.index, filters)
+        if result.applied:
+            cells = cells[result.mask]
+        summary_df = cells.groupby(columns, observed=True)["count"].sum().reset_index()
+        return sort_summary(summary_df)
+
+
+class SummaryCache:
+    """
+    Memoized group-by summaries with least-recently-used eviction.
+
+    Entries are keyed by (dataset version, filter signature, group columns), so pressing
+    "Generate Summary" again with the same data, filters and columns is a dictionary lookup.
+    With use_cube, a CountCube is built per dataset version on first use and answers every
+    summary it covers without scanning the rows.
+    """
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, use_cube: bool = True):
+        self.max_entries = max_entries
+        self.use_cube = use_cube
+        self._entries: OrderedDict[tuple, pd.DataFrame] = OrderedDict()
+        self._cubes: dict[object, CountCube] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def precompute(self, df: pd.DataFrame, version: object, dimensions: list[str] = CUBE_DIMENSIONS) -> CountCube:
+        """Builds (or returns) the count cube for a dataset version ahead of the first summary."""
+        cube = self._cubes.get(version)
+        if cube is None:
+            self._cubes.clear()  # Cubes of older versions can no longer be asked for
+            cube = self._cubes[version] = CountCube(df, dimensions)
+        return cube
+
+    def summarize(
+        self,
+        df: pd.DataFrame,
+        filtered_df: pd.DataFrame | RowView,
+        column_name: str | list[str],
+        filters: list[dict],
+        version: object,
+    ) -> pd.DataFrame:
+        """
+        Returns the summary of filtered_df grouped by column_name, from cache when possible.
+
+        Args:
+            df: The full dataset, used to build the count cube.
+            filtered_df: The rows selected by filters (a frame or a RowView over df), summarized directly
+                when the cube cannot be used; a RowView is only materialized in that case.
+            column_name: The column(s) to group by.
+            filters: The filters that produced filtered_df.
+            version: Identifies the content of df (e.g. the workbook hash); must change when df changes.
+
+        Returns:
+            A summary DataFrame with one row per group and a 'count' column, largest first.
+        """
+        columns = [column_name] if isinstance(column_name, str) else list(column_name)
+        key = (version, filter_signature(filters), tuple(columns))
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return self._entries[key]
+
+        self.misses += 1
+        cube = self.precompute(df, version) if self.use_cube else None
+        if cube is not None and cube.covers(columns, filters):
+            summary_df = cube.summarize(columns, filters)
+        else:
+            if isinstance(filtered_df, RowView):
+                filtered_df = filtered_df.frame()
+            summary_df = da.summarize_by_column(filtered_df, columns)
+
+        self._entries[key] = summary_df
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return summary_df
+
+    def clear(self):
+        """Drops every memoized summary and cube."""
+        self._entries.clear()
+        self._cubes.clear()
@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pandas as pd
+
+try:
+    from . import storage
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import storage
+
+DIMENSIONS = list(storage.TURNOUT_DIMENSIONS.values())
+MIN_REFRESH_SECONDS = 1.0
+
+
+def _group_keys(index: pd.MultiIndex) -> list[tuple]:
+    # Group keys with every missing value as None, so a blank family or registry compares equal
+    # (a NaN in a MultiIndex never matches another one)
+    return [tuple(None if pd.isna(value) else value for value in key) for key in index]
+
+
+class TurnoutFeed:
+    """
+    Live turnout per group, kept current by following the vote_changes log.
+
+    The feed starts from one turnout snapshot and afterwards only reads the changes logged since the
+    last seq it applied, so each refresh costs as much as the number of new ticks. One feed is meant
+    to be shared by every viewer in a process: refreshes are serialized and rate limited, so adding
+    observers adds no database work.
+    """
+
+    def __init__(self, pool: storage.ConnectionPool, min_refresh_seconds: float = MIN_REFRESH_SECONDS):
+        self.pool = pool
+        self.min_refresh_seconds = min_refresh_seconds
+        self.turnout: pd.DataFrame | None = None  # Indexed by DIMENSIONS, with total and voted columns
+        self.last_seq = 0
+        self.data_version: int | None = None
+        self.refreshed_at = 0.0
+        self.changes_applied = 0
+        self._positions: dict[tuple, int] = {}  # Group key -> row of self.turnout
+        self._lock = threading.Lock()
+
+    def _load_snapshot(self):
+        turnout, self.last_seq, self.data_version = storage.turnout_snapshot(self.pool)
+        self.turnout = None if turnout is None else turnout.set_index(DIMENSIONS).sort_index()
+        self._positions = {} if self.turnout is None else {k: i for i, k in enumerate(_group_keys(self.turnout.index))}
+
+    def refresh(self, force: bool = False) -> int:
+        """
+        Applies the changes logged since the last refresh.
+
+        Returns:
+            The number of vote changes applied (0 when the refresh was skipped by rate limiting).
+        """
+        with self._lock:
+            if not force and time.monotonic() - self.refreshed_at < self.min_refresh_seconds:
+                return 0
+            self.refreshed_at = time.monotonic()
+            if self.turnout is None:
+                self._load_snapshot()
+                return 0
+
+            changes, version = storage.read_changes(self.pool, self.last_seq)
+            if version != self.data_version:
+                self._load_snapshot()  # The voters table was replaced; the log restarted with it
+                return 0
+            if changes.empty:
+                return 0
+
+            deltas = (changes["voted"] * 2 - 1).groupby([changes[col] for col in DIMENSIONS], dropna=False).sum()
+            positions = [self._positions.get(key, -1) for key in _group_keys(deltas.index)]
+            if -1 in positions:
+                self._load_snapshot()  # A group appeared after the snapshot (rows were added)
+                return len(changes)
+            self.turnout.iloc[positions, self.turnout.columns.get_loc("voted")] += deltas.to_numpy()
+            self.last_seq = int(changes["seq"].iloc[-1])
+            self.changes_applied += len(changes)
+            return len(changes)
+
+    def summary(self, group_by: list[str] | None = None) -> pd.DataFrame:
+        """
+        Returns turnout rolled up to the given dimensions (or a single total row), largest groups first.
+
+        The result has the group columns, 'total', 'voted' and 'turnout' (the voted share, 0 to 1).
+        """
+        with self._lock:
+            if self.turnout is None:
+                return pd.DataFrame(columns=[*(group_by or []), "total", "voted", "turnout"])
+            if group_by:
+                summary_df = self.turnout.groupby(level=group_by, dropna=False)[["total", "voted"]].sum()
+                summary_df = summary_df.reset_index().sort_values("total", ascending=False, ignore_index=True)
+            else:
+                summary_df = self.turnout[["total", "voted"]].sum().to_frame().T
+        summary_df["turnout"] = summary_df["voted"] / summary_df["total"].where(summary_df["total"] > 0)
+        return summary_df
@@ -0,0 +1,125 @@
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+try:
+    from .voter_search import normalize_arabic
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    from voter_search import normalize_arabic
+
+# Columns that identify a voter: registry number, names, mother's name and birth date
+IDENTITY_COLUMNS = ["رقم السجل", "الاسم", "الشهرة", "اسم الاب", "إسم الام وشهرتها", "تاريخ الولادة"]
+# Ids stay below 2**53 so they survive the round trip through the browser's JavaScript numbers
+ID_BITS = 53
+# Recorded in the database's app_meta once its voter_ids follow stable_ids(); bump if the derivation changes
+ID_SCHEME = "identity-blake2b-53"
+# Rolls ingested village by village carry this column; ids are namespaced by it
+VILLAGE_COLUMN = "village"
+
+
+def identity_keys(df: pd.DataFrame, namespace: str = "", columns: list[str] = IDENTITY_COLUMNS) -> pd.Series:
+    """
+    Returns the normalized identity text of every row.
+
+    Spelling variants (hamza forms, ta marbuta, diacritics...) and whitespace are folded, so a
+    clerk's correction of "احمد" to "أحمد" does not make a new voter.
+    """
+    columns = [col for col in columns if col in df.columns]
+    if not columns:
+        raise ValueError(f"None of the identity columns {IDENTITY_COLUMNS} are in the roll.")
+    keys = pd.Series(namespace, index=df.index, dtype=object)
+    for col in columns:
+        values = df[col]
+        if pd.api.types.is_float_dtype(values.dtype):  # Registry numbers read as floats because of a blank
+            values = values.astype("Int64")
+        # Each distinct value is normalized once; names and dates repeat a lot across a roll
+        codes, uniques = pd.factorize(values, use_na_sentinel=True)
+        normalized = np.array([normalize_arabic(value) for value in uniques] + [""], dtype=object)
+        keys = keys + "\x1f" + normalized[codes]  # The -1 code of blanks picks the trailing ""
+    return keys
+
+
+def stable_ids(df: pd.DataFrame, namespace: str = "") -> np.ndarray:
+    """
+    Derives a voter_id for every row from its identity columns instead of its position.
+
+    The same person gets the same id whatever the row order or the other rows of the roll, so ids
+    survive re-ingestion and re-imports. Identical rows (true duplicates on the roll) are told apart
+    by their occurrence number; the rare hash collision between different voters is resolved the
+    same way, deterministically.
+
+    Args:
+        df: The roll.
+        namespace: Mixed into every hash, e.g. the village key, so equal rows of two villages differ.
+
+    Returns:
+        An int64 array of unique, non-negative ids below 2**53.
+    """
+    keys = identity_keys(df, namespace)
+    occurrence = keys.groupby(keys, sort=False).cumcount().to_numpy()
+    mask = (1 << ID_BITS) - 1
+    ids = np.empty(len(keys), dtype=np.int64)
+    used: set[int] = set()
+    for i, (key, seen) in enumerate(zip(keys.to_numpy(), occurrence)):
+        while True:
+            digest = hashlib.blake2b(f"{key}\x1e{seen}".encode("utf-8"), digest_size=8).digest()
+            voter_id = int.from_bytes(digest, "big") & mask
+            if voter_id not in used:
+                break
+            seen += 1  # Another row already holds this id: keep deriving until it is free
+        used.add(voter_id)
+        ids[i] = voter_id
+    return ids
+
+
+def assign_ids(df: pd.DataFrame) -> np.ndarray:
+    """Returns stable_ids() for a whole roll, namespaced by village when the roll has a village column."""
+    if VILLAGE_COLUMN not in df.columns:
+        return stable_ids(df)
+    ids = np.empty(len(df), dtype=np.int64)
+    for village, positions in df.groupby(VILLAGE_COLUMN, observed=True, sort=False).indices.items():
+        ids[positions] = stable_ids(df.iloc[positions], namespace=str(village))
+    return ids
+
+
+def carry_ids(revised: pd.DataFrame, current: pd.DataFrame) -> tuple[np.ndarray, int]:
+    """
+    Gives corrected voters of a revised roll the voter_id they already have in the current table.
+
+    Correcting a name or a birth date changes a voter's identity, hence their derived id. Rows of the
+    revised roll whose id is unknown are matched against current rows whose id is gone, first on all
+    identity columns and then on all but one; a match that is unambiguous on both sides keeps the
+    current id, so the voter keeps their voted flag instead of being removed and re-added.
+
+    Args:
+        revised: The revised roll with its derived voter_id column.
+        current: The rows of the voters table the revised roll replaces.
+
+    Returns:
+        The voter_ids to use for the revised rows, and how many were carried over.
+    """
+    ids = revised["voter_id"].to_numpy(dtype=np.int64, copy=True)
+    current_ids = current["voter_id"].to_numpy(dtype=np.int64)
+    new_positions = np.flatnonzero(~np.isin(ids, current_ids))
+    gone_positions = np.flatnonzero(~np.isin(current_ids, ids))
+    carried = 0
+    namespace = [VILLAGE_COLUMN] if VILLAGE_COLUMN in revised.columns and VILLAGE_COLUMN in current.columns else []
+    for skipped in [None, *IDENTITY_COLUMNS]:
+        if not len(new_positions) or not len(gone_positions):
+            break
+        columns = [*namespace, *(col for col in IDENTITY_COLUMNS if col != skipped)]
+        new_keys = identity_keys(revised.iloc[new_positions], columns=columns).to_numpy()
+        gone_keys = identity_keys(current.iloc[gone_positions], columns=columns).to_numpy()
+        pairs = pd.merge(
+            pd.DataFrame({"key": new_keys, "new": np.arange(len(new_keys))}).drop_duplicates("key", keep=False),
+            pd.DataFrame({"key": gone_keys, "gone": np.arange(len(gone_keys))}).drop_duplicates("key", keep=False),
+            on="key",
+        )
+        if pairs.empty:
+            continue
+        ids[new_positions[pairs["new"]]] = current_ids[gone_positions[pairs["gone"]]]
+        carried += len(pairs)
+        new_positions = np.delete(new_positions, pairs["new"].to_numpy())
+        gone_positions = np.delete(gone_positions, pairs["gone"].to_numpy())
+    return ids, carried
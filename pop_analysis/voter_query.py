@@ -0,0 +1,208 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+try:
+    from . import instrumentation, storage
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import instrumentation
+    import storage
+
+# Covering indexes for the filters volunteers use most: the turnout dimensions, each followed by voted
+# and voter_id, so counts and page ids of a filtered selection are read from the index alone
+FILTER_INDEXES = {f"idx_{storage.TABLE_NAME}_{key}": col for key, col in storage.TURNOUT_DIMENSIONS.items()}
+VOTED_INDEX_NAME = f"idx_{storage.TABLE_NAME}_voted"
+# Rows SQLite samples per index when gathering planner statistics; enough to rank the indexes
+ANALYSIS_LIMIT = 1_000
+
+
+def ensure_indexes(pool: storage.ConnectionPool):
+    """
+    Creates the covering indexes used by filtered queries, if they are missing, and refreshes the
+    planner statistics so a query combining several filters picks the most selective index.
+
+    Indexes go away with the table when it is replaced (CSV import, reset), so this is run once per
+    data version.
+    """
+    with pool.transaction() as conn:
+        present = {row[1] for row in conn.execute(f"PRAGMA table_info({storage.TABLE_NAME})")}
+        if "voted" not in present:
+            return
+        for name, col in FILTER_INDEXES.items():
+            if col in present:
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{name}" ON {storage.TABLE_NAME} '
+                    f'("{col}", voted, "{storage.ID_COLUMN}")'
+                )
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS {VOTED_INDEX_NAME} ON {storage.TABLE_NAME} (voted, "{storage.ID_COLUMN}")'
+        )
+        conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+        conn.execute("ANALYZE")
+
+
+@dataclass
+class SqlFilter:
+    """The result of compiling a filter list: a WHERE condition with its parameters and what went into it."""
+
+    conditions: list[str] = field(default_factory=list)
+    params: list = field(default_factory=list)
+    applied: int = 0
+    skipped_columns: list[str] = field(default_factory=list)
+
+
+def compile_filters(filters: list[dict], columns: list[str]) -> SqlFilter:
+    """
+    Translates a list of filters into parameterized SQL conditions on the voters table.
+
+    Values are bound as the string labels the filter dropdowns show; SQLite converts them to the
+    column's type (e.g. registry numbers), so the comparison can use the column's index.
+
+    Args:
+        filters: Filter dicts with 'column' and 'values' keys, as kept in the apps' session state.
+            Filters without values are ignored; filters naming a column the table lacks are
+            reported in skipped_columns.
+        columns: The columns of the voters table.
+
+    Returns:
+        A SqlFilter whose conditions select the rows matching every applied filter.
+    """
+    result = SqlFilter()
+    for filt in filters:
+        column, values = filt.get("column"), filt.get("values")
+        if not values:
+            continue
+        if column not in columns:
+            result.skipped_columns.append(column)
+            continue
+        values = values if isinstance(values, list) else [values]
+        result.conditions.append(f'"{column}" IN ({", ".join("?" * len(values))})')
+        result.params.extend(str(value) for value in values)
+        result.applied += 1
+    return result
+
+
+@dataclass
+class SqlView:
+    """
+    A selection of voters kept as a WHERE condition instead of rows.
+
+    The SQL counterpart of filter_engine.RowView: narrowing a view (by filters, the vote-status
+    choice or a search) adds a condition, and only counts and the visible page are read from the
+    database, so a session's memory does not grow with the roll.
+    """
+
+    pool: storage.ConnectionPool
+    conditions: tuple[str, ...] = ()
+    params: tuple = ()
+    ids: np.ndarray | None = None  # Restricts the view to these voter_ids, in this order (search hits)
+
+    @classmethod
+    def from_filters(cls, pool: storage.ConnectionPool, sql_filter: SqlFilter) -> "SqlView":
+        return cls(pool, tuple(sql_filter.conditions), tuple(sql_filter.params))
+
+    def _where(self, ids: np.ndarray | None = None) -> tuple[str, list]:
+        conditions, params = list(self.conditions), list(self.params)
+        ids = self.ids if ids is None else ids
+        if ids is not None:
+            conditions.append(f'"{storage.ID_COLUMN}" IN ({", ".join("?" * len(ids))})')
+            params.extend(int(pid) for pid in ids)
+        return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+    def _read(self, query: str, params: list) -> pd.DataFrame:
+        with self.pool.connection() as conn:
+            rows = pd.read_sql_query(query, conn, params=params)
+        instrumentation.add_rows(read=len(rows))
+        return rows
+
+    def _matching_ids(self) -> np.ndarray:
+        # The restricting ids that also pass the conditions, in their given order
+        if not len(self.ids):
+            return self.ids
+        where, params = self._where()
+        found = self._read(f'SELECT "{storage.ID_COLUMN}" FROM {storage.TABLE_NAME}{where}', params)
+        return self.ids[np.isin(self.ids, found[storage.ID_COLUMN].to_numpy())]
+
+    def __len__(self) -> int:
+        if self.ids is not None:
+            return len(self._matching_ids())
+        where, params = self._where()
+        with self.pool.connection() as conn:
+            return conn.execute(f"SELECT COUNT(*) FROM {storage.TABLE_NAME}{where}", params).fetchone()[0]
+
+    @property
+    def empty(self) -> bool:
+        return len(self) == 0
+
+    @property
+    def is_full(self) -> bool:
+        return not self.conditions and self.ids is None
+
+    @property
+    def nbytes(self) -> int:
+        return 0 if self.ids is None else self.ids.nbytes
+
+    def where_voted(self, voted: bool) -> "SqlView":
+        """Narrows the view to the voters who have (or have not) voted."""
+        return SqlView(self.pool, (*self.conditions, "voted != 0" if voted else "voted = 0"), self.params, self.ids)
+
+    def restrict(self, voter_ids: list) -> "SqlView":
+        """Narrows the view to the given voter_ids and orders it like them, e.g. ranked search hits."""
+        ids = np.asarray(voter_ids, dtype=np.int64)
+        if self.ids is not None:
+            ids = ids[np.isin(ids, self.ids)]
+        return SqlView(self.pool, self.conditions, self.params, ids)
+
+    def members(self, voter_ids: list) -> list[int]:
+        """Returns those of the given voter_ids the view holds, in the given order."""
+        return self.restrict(voter_ids)._matching_ids().tolist()
+
+    def counts(self, pending: dict | None = None) -> tuple[int, int]:
+        """
+        Counts the voters of the view and how many of them voted, in one aggregate query.
+
+        Args:
+            pending: {voter_id: voted} toggles not committed yet; they are counted as if they were.
+
+        Returns:
+            (voted, total).
+        """
+        ids = self._matching_ids() if self.ids is not None else None
+        where, params = self._where(ids)
+        with self.pool.connection() as conn:
+            total, voted = conn.execute(
+                f"SELECT COUNT(*), COALESCE(SUM(voted != 0), 0) FROM {storage.TABLE_NAME}{where}", params
+            ).fetchone()
+            if pending:
+                # Only the pending voters inside the view are read back to correct the count
+                where, params = self._where(np.fromiter(pending, dtype=np.int64) if ids is None else ids)
+                for pid, saved in conn.execute(
+                    f'SELECT "{storage.ID_COLUMN}", voted FROM {storage.TABLE_NAME}{where}', params
+                ):
+                    if pid in pending:
+                        voted += bool(pending[pid]) - bool(saved)
+        return int(voted), int(total)
+
+    def take(self, start: int = 0, stop: int | None = None) -> pd.DataFrame:
+        """Reads the rows of the view in [start, stop), e.g. the visible page, with their saved votes."""
+        if self.ids is not None:
+            return storage.fetch_rows(self.pool, self._matching_ids()[start:stop].tolist())
+        where, params = self._where()
+        limit = -1 if stop is None else max(stop - start, 0)
+        return self._read(f"{storage.SELECT_ALL_SQL}{where} ORDER BY rowid LIMIT ? OFFSET ?", [*params, limit, start])
+
+    def value_counts(self, column: str) -> pd.DataFrame:
+        """Counts the voters of the view per value of a column, most frequent first, with how many voted."""
+        where, params = self._where(self._matching_ids() if self.ids is not None else None)
+        return self._read(
+            f'SELECT "{column}" AS value, COUNT(*) AS total, COALESCE(SUM(voted != 0), 0) AS voted '
+            f'FROM {storage.TABLE_NAME}{where} GROUP BY "{column}" ORDER BY COUNT(*) DESC',
+            params,
+        )
+
+
+def options(pool: storage.ConnectionPool, column: str) -> list[str]:
+    """Returns the labels of a column's values for the filter dropdowns, most frequent first."""
+    counts = SqlView(pool).value_counts(column)
+    return [str(value) for value in counts["value"] if not pd.isna(value)]
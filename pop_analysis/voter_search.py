@@ -0,0 +1,180 @@
+import re
+import threading
+from typing import Callable
+
+import pandas as pd
+
+try:
+    from . import storage
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import storage
+
+FTS_TABLE_NAME = "voters_fts"
+VOCAB_TABLE_NAME = "voters_fts_vocab"
+# Voter table columns indexed for lookup, with the FTS column each one is stored under
+SEARCH_COLUMNS = {"الاسم": "name", "الشهرة": "family", "اسم الاب": "father", "رقم السجل": "registry"}
+# bm25 weights in FTS column order: first and family names count more than father's name or registry
+RANK_WEIGHTS = "3.0, 3.0, 1.0, 1.0"
+DEFAULT_LIMIT = 50
+# Ranked matches handed to a search's `within` check at a time, until `limit` of them are kept
+WITHIN_BATCH = 1_000
+FUZZY_MIN_SIMILARITY = 0.4
+FUZZY_MAX_EXPANSIONS = 8
+
+# Harakat and superscript alef, Quranic annotation marks, tatweel
+_DIACRITICS = re.compile("[\u064b-\u065f\u0670\u0610-\u061a\u06d6-\u06ed\u0640]")
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_LETTER_VARIANTS = str.maketrans(
+    {
+        "\u0623": "\u0627",  # alef with hamza above -> alef
+        "\u0625": "\u0627",  # alef with hamza below -> alef
+        "\u0622": "\u0627",  # alef with madda -> alef
+        "\u0671": "\u0627",  # alef wasla -> alef
+        "\u0649": "\u064a",  # alef maqsura -> ya
+        "\u0626": "\u064a",  # ya with hamza -> ya
+        "\u0624": "\u0648",  # waw with hamza -> waw
+        "\u0629": "\u0647",  # ta marbuta -> ha
+    }
+)
+
+
+def normalize_arabic(text: object) -> str:
+    """
+    Folds the spelling variants volunteers and clerks mix up, so they compare equal.
+
+    Alef forms (أ إ آ ٱ) become ا, alef maqsura and hamza-on-ya become ي, hamza-on-waw becomes و,
+    ta marbuta becomes ه, and diacritics, tatweel and punctuation are dropped.
+    """
+    if text is None or (isinstance(text, float) and pd.isna(text)):
+        return ""
+    text = _DIACRITICS.sub("", str(text)).translate(_LETTER_VARIANTS)
+    return " ".join(_PUNCTUATION.sub(" ", text).lower().split())
+
+
+def trigrams(word: str) -> set[str]:
+    """Returns the character trigrams of a word, padded so that short names still get a few."""
+    padded = f"  {word} "
+    return {a + b + c for a, b, c in zip(padded, padded[1:], padded[2:])}
+
+
+_vocabularies: dict[str, dict[str, set[str]]] = {}
+_vocabularies_lock = threading.Lock()
+
+
+def build_index(pool: storage.ConnectionPool):
+    """(Re)builds the full-text index from the voters table; run whenever the table is replaced."""
+    fts_columns = ", ".join(SEARCH_COLUMNS.values())
+    with pool.connection() as conn:
+        present = {row[1] for row in conn.execute(f"PRAGMA table_info({storage.TABLE_NAME})")}
+        selected = ", ".join(f'"{col}"' if col in present else "NULL" for col in SEARCH_COLUMNS)
+        rows = conn.execute(f'SELECT "{storage.ID_COLUMN}", {selected} FROM {storage.TABLE_NAME}').fetchall()
+    placeholders = ", ".join("?" * (len(SEARCH_COLUMNS) + 1))
+    with pool.transaction() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS {VOCAB_TABLE_NAME}")
+        conn.execute(f"DROP TABLE IF EXISTS {FTS_TABLE_NAME}")
+        conn.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE_NAME} USING fts5("
+            f"{fts_columns}, voter_id UNINDEXED, tokenize = 'unicode61 remove_diacritics 2')"
+        )
+        conn.execute(f"CREATE VIRTUAL TABLE {VOCAB_TABLE_NAME} USING fts5vocab({FTS_TABLE_NAME}, 'row')")
+        conn.executemany(
+            f"INSERT INTO {FTS_TABLE_NAME} ({fts_columns}, voter_id) VALUES ({placeholders})",
+            ([*(normalize_arabic(value) for value in row[1:]), row[0]] for row in rows),
+        )
+    with _vocabularies_lock:
+        _vocabularies.pop(pool.db_file, None)
+
+
+def ensure_index(pool: storage.ConnectionPool):
+    """Builds the full-text index if the database does not have one yet (e.g. it predates search)."""
+    with pool.connection() as conn:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (FTS_TABLE_NAME,)).fetchone()
+    if not exists:
+        build_index(pool)
+
+
+def _vocabulary(pool: storage.ConnectionPool) -> dict[str, set[str]]:
+    """Returns the indexed terms with their trigrams, read once per index build."""
+    with _vocabularies_lock:
+        vocabulary = _vocabularies.get(pool.db_file)
+    if vocabulary is None:
+        with pool.connection() as conn:
+            terms = [row[0] for row in conn.execute(f"SELECT term FROM {VOCAB_TABLE_NAME}")]
+        vocabulary = {term: trigrams(term) for term in terms}
+        with _vocabularies_lock:
+            _vocabularies[pool.db_file] = vocabulary
+    return vocabulary
+
+
+def _fuzzy_terms(pool: storage.ConnectionPool, term: str) -> list[str]:
+    """Returns the indexed terms closest to a (probably misspelled) term, best first."""
+    wanted = trigrams(term)
+    scored = []
+    for candidate, grams in _vocabulary(pool).items():
+        score = len(wanted & grams) / len(wanted | grams)
+        if score >= FUZZY_MIN_SIMILARITY:
+            scored.append((score, candidate))
+    scored.sort(reverse=True)
+    return [candidate for _, candidate in scored[:FUZZY_MAX_EXPANSIONS]]
+
+
+def _match_ids(pool: storage.ConnectionPool, match: str, limit: int | None) -> list[int]:
+    query = (
+        f"SELECT voter_id FROM {FTS_TABLE_NAME} WHERE {FTS_TABLE_NAME} MATCH ? "
+        f"ORDER BY bm25({FTS_TABLE_NAME}, {RANK_WEIGHTS}) LIMIT ?"
+    )
+    with pool.connection() as conn:
+        return [int(row[0]) for row in conn.execute(query, (match, -1 if limit is None else limit))]
+
+
+def search_ids(
+    pool: storage.ConnectionPool,
+    text: str,
+    limit: int = DEFAULT_LIMIT,
+    within: Callable[[list[int]], list[int]] | None = None,
+) -> list[int]:
+    """
+    Finds voters by first name, family name, father's name or registry number.
+
+    Every typed term must match the start of a word in one of those columns ("جو مخل" finds
+    "جورج مخلوف"); results are ranked with bm25. When that gives fewer than `limit` voters, terms are
+    also expanded to similarly spelled indexed words (trigram similarity), and those fuzzy matches
+    are appended after the prefix matches.
+
+    Args:
+        pool: The pool of the votes database.
+        text: What the volunteer typed, in any spelling variant.
+        limit: Maximum number of voters returned.
+        within: Keeps the voter_ids, of a list given in rank order, that the caller can show (e.g. the
+            ones inside the volunteer's filters), in the same order. It is applied before the limit, so
+            a name common across the roll still yields `limit` matches inside a narrow view.
+
+    Returns:
+        Matching voter_ids, best match first.
+    """
+    terms = normalize_arabic(text).split()
+    if not terms:
+        return []
+    ensure_index(pool)
+    found, seen = [], set()
+
+    def add(ranked: list[int]):
+        for start in range(0, len(ranked), WITHIN_BATCH):
+            stop = start + WITHIN_BATCH
+            batch = [voter_id for voter_id in ranked[start:stop] if voter_id not in seen]
+            for voter_id in within(batch) if within and batch else batch:
+                found.append(voter_id)
+                seen.add(voter_id)
+                if len(found) >= limit:
+                    return
+
+    # Without a `within` check the database applies the limit; with one, every match is ranked and checked
+    fetch_limit = None if within else limit
+    add(_match_ids(pool, " AND ".join(f'"{term}"*' for term in terms), fetch_limit))
+    if len(found) < limit:
+        clauses = []
+        for term in terms:
+            alternatives = [f'"{term}"*', *(f'"{word}"' for word in _fuzzy_terms(pool, term))]
+            clauses.append(f"({' OR '.join(alternatives)})")
+        add(_match_ids(pool, " AND ".join(clauses), fetch_limit))
+    return found
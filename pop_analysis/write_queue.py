@@ -0,0 +1,191 @@
+import queue
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+try:
+    from . import storage
+except ImportError:  # Imported as a top-level module by `streamlit run pop_analysis/streamlit_app.py`
+    import storage
+
+# How long the writer keeps collecting toggles after the first one before committing them together
+GROUP_COMMIT_SECONDS = 0.05
+MAX_BATCH_CHANGES = 5_000
+MAX_ATTEMPTS = 5
+RETRY_BACKOFF_SECONDS = 0.2
+
+PENDING = "pending"
+ACKNOWLEDGED = "acknowledged"
+FAILED = "failed"
+
+
+@dataclass
+class WriteTicket:
+    """One submitted batch of vote toggles and what became of it."""
+
+    ticket: int
+    changes: dict  # {voter_id: voted}
+    submitted_at: float
+    status: str = PENDING
+    attempts: int = 0
+    committed_at: float | None = None
+    error: str | None = None
+
+    @property
+    def latency(self) -> float | None:
+        """Seconds from submit() to the commit that made the toggles durable."""
+        return None if self.committed_at is None else self.committed_at - self.submitted_at
+
+
+class VoteWriter:
+    """
+    Writes vote toggles to the database from a background thread.
+
+    submit() returns at once with a ticket; the caller applies the toggles to its in-memory roll
+    optimistically. The writer thread collects everything submitted within GROUP_COMMIT_SECONDS
+    (by every session of the process) and commits it in one transaction, retrying with backoff
+    while the database is locked. Tickets move from 'pending' to 'acknowledged' once committed,
+    or to 'failed' once the attempts are exhausted, so the UI can show which ticks are saved.
+    """
+
+    def __init__(
+        self,
+        db_file: str,
+        group_commit_seconds: float = GROUP_COMMIT_SECONDS,
+        max_attempts: int = MAX_ATTEMPTS,
+        retry_backoff_seconds: float = RETRY_BACKOFF_SECONDS,
+    ):
+        self.db_file = db_file
+        self.group_commit_seconds = group_commit_seconds
+        self.max_attempts = max_attempts
+        self.retry_backoff_seconds = retry_backoff_seconds
+        self._queue: queue.Queue[WriteTicket | None] = queue.Queue()
+        self._tickets: dict[int, WriteTicket] = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._next_ticket = 1
+        self._unfinished = 0
+        self.commits = 0
+        self.retries = 0
+        self._thread = threading.Thread(target=self._run, name=f"vote-writer:{db_file}", daemon=True)
+        self._thread.start()
+
+    def submit(self, changes: dict) -> int:
+        """Queues {voter_id: voted} toggles for the next group commit and returns their ticket number."""
+        with self._lock:
+            ticket = WriteTicket(self._next_ticket, dict(changes), time.time())
+            self._next_ticket += 1
+            self._tickets[ticket.ticket] = ticket
+            self._unfinished += 1
+        self._queue.put(ticket)
+        return ticket.ticket
+
+    def ticket(self, ticket: int) -> WriteTicket | None:
+        """Returns a ticket's record; None once it has been forgotten."""
+        with self._lock:
+            return self._tickets.get(ticket)
+
+    def forget(self, tickets: list[int]):
+        """Drops finished tickets the caller has already reported."""
+        with self._lock:
+            for ticket in tickets:
+                record = self._tickets.get(ticket)
+                if record is not None and record.status != PENDING:
+                    del self._tickets[ticket]
+
+    def pending_votes(self) -> dict:
+        """The {voter_id: voted} toggles submitted but not yet committed, across all sessions; later toggles win."""
+        with self._lock:
+            pending = [t for t in self._tickets.values() if t.status == PENDING]
+        votes = {}
+        for ticket in sorted(pending, key=lambda t: t.ticket):
+            votes.update(ticket.changes)
+        return votes
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Waits until every submitted ticket is acknowledged or failed; False on timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._idle:
+            while self._unfinished:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._idle.wait(remaining)
+        return True
+
+    def close(self, timeout: float | None = 5.0):
+        """Commits what is queued and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _collect(self, first: WriteTicket) -> tuple[list[WriteTicket], bool]:
+        # Group commit: gather what arrives shortly after the first ticket, up to MAX_BATCH_CHANGES
+        batch, size, stop = [first], len(first.changes), False
+        deadline = time.monotonic() + self.group_commit_seconds
+        while size < MAX_BATCH_CHANGES:
+            remaining = deadline - time.monotonic()
+            try:
+                ticket = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if ticket is None:
+                stop = True
+                break
+            batch.append(ticket)
+            size += len(ticket.changes)
+        return batch, stop
+
+    def _commit(self, batch: list[WriteTicket]):
+        merged = {}
+        for ticket in batch:
+            merged.update(ticket.changes)  # Tickets are in submit order, so the last toggle of a voter wins
+        error = None
+        missing = set()
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                pool = storage.get_pool(self.db_file)
+                if storage.update_voted(pool, merged) < len(merged):
+                    # Some voters are gone, e.g. removed or renumbered by a concurrent merge: their toggles are lost
+                    missing = set(merged) - set(storage.fetch_rows(pool, list(merged))[storage.ID_COLUMN].tolist())
+                error = None
+                break
+            except sqlite3.OperationalError as e:
+                error = str(e)
+                if "locked" not in error and "busy" not in error:
+                    break  # Not worth retrying, e.g. the table was dropped by a reset
+                if attempt < self.max_attempts:  # Locked beyond the pool's busy timeout: back off and retry
+                    self.retries += 1
+                    time.sleep(self.retry_backoff_seconds * 2 ** (attempt - 1))
+            except Exception as e:
+                error = str(e)
+                break
+        now = time.time()
+        with self._idle:
+            for ticket in batch:
+                ticket.attempts = attempt
+                lost = sorted(missing.intersection(ticket.changes))
+                if error is None and not lost:
+                    ticket.status, ticket.committed_at = ACKNOWLEDGED, now
+                elif error is None:
+                    ticket.status, ticket.error = FAILED, f"voter_id not in the voters table: {lost[:5]}"
+                else:
+                    ticket.status, ticket.error = FAILED, error
+            if error is None:
+                self.commits += 1
+            self._unfinished -= len(batch)
+            self._idle.notify_all()
+        if error is not None:
+            print(f"Vote writer gave up on {len(merged)} toggles after {attempt} attempt(s): {error}")
+        elif missing:
+            print(f"Vote writer dropped {len(missing)} toggles of voters no longer in the table")
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is None:
+                return
+            batch, stop = self._collect(first)
+            self._commit(batch)
+            if stop:
+                return
@@ -0,0 +1,62 @@
+# Read-only turnout dashboard for the campaign room, run next to the tracking app:
+#   streamlit run turnout_dashboard.py --server.port 8502
+# It never loads the voter table: one TurnoutFeed per process follows the vote_changes log written by
+# votes_tracking.py, so any number of open dashboards share the same few small reads.
+import os
+
+import streamlit as st
+
+from pop_analysis import storage
+from pop_analysis.turnout_feed import TurnoutFeed
+
+DB_FILE = "votes_data.db"
+REFRESH_SECONDS = 5
+# Labels for the turnout dimensions a viewer can break turnout down by
+GROUP_LABELS = {"الشهرة": "العائلة", "رقم السجل": "رقم السجل", "الجنس": "الجنس", "مذهب الشخصي": "المذهب"}
+
+
+@st.cache_resource
+def get_feed(db_file):
+    """Returns the turnout feed shared by every viewer of this process."""
+    return TurnoutFeed(storage.get_pool(db_file))
+
+
+st.set_page_config(layout="wide")
+st.title("نسبة الاقتراع المباشرة")
+
+if not os.path.exists(DB_FILE):
+    st.info("قاعدة البيانات غير موجودة بعد. شغّل تطبيق تتبع الناخبين أولاً.")
+    st.stop()
+
+group_by = st.sidebar.selectbox("تقسيم حسب", list(GROUP_LABELS), format_func=GROUP_LABELS.get)
+top_n = st.sidebar.number_input("عدد المجموعات المعروضة", min_value=5, max_value=500, value=25, step=5)
+
+
+@st.fragment(run_every=REFRESH_SECONDS)
+def show_turnout():
+    feed = get_feed(DB_FILE)
+    try:
+        feed.refresh()
+    except Exception as e:
+        st.error(f"خطأ في قراءة سجل التصويت: {e}")
+        return
+    if feed.turnout is None:
+        st.info("قاعدة البيانات لا تحتوي على سجل التصويت بعد. افتح تطبيق تتبع الناخبين مرة لترقيتها.")
+        return
+
+    totals = feed.summary().iloc[0]
+    col1, col2, col3 = st.columns(3)
+    col1.metric("صوّت", int(totals["voted"]))
+    col2.metric("المجموع", int(totals["total"]))
+    col3.metric("نسبة الاقتراع", f"{totals['turnout']:.1%}" if totals["total"] else "-")
+
+    groups = feed.summary([group_by]).head(int(top_n))
+    st.dataframe(
+        groups.rename(columns={group_by: GROUP_LABELS[group_by], "total": "المجموع", "voted": "صوّت"}),
+        column_config={"turnout": st.column_config.ProgressColumn("نسبة الاقتراع", min_value=0.0, max_value=1.0)},
+        hide_index=True,
+    )
+    st.caption(f"آخر تحديث للسجل: #{feed.last_seq} — يتم التحديث كل {REFRESH_SECONDS} ثوانٍ")
+
+
+show_turnout()
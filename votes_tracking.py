@@ -1,130 +1,448 @@
+import atexit
 import os
-import sqlite3
+import time
 
+import numpy as np
 import pandas as pd
 import streamlit as st
 
+from pop_analysis import data_analyzer as da
+from pop_analysis import (
+    compact_roll,
+    instrumentation,
+    paging,
+    roll_cache,
+    roll_ingest,
+    startup,
+    storage,
+    voter_ids,
+    voter_query,
+    voter_search,
+    write_queue,
+)
+
 DB_FILE = "votes_data.db"
 EXCEL_FILE = "data/final--القاع-2025-filtered.xlsx"
-TABLE_NAME = "voters"
+# A directory of village workbooks to track the whole district instead of EXCEL_FILE
+ROLL_DIR = os.environ.get("VOTES_ROLL_DIR")
+# "sql" keeps the roll in SQLite: filters, the vote-status choice and the counts become queries and only
+# the visible page is read, instead of every process holding the whole roll in memory ("memory")
+SQL_BACKEND = os.environ.get("VOTES_BACKEND", "memory") == "sql"
+# How often each session polls the vote change log for other volunteers' ticks
+CHANGE_POLL_SECONDS = 2
+CHANGE_POLL_LIMIT = 10_000
+
+
+def build_database(build):
+    """Startup build, run once per server process on a background thread (see start_database_build).
+    On first launch it creates the database from the roll's columnar cache: an 'voter_id' column and a
+    'voted' column are added and it is saved to SQLite. An existing database only gets the schema objects
+    it may predate. Either way the shared roll is loaded (in SQL mode, the filter indexes are built instead),
+    so sessions find the dataset warm.
+    Returns True if the database was built."""
+    pool = storage.get_pool(DB_FILE)
+    built = not os.path.exists(DB_FILE)
+    if built:
+        try:
+            with build.phase("read_roll"):
+                if ROLL_DIR:
+                    # Village workbooks are parsed in parallel into the partitioned store, which assigns the ids
+                    ingest_report = roll_ingest.ingest_directory(ROLL_DIR)
+                    print(f"Ingested rolls for database init: {ingest_report}")
+                    df = roll_ingest.read_store(villages=list(ingest_report.villages))
+                else:
+                    df, load_report = roll_cache.read_roll(EXCEL_FILE)
+                    print(f"Loaded roll for database init: {load_report}")
+                    # Define columns to drop
+                    columns_to_drop = ["البلدة أو الحي", "القضاء", "المحافظة", "الدائرة الانتخابية"]
+                    # Drop the specified columns, ignoring errors if a column doesn't exist
+                    df = df.drop(columns=columns_to_drop, errors="ignore")
+            if "voter_id" not in df.columns:
+                with build.phase("assign_ids"):
+                    # Add an ID column at the beginning, derived from each voter's identity so re-imports keep it
+                    df.insert(0, "voter_id", voter_ids.assign_ids(df))
+            with build.phase("write_sqlite"):
+                df["voted"] = False  # Add 'voted' column with default False
+                storage.write_table(pool, df)
+                with pool.transaction() as conn:
+                    storage.write_meta(conn, "id_scheme", voter_ids.ID_SCHEME)
+            with build.phase("search_index"):
+                voter_search.build_index(pool)
+        except Exception:
+            storage.remove_database(DB_FILE)
+            raise
+    else:
+        with build.phase("upgrade_schema"):
+            storage.upgrade_schema(pool)
+    with build.phase("filter_indexes" if SQL_BACKEND else "load_roll"):
+        session_table()
+    return built
+
+
+@st.cache_resource
+def start_database_build(db_file):
+    """Starts the startup build of the database once per server process; every session shares it."""
+    return startup.BackgroundBuild(f"votes database {db_file}", build_database)
 
 
 def init_db():
-    """Initializes the database. If the DB file exists, it does nothing.
-    Otherwise, it loads data from the Excel file, adds an 'voter_id' column,
-    adds a 'voted' column, and saves it to the SQLite DB."""
-    if not os.path.exists(DB_FILE):
-        try:
-            df = pd.read_excel(EXCEL_FILE)
-            # Define columns to drop
-            columns_to_drop = ["البلدة أو الحي", "القضاء", "المحافظة", "الدائرة الانتخابية"]
-            # Drop the specified columns, ignoring errors if a column doesn't exist
-            df = df.drop(columns=columns_to_drop, errors="ignore")
-
-            # Add a unique ID column at the beginning
-            df.insert(0, "voter_id", range(len(df)))
-            df["voted"] = False  # Add 'voted' column with default False
-            conn = sqlite3.connect(DB_FILE)
-            df.to_sql(TABLE_NAME, conn, if_exists="replace", index=False)
-            conn.close()
-            st.success(f"Database initialized from {EXCEL_FILE}, 'voter_id' and 'voted' columns added.")
-            st.session_state.db_just_initialized = True
-        except Exception as e:
-            st.error(f"Error initializing database: {e}")
-            if os.path.exists(DB_FILE):
-                os.remove(DB_FILE)
-            st.stop()
-    elif "db_just_initialized" not in st.session_state:
-        st.session_state.db_just_initialized = False
+    """Makes sure the database is ready. The first run in a server process starts the startup build in
+    the background and waits for it with a progress message, as does every session arriving meanwhile;
+    later runs only find the finished build in the resource cache.
+    Returns True if this run had to wait for the build (a cold start)."""
+    build = start_database_build(DB_FILE)
+    if build.state == startup.DONE and not os.path.exists(DB_FILE):
+        start_database_build.clear()  # The file was removed outside the app: build it again
+        build = start_database_build(DB_FILE)
+    waited = build.running
+    if waited:
+        progress = st.empty()
+        while not build.wait(0.25):
+            progress.info(f"جارٍ تجهيز قاعدة البيانات ({build.current_phase or '...'})، {build.elapsed:.1f} ث")
+        progress.empty()
+    if build.state == startup.FAILED:
+        st.error(f"Error initializing database: {build.error}")
+        start_database_build.clear()  # The next run tries again
+        st.stop()
+    if waited and build.result:
+        st.success(f"Database initialized from {ROLL_DIR or EXCEL_FILE}, 'voter_id' and 'voted' columns added.")
+    return waited
+
+
+@st.cache_resource(max_entries=2)
+def get_shared_roll(db_file, data_version):
+    """Reads the voters table once per process into a compact roll shared by every session.
+    A new data_version (the table was replaced) loads a new roll. The roll remembers the change log
+    position it was read at, so later ticks are merged into it from the log (see follow_other_volunteers)."""
+    pool = storage.get_pool(db_file)
+    df, last_seq = storage.read_table_snapshot(pool)
+    roll = compact_roll.SharedRoll(df, version=data_version, last_seq=last_seq)
+    print(f"Loaded shared voter roll: {roll.memory_report()}")
+    return roll
+
+
+def current_roll():
+    """Returns the shared roll of the current database version."""
+    with storage.get_pool(DB_FILE).connection() as conn:
+        version = storage.data_version(conn)
+    return get_shared_roll(DB_FILE, version)
+
+
+@st.cache_resource(max_entries=2)
+def get_table_schema(db_file, data_version):
+    """SQL mode: creates the filter indexes once per data version and returns the voters table's columns
+    (an empty frame); no rows are loaded."""
+    pool = storage.get_pool(db_file)
+    voter_query.ensure_indexes(pool)
+    return storage.read_empty(pool)
+
+
+def session_table():
+    """Returns what sessions hold of the current voters table: the shared roll, or in SQL mode its columns."""
+    if not SQL_BACKEND:
+        return current_roll().df
+    with storage.get_pool(DB_FILE).connection() as conn:
+        version = storage.data_version(conn)
+    return get_table_schema(DB_FILE, version)
+
+
+def full_view(df):
+    """Returns the unfiltered view of the voters: row positions into the roll, or in SQL mode a query."""
+    return voter_query.SqlView(storage.get_pool(DB_FILE)) if SQL_BACKEND else da.RowView(df)
+
+
+def voters_loaded():
+    """True if the session has a voters table to show; in SQL mode it only holds the table's columns."""
+    df = st.session_state.df_votes
+    return df is not None and (SQL_BACKEND or not df.empty)
 
 
 def load_data_from_db():
-    """Loads data from the SQLite database into a pandas DataFrame."""
+    """Loads the voter table from the SQLite database, as the compact roll shared by all sessions
+    (in SQL mode, only its columns)."""
     if not os.path.exists(DB_FILE):
         st.warning("ملف قاعدة البيانات غير موجود. يرجى التهيئة أو إعادة التعيين.")
         return None
     try:
-        conn = sqlite3.connect(DB_FILE)
-        df = pd.read_sql_query(f"SELECT * FROM {TABLE_NAME}", conn)
-        conn.close()
-        return df
+        return session_table()
     except Exception as e:
         st.error(f"خطأ في تحميل البيانات من قاعدة البيانات: {e}")
         return None
 
 
-def update_voted_status(person_id, id_column_name, voted_status):  # id_column_name will be 'voter_id'
-    """Updates the 'voted' status for a specific person in the database using voter_id."""
+@st.cache_resource
+def get_vote_writer(db_file):
+    """One background writer per process: every session's vote toggles are group-committed through it."""
+    writer = write_queue.VoteWriter(db_file)
+    atexit.register(writer.close)  # Commit what is still queued when the server stops
+    return writer
+
+
+def submit_voted_statuses(changes):
+    """Queues a batch of {voter_id: voted} changes for the background writer and returns its ticket.
+    The caller has already applied them to the roll, so the rerun does not wait for the disk."""
+    ticket = get_vote_writer(DB_FILE).submit(changes)
+    st.session_state.setdefault("vote_tickets", []).append(ticket)
+    st.session_state.setdefault("own_votes", {}).update(changes)  # Their echo in the change log is not news
+    return ticket
+
+
+def overlay_pending_votes(df_display, id_column_name):
+    """Shows toggles still waiting for their commit on a page read from the database."""
+    pending = get_vote_writer(DB_FILE).pending_votes()
+    if pending and not df_display.empty:
+        waiting = df_display[id_column_name].isin(pending.keys())
+        if waiting.any():
+            df_display.loc[waiting, "voted"] = df_display.loc[waiting, id_column_name].map(pending).astype(bool)
+
+
+@st.fragment(run_every=1)
+def vote_write_status():
+    """Reports this session's queued vote writes as they are acknowledged, and undoes the ones that failed."""
+    writer = get_vote_writer(DB_FILE)
+    tickets = [writer.ticket(ticket) for ticket in st.session_state.get("vote_tickets", [])]
+    tickets = [ticket for ticket in tickets if ticket is not None]
+    pending = [ticket for ticket in tickets if ticket.status == write_queue.PENDING]
+    acknowledged = [ticket for ticket in tickets if ticket.status == write_queue.ACKNOWLEDGED]
+    failed = [ticket for ticket in tickets if ticket.status == write_queue.FAILED]
+    st.session_state.vote_tickets = [ticket.ticket for ticket in pending]
+    writer.forget([ticket.ticket for ticket in acknowledged + failed])
+
+    if acknowledged:
+        st.session_state.votes_saved = st.session_state.get("votes_saved", 0) + sum(
+            len(ticket.changes) for ticket in acknowledged
+        )
+        st.session_state.last_write_latency = max(ticket.latency for ticket in acknowledged)
+    if pending:
+        st.caption(f"⏳ {sum(len(ticket.changes) for ticket in pending)} تغيير قيد الحفظ...")
+    elif st.session_state.get("votes_saved"):
+        latency_ms = st.session_state.get("last_write_latency", 0) * 1000
+        st.caption(f"✓ تم حفظ {st.session_state.votes_saved} تغيير في قاعدة البيانات (آخر حفظ: {latency_ms:.0f} ms)")
+    if failed:
+        voter_ids_failed = sorted({pid for ticket in failed for pid in ticket.changes})
+        st.session_state.vote_write_error = f"فشل حفظ {len(voter_ids_failed)} تغيير: {failed[-1].error}"
+        try:
+            # Put the roll back to what the database holds for these voters
+            saved = storage.fetch_rows(storage.get_pool(DB_FILE), voter_ids_failed)
+            apply_voted_changes(
+                st.session_state.df_votes, dict(zip(saved["voter_id"], saved["voted"].astype(bool))), "voter_id"
+            )
+        except Exception as e:
+            print(f"Could not restore the votes of a failed write: {e}")
+        st.rerun()  # Redraw the whole page with the restored votes
+    if st.session_state.get("vote_write_error"):
+        st.error(st.session_state.vote_write_error)
+
+
+def mark_changes_seen():
+    """Records the data version and change log position the session's data now reflects."""
+    if SQL_BACKEND:
+        with storage.get_pool(DB_FILE).connection() as conn:
+            version, last_seq = storage.data_version(conn), storage.last_change_seq(conn)
+    else:
+        roll = current_roll()
+        version, last_seq = roll.version, roll.last_seq
+    st.session_state.seen_data_version = version
+    st.session_state.seen_change_seq = last_seq
+    st.session_state.own_votes = {}
+
+
+def others_changes(changed_ids, current_votes):
+    """Returns the changed voter_ids that are not the echo of this session's own ticks: voters it never
+    ticked, or whose current vote differs from the one it set. Echoes are forgotten once seen."""
+    own = st.session_state.get("own_votes", {})
+    others = [pid for pid, voted in zip(changed_ids, current_votes) if own.get(pid) is None or own[pid] != voted]
+    for pid in changed_ids:
+        own.pop(pid, None)
+    return others
+
+
+@st.fragment(run_every=CHANGE_POLL_SECONDS)
+def follow_other_volunteers():
+    """Polls the vote change log and merges other volunteers' ticks into what this session shows.
+    Only the entries after the last seen seq are read. The shared roll is patched with the changed voters
+    (one read per process and poll, however many sessions follow), and the page is redrawn only if one of
+    them is among this session's filtered rows. A replaced voters table reloads the page instead."""
+    pool = storage.get_pool(DB_FILE)
+    seen = st.session_state.get("seen_change_seq")
+    if seen is None:
+        return
+    with pool.connection() as conn:
+        version = storage.data_version(conn)
+    if version != st.session_state.get("seen_data_version"):
+        st.rerun()  # Reset, import or merge elsewhere: the load stage picks up the new table
+
+    view = st.session_state.get("filtered_view_votes")
+    if SQL_BACKEND:
+        changes, _ = storage.read_changes(pool, seen, CHANGE_POLL_LIMIT)
+        latest = changes.drop_duplicates("voter_id", keep="last")
+        changed = others_changes(latest["voter_id"].tolist(), latest["voted"].astype(bool).tolist())
+        relevant = bool(changed)  # The page and counts are queries: any tick may change them
+        last_seq = int(changes["seq"].iloc[-1]) if not changes.empty else seen
+    else:
+        roll = get_shared_roll(DB_FILE, version)
+        if time.monotonic() - roll.synced_at >= CHANGE_POLL_SECONDS / 2:
+            changes, changes_version = storage.read_changes(pool, roll.last_seq, CHANGE_POLL_LIMIT)
+            if changes_version == roll.version:
+                roll.apply_logged(changes, skip=get_vote_writer(DB_FILE).pending_votes().keys())
+        changed_ids = roll.changed_since(seen)
+        if changed_ids is None:  # Too far behind for the roll's history: redraw to be safe
+            changed, relevant = [], True
+        else:
+            changed_ids = pd.unique(changed_ids)
+            positions = roll.positions(changed_ids)
+            current = roll.df["voted"].to_numpy()[positions].tolist()
+            changed = others_changes(changed_ids.tolist(), current)
+            relevant = bool(changed) and (
+                view is None or view.is_full or np.isin(roll.positions(changed), view.positions).any()
+            )
+        last_seq = roll.last_seq
+
+    st.session_state.seen_change_seq = last_seq
+    if changed:
+        st.session_state.others_changes = st.session_state.get("others_changes", 0) + len(changed)
+    if st.session_state.get("others_changes"):
+        st.caption(f"🔄 {st.session_state.others_changes} تغيير من متطوعين آخرين ظهر في هذه الصفحة تلقائياً")
+    if relevant:
+        st.rerun()  # Redraw the page and counts with the merged ticks
+
+
+def filtered_turnout(filtered_view, applied_filters):
+    """Returns (voted, total) for the user's filters. When the filters only involve turnout dimensions
+    (family, registry, gender, religion), this is read from the trigger-maintained turnout table, which
+    also reflects other volunteers' ticks; otherwise, or while toggles are still queued for the writer (they
+    are in the roll but not yet in the turnout table), it is counted from the filtered rows. In SQL mode the
+    count is one aggregate query over the filter's indexes, corrected for the queued toggles."""
+    pending = get_vote_writer(DB_FILE).pending_votes()
+    if SQL_BACKEND and (pending or filtered_view.ids is not None):
+        return filtered_view.counts(pending)
+    if pending:
+        return int(filtered_view.values("voted").astype(bool).sum()), len(filtered_view)
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        # The id_column_name parameter is kept for consistency but should always be 'voter_id'
-        query = f'UPDATE {TABLE_NAME} SET voted = ? WHERE "{id_column_name}" = ?'
-        cursor.execute(query, (voted_status, person_id))
-        conn.commit()
-        conn.close()
-        return True
+        turnout = storage.read_turnout(storage.get_pool(DB_FILE), applied_filters)
     except Exception as e:
-        st.error(f"خطأ في تحديث حالة التصويت للمعرف {person_id} ({id_column_name}): {e}")
-        return False
+        print(f"Falling back to counting filtered rows, turnout table unavailable: {e}")
+        turnout = None
+    if turnout is not None and not turnout.empty:
+        return int(turnout["voted"].iloc[0]), int(turnout["total"].iloc[0])
+    if SQL_BACKEND:
+        return filtered_view.counts()
+    return int(filtered_view.values("voted").astype(bool).sum()), len(filtered_view)
+
+
+@st.cache_data(max_entries=64)
+def sql_filter_options(db_file, data_version, column):
+    """SQL mode: the filter dropdown labels of a column, grouped and counted in SQLite once per data version."""
+    return voter_query.options(storage.get_pool(db_file), column)
+
+
+def filter_options(df, column):
+    """Returns the filter dropdown labels of a column, most frequent first."""
+    if SQL_BACKEND:
+        with storage.get_pool(DB_FILE).connection() as conn:
+            version = storage.data_version(conn)
+        return sql_filter_options(DB_FILE, version, column)
+    return get_column_index(df).options(column)
+
+
+def get_column_index(df):
+    """Returns the filter ColumnIndex of the session's voter table, rebuilding it if the table was reloaded."""
+    roll = current_roll()
+    if roll.df is df:
+        return roll.index  # Built once per process alongside the shared roll
+    index = st.session_state.get("df_votes_index")
+    if index is None or index.df is not df:
+        index = da.ColumnIndex(df)
+        st.session_state.df_votes_index = index
+    return index
+
+
+def voter_positions(df, voter_ids):
+    """Returns the row positions of the given voter_ids in df (-1 for ids it does not hold), in the same order."""
+    roll = current_roll()
+    if roll.df is df:
+        return roll.positions(voter_ids)
+    return pd.Index(df[st.session_state.id_column_name]).get_indexer(voter_ids)
+
+
+def searchable_within(df, view):
+    """Returns the `within` check of voter_search.search_ids for a view: the voter_ids it holds, in order."""
+    if SQL_BACKEND:
+        return view.members
+    shown = np.zeros(len(df), dtype=bool)
+    shown[view.positions] = True
+
+    def within(voter_ids):
+        positions = voter_positions(df, voter_ids)
+        return [pid for pid, pos in zip(voter_ids, positions) if pos >= 0 and shown[pos]]
+
+    return within
+
+
+def collect_editor_changes(editor_state, df_display):
+    """Returns {voter_id: voted} for the checkboxes the volunteer changed, read from the editor's
+    edited_rows delta ({row position: {column: new value}}) instead of diffing the whole table.
+    df_display is indexed by voter_id, so each position is resolved to the voter shown there."""
+    changes = {}
+    if not editor_state:
+        return changes
+    voter_ids = df_display.index.to_numpy()
+    shown_voted = df_display["voted"].to_numpy()
+    for row_position, edits in editor_state.get("edited_rows", {}).items():
+        row_position = int(row_position)
+        if "voted" not in edits or not 0 <= row_position < len(voter_ids):
+            continue
+        new_voted = bool(edits["voted"])
+        if new_voted != bool(shown_voted[row_position]):  # Ticked then unticked again: nothing to save
+            changes[voter_ids[row_position].item()] = new_voted
+    return changes
+
+
+def apply_voted_changes(df, changes, id_column_name):
+    """Patches the 'voted' column of an in-memory DataFrame with {voter_id: voted} changes,
+    so the table does not have to be reloaded from the database after an edit."""
+    if df is None or df.empty or not changes:
+        return
+    roll = current_roll()
+    if roll.df is df:
+        roll.apply_voted(changes)  # The shared roll: every session sees the tick
+        return
+    ids = df[id_column_name]
+    mask = ids.isin(changes.keys())
+    if mask.any():
+        df.loc[mask, "voted"] = ids[mask].map(changes).astype(df["voted"].dtype)
+        index = st.session_state.get("df_votes_index")
+        if index is not None and index.df is df:
+            positions = np.flatnonzero(mask.to_numpy())
+            index.update("voted", positions, df["voted"].iloc[positions].tolist())
 
 
 def load_db_from_csv(uploaded_file):
-    """Loads data from an uploaded CSV file and replaces the current database."""
+    """Streams an uploaded CSV file into a staging table and swaps it in for the current database."""
     try:
-        df_csv = pd.read_csv(uploaded_file)
-
-        required_columns = ["voter_id", "voted"]
-        missing_cols = [col for col in required_columns if col not in df_csv.columns]
-        if missing_cols:
-            st.error(f"ملف CSV المرفوع ينقصه الأعمدة المطلوبة: {', '.join(missing_cols)}")
-            return False
-
-        if "voter_id" in df_csv.columns:
-            try:
-                df_csv["voter_id"] = df_csv["voter_id"].astype(int)
-            except ValueError:
-                st.error("لا يمكن تحويل عمود 'voter_id' إلى أرقام صحيحة. يرجى التحقق من البيانات.")
-                return False
-
-        if "voted" in df_csv.columns:
-            if df_csv["voted"].dtype != bool:
-                try:
-                    if df_csv["voted"].dtype == "object":
-                        df_csv["voted"] = df_csv["voted"].replace(
-                            {
-                                "true": True,
-                                "True": True,
-                                "TRUE": True,
-                                "false": False,
-                                "False": False,
-                                "FALSE": False,
-                                "1": True,
-                                1: True,
-                                "0": False,
-                                0: False,
-                            }
-                        )
-                    df_csv["voted"] = df_csv["voted"].astype(bool)
-                except Exception as e:
-                    st.error(
-                        f"لا يمكن تحويل عمود 'voted' ({df_csv['voted'].dtype}) إلى قيم منطقية: {e}. "
-                        "يرجى التأكد أن القيم هي True/False."
-                    )
-                    return False
-
-        conn = sqlite3.connect(DB_FILE)
-        df_csv.to_sql(TABLE_NAME, conn, if_exists="replace", index=False)
-        conn.close()
+        get_vote_writer(DB_FILE).flush(timeout=10)  # Toggles queued for the old table land before the swap
+        report = storage.import_csv(storage.get_pool(DB_FILE), uploaded_file)
+        voter_search.build_index(storage.get_pool(DB_FILE))
+        print(f"Imported CSV into the votes database: {report}")
 
         st.session_state.df_votes = None
-        st.session_state.filtered_df_votes = None
+        st.session_state.filtered_view_votes = None
         st.session_state.active_filters_votes = []
+        st.session_state.applied_filters_votes = []
         st.session_state.db_just_initialized = True
+        st.session_state.csv_import_report = report
 
         st.success("تم تحميل قاعدة البيانات بنجاح من ملف CSV.")
         return True
 
+    except storage.CsvImportError as e:
+        if e.reason == "missing_columns":
+            st.error(f"ملف CSV المرفوع ينقصه الأعمدة المطلوبة: {e.detail}")
+        elif e.reason == "voter_id":
+            st.error(f"لا يمكن تحويل عمود 'voter_id' إلى أرقام صحيحة فريدة ({e.detail}). يرجى التحقق من البيانات.")
+        else:
+            st.error(f"لا يمكن تحويل عمود 'voted' إلى قيم منطقية ({e.detail}). يرجى التأكد أن القيم هي True/False.")
+        return False
     except pd.errors.EmptyDataError:
         st.error("ملف CSV المرفوع فارغ.")
         return False
@@ -133,23 +451,100 @@ def load_db_from_csv(uploaded_file):
         return False
 
 
+def merge_roll_upload(uploaded_file):
+    """Merges a revised roll workbook into the database: only changed voters are written and votes are kept."""
+    pool = storage.get_pool(DB_FILE)
+    get_vote_writer(DB_FILE).flush(timeout=10)  # A rekey would leave queued toggles pointing at old ids
+    try:
+        df, file_report = roll_ingest.load_workbook(uploaded_file)
+        # The rows being revised are read from the table itself in SQL mode, where no roll is held
+        current = storage.read_table(pool) if SQL_BACKEND else current_roll().df
+        scope_column = None
+        if voter_ids.VILLAGE_COLUMN in current.columns:
+            # A district database: the workbook revises one village, the others are left alone
+            df.insert(0, voter_ids.VILLAGE_COLUMN, file_report.village)
+            scope_column = voter_ids.VILLAGE_COLUMN
+        df.insert(0, "voter_id", voter_ids.assign_ids(df))
+
+        with pool.connection() as conn:
+            id_scheme = storage.read_meta(conn, "id_scheme")
+        rekeyed = id_scheme != voter_ids.ID_SCHEME
+        if rekeyed:
+            # The table is still numbered by row position (or came from a CSV): move it onto identity ids first
+            stable = voter_ids.assign_ids(current)
+            storage.rekey(pool, dict(zip(current["voter_id"], stable)), voter_ids.ID_SCHEME)
+            current = current.assign(voter_id=stable)
+        if scope_column is not None:
+            current = current[current[scope_column] == file_report.village]
+        # Voters whose name or birth date was corrected keep their id, and so their vote
+        df["voter_id"], carried = voter_ids.carry_ids(df, current)
+        report = storage.merge_roll(pool, df, scope_column)
+        if report.changed or rekeyed:  # The search index holds voter_ids, so a rekey outdates it too
+            voter_search.build_index(pool)
+        print(f"Merged {file_report}: {report}, {carried} corrected voters kept their id")
+        st.session_state.roll_merge_report = report
+        return report
+    except storage.CsvImportError as e:
+        st.error(f"تعذر الدمج: يحتوي الملف على ناخبين مكررين ({e.detail}).")
+        return None
+    except Exception as e:
+        st.error(f"حدث خطأ أثناء دمج ملف Excel: {e}")
+        return None
+
+
+def reset_database():
+    """Removes the database and drops everything cached from it, so the next run rebuilds it from the roll.
+    Every cache holding data read from the database must be cleared here."""
+    get_vote_writer(DB_FILE).flush(timeout=10)  # Queued toggles must not recreate the removed file
+    storage.remove_database(DB_FILE)
+    get_shared_roll.clear()
+    get_table_schema.clear()
+    sql_filter_options.clear()
+    start_database_build.clear()
+    st.session_state.clear()  # Clear session state to trigger re-initialization
+
+
 st.set_page_config(layout="wide")
 st.title("تتبع الناخبين")
 
+# --- Time every stage of this rerun (shown in the debug panel and appended to the metrics file) ---
+rerun_profile = instrumentation.start("votes_tracking", st.session_state.get("rerun_profile"))
+st.session_state.rerun_profile = rerun_profile
+
 # --- Initialize DB on first run or if reset ---
-init_db()
+with instrumentation.stage("init_db"):
+    waited_for_build = init_db()
 
 # --- Load data into session state ---
-if "df_votes" not in st.session_state or st.session_state.get("db_just_initialized", False):
-    st.session_state.df_votes = load_data_from_db()
-    st.session_state.filtered_df_votes = st.session_state.df_votes
-    st.session_state.active_filters_votes = []
-    if "db_just_initialized" in st.session_state:  # Reset flag after loading
-        st.session_state.db_just_initialized = False
+with instrumentation.stage("load"):
+    roll_replaced = (  # Another session reset or re-imported the database, replacing the shared roll
+        st.session_state.get("df_votes") is not None
+        and os.path.exists(DB_FILE)
+        and st.session_state.df_votes is not session_table()
+    )
+    if "df_votes" not in st.session_state or st.session_state.get("db_just_initialized", False) or roll_replaced:
+        st.session_state.df_votes = load_data_from_db()
+        # The filtered rows are kept as positions into the shared roll (a RowView) or, in SQL mode, as a
+        # query (a SqlView), never as a copy
+        st.session_state.filtered_view_votes = (
+            full_view(st.session_state.df_votes) if st.session_state.df_votes is not None else None
+        )
+        st.session_state.active_filters_votes = []
+        st.session_state.applied_filters_votes = []  # The filters that produced filtered_view_votes
+        if st.session_state.df_votes is not None:
+            mark_changes_seen()  # Other volunteers' ticks are followed from here on
+        if "db_just_initialized" in st.session_state:  # Reset flag after loading
+            st.session_state.db_just_initialized = False
+
+# --- Startup time of this session: cold if it waited for the process's build, warm if it found it cached ---
+if "startup_report" not in st.session_state and st.session_state.df_votes is not None:
+    startup_seconds = sum(stage["seconds"] for stage in rerun_profile.stages if stage["stage"] in ("init_db", "load"))
+    st.session_state.startup_report = {"kind": "cold" if waited_for_build else "warm", "seconds": startup_seconds}
+    print(f"Session startup ({st.session_state.startup_report['kind']}): {startup_seconds:.3f}s")
 
 
 # --- Main App Logic (only runs if data is successfully loaded) ---
-if st.session_state.df_votes is not None and not st.session_state.df_votes.empty:
+if voters_loaded():
     df_original = st.session_state.df_votes
     columns_available = df_original.columns.tolist()
 
@@ -172,10 +567,10 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
         # Let's ensure the app can at least show the sidebar for reset.
         # To prevent further errors, we can clear the dataframe from session state here.
         st.session_state.df_votes = None
-        st.session_state.filtered_df_votes = None
+        st.session_state.filtered_view_votes = None
 
     # Proceed only if df_votes is still valid (it might have been cleared above)
-    if st.session_state.df_votes is not None and not st.session_state.df_votes.empty:
+    if voters_loaded():
         st.sidebar.header("عوامل التصفية")
 
         # === START OF REPLACEMENT FOR SIDEBAR FILTERING UI ===
@@ -220,22 +615,8 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
                 st.rerun()
             if selected_column != "لا شيء":
                 if selected_column in df_original.columns:
-                    # Calculate value counts and sort unique values by frequency
-                    value_counts = df_original[selected_column].value_counts()
-                    options_sorted_by_count = value_counts.index.tolist()
-
-                    display_options = []
-                    if options_sorted_by_count:
-                        try:
-                            display_options = [str(v) for v in options_sorted_by_count]
-                        except Exception as e_conv:
-                            st.warning(f"خطأ في تحويل خيار التصفية لـ '{selected_column}': {e_conv}. تأثرت الخيارات.")
-                            # Fallback to unique values if string conversion of value_counts index fails for some reason
-                            try:
-                                unique_values_fallback = df_original[selected_column].dropna().unique().tolist()
-                                display_options = [str(v) for v in unique_values_fallback if pd.notna(v)]
-                            except Exception as e_fallback_conv:
-                                st.error(f"خطأ حرج في تحويل خيار التصفية لـ '{selected_column}': {e_fallback_conv}")
+                    # Options come from the value-count index, kept current as votes are recorded
+                    display_options = filter_options(df_original, selected_column)
 
                     multiselect_label = f"قيم لـ '{selected_column}' (حسب العدد):"
 
@@ -268,49 +649,31 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
         reset_filters_button_votes = col2_sidebar.button("إعادة تعيين عوامل التصفية", key="reset_filters_btn_votes")
 
         if apply_filters_button_votes:
-            temp_df = df_original.copy()
-            filters_applied_count = 0
             try:
-                for filt in st.session_state.active_filters_votes:
-                    col = filt["column"]
-                    vals = filt["values"]
-                    if col != "لا شيء" and vals and col in temp_df.columns:  # Added check col in temp_df.columns
-                        col_type = df_original[col].dtype
-                        try:
-                            if pd.api.types.is_numeric_dtype(col_type):
-                                converted_vals = []
-                                for v in vals:
-                                    try:
-                                        converted_vals.append(pd.to_numeric(v))
-                                    except ValueError:
-                                        st.warning(f"تعذر تحويل '{v}' إلى رقم لـ '{col}'.")
-                                if not converted_vals:
-                                    continue
-                                temp_df = temp_df[temp_df[col].isin(converted_vals)]
-                            elif pd.api.types.is_datetime64_any_dtype(col_type):
-                                converted_vals = [pd.to_datetime(v, errors="coerce") for v in vals]
-                                converted_vals = [v for v in converted_vals if pd.notnull(v)]
-                                if not converted_vals:
-                                    continue
-                                temp_df = temp_df[temp_df[col].isin(converted_vals)]
-                            else:
-                                temp_df = temp_df[temp_df[col].astype(str).isin(map(str, vals))]
-                        except Exception as e_filter_type:
-                            st.warning(
-                                f"خطأ في التصفية على '{col}' بـ '{vals}': {e_filter_type}. باستخدام مطابقة السلسلة."
-                            )
-                            temp_df = temp_df[temp_df[col].astype(str).isin(map(str, vals))]
-                        filters_applied_count += 1
-                    elif col not in temp_df.columns and col != "لا شيء":
-                        st.warning(f"عمود التصفية '{col}' غير موجود. يتم تخطي عامل التصفية هذا.")
-
-                st.session_state.filtered_df_votes = temp_df
+                # All filters are combined into one row mask over precomputed column codes, kept as row positions;
+                # in SQL mode into one parameterized WHERE condition, run when counts or a page are needed
+                with instrumentation.stage("filter"):
+                    if SQL_BACKEND:
+                        filter_result = voter_query.compile_filters(
+                            st.session_state.active_filters_votes, columns_available
+                        )
+                        filtered_view = voter_query.SqlView.from_filters(storage.get_pool(DB_FILE), filter_result)
+                    else:
+                        filtered_view, filter_result = da.filter_view(
+                            df_original, st.session_state.active_filters_votes, get_column_index(df_original)
+                        )
+                for col in filter_result.skipped_columns:
+                    st.warning(f"عمود التصفية '{col}' غير موجود. يتم تخطي عامل التصفية هذا.")
+                filters_applied_count = filter_result.applied
+
+                st.session_state.filtered_view_votes = filtered_view
+                st.session_state.applied_filters_votes = [
+                    dict(filt, values=list(filt["values"])) for filt in st.session_state.active_filters_votes
+                ]
                 if filters_applied_count > 0:
                     st.sidebar.success(f"تم تطبيق {filters_applied_count} عامل (عوامل) تصفية.")
                 else:
                     st.sidebar.info("لا توجد عوامل تصفية نشطة. يتم عرض جميع البيانات.")
-                if filters_applied_count == 0:
-                    st.session_state.filtered_df_votes = df_original  # Ensure reset if no filters actually applied
                 st.rerun()
             except Exception as e:
                 st.sidebar.error(f"خطأ في تطبيق عوامل التصفية: {e}")
@@ -318,15 +681,12 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
         if reset_filters_button_votes:
             perform_reset = bool(st.session_state.active_filters_votes)
             if not perform_reset:
-                if st.session_state.filtered_df_votes is None or (
-                    df_original is not None and not st.session_state.filtered_df_votes.equals(df_original)
-                ):
-                    perform_reset = True
-                elif df_original is None and st.session_state.filtered_df_votes is not None:
-                    perform_reset = True
+                filtered_view = st.session_state.filtered_view_votes
+                perform_reset = filtered_view is None or not filtered_view.is_full
             if perform_reset:
                 st.session_state.active_filters_votes = []
-                st.session_state.filtered_df_votes = df_original
+                st.session_state.applied_filters_votes = []
+                st.session_state.filtered_view_votes = full_view(df_original)
                 st.sidebar.info("تمت إعادة تعيين جميع عوامل التصفية. يتم عرض جميع البيانات.")
                 st.rerun()
             else:
@@ -341,6 +701,25 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
             if st.sidebar.button("تحميل من CSV واستبدال", key="load_csv_btn"):
                 if load_db_from_csv(uploaded_csv_file):
                     st.rerun()
+        if st.session_state.get("csv_import_report") is not None:
+            st.sidebar.caption(f"آخر استيراد: {st.session_state.csv_import_report}")
+
+        # --- Merge a revised roll: changed voters are upserted, voting state is kept ---
+        st.sidebar.markdown("---")
+        st.sidebar.subheader("تحديث القائمة من ملف Excel")
+        uploaded_roll_file = st.sidebar.file_uploader("اختر القائمة المعدلة:", type=["xlsx"], key="roll_uploader")
+        if uploaded_roll_file is not None:
+            if st.sidebar.button("دمج مع قاعدة البيانات", key="merge_roll_btn"):
+                if merge_roll_upload(uploaded_roll_file) is not None:
+                    st.rerun()
+        if st.session_state.get("roll_merge_report") is not None:
+            merge_report = st.session_state.roll_merge_report
+            st.sidebar.caption(
+                f"آخر دمج: {merge_report.inserted} جديد، {merge_report.updated} معدل، "
+                f"{merge_report.removed} محذوف، {merge_report.unchanged} دون تغيير"
+            )
+            if merge_report.removed_voted:
+                st.sidebar.warning(f"حُذف {merge_report.removed_voted} ناخب (ناخبين) كانوا قد صوتوا.")
 
         # --- Reset Database ---
         st.sidebar.markdown("---")
@@ -348,19 +727,27 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
         st.sidebar.warning("سيؤدي هذا إلى حذف قاعدة البيانات الحالية والبدء من جديد. يرجى التأكد قبل المتابعة.")
 
         if st.sidebar.button("إعادة تعيين قاعدة البيانات", key="reset_db_btn"):
-            if os.path.exists(DB_FILE):
-                os.remove(DB_FILE)
-            st.session_state.clear()
+            reset_database()
             st.success("تمت إعادة تعيين قاعدة البيانات. سيتم إعادة تحميل البيانات. يرجى إعادة التشغيل إذا لزم الأمر.")
             st.rerun()
 
+        # --- Memory: the roll is shared by all sessions; only this session's filtered view is its own ---
+        if SQL_BACKEND:
+            st.sidebar.caption("الذاكرة: وضع SQL، تُقرأ الصفحة المعروضة فقط من قاعدة البيانات")
+        else:
+            memory_report = current_roll().memory_report(st.session_state.filtered_view_votes)
+            st.sidebar.caption(f"الذاكرة: {memory_report}")
+
         st.header("قائمة الناخبين")
-        if st.session_state.filtered_df_votes is not None:
-            # --- Calculate and Display Vote Counts (based on st.session_state.filtered_df_votes) ---
-            if not st.session_state.filtered_df_votes.empty:
-                total_in_filtered = len(st.session_state.filtered_df_votes)
-                if "voted" in st.session_state.filtered_df_votes.columns:
-                    voted_in_filtered = st.session_state.filtered_df_votes["voted"].astype(bool).sum()
+        if st.session_state.filtered_view_votes is not None:
+            filtered_view = st.session_state.filtered_view_votes
+            # --- Calculate and Display Vote Counts (based on st.session_state.filtered_view_votes) ---
+            if not filtered_view.empty:
+                if "voted" in df_original.columns:
+                    with instrumentation.stage("metrics"):
+                        voted_in_filtered, total_in_filtered = filtered_turnout(
+                            filtered_view, st.session_state.get("applied_filters_votes", [])
+                        )
                     col1_count, col2_count = st.columns(2)
                     with col1_count:
                         st.metric(label="صوّت (حسب عوامل تصفية المستخدم)", value=voted_in_filtered)
@@ -372,28 +759,77 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
             else:
                 st.info("لا يوجد ناخبون في العرض الحالي المصفى من قبل المستخدم لعدهم.")  # Clarified message
 
-            # --- Prepare DataFrame for st.data_editor (df_for_editor) ---
-            # Start with a copy of the dynamically filtered data
-            df_for_editor = st.session_state.filtered_df_votes.copy()
+            # --- Prepare the rows for st.data_editor (view_for_editor) ---
+            # Start from the dynamically filtered rows; narrowing them intersects row positions, nothing is copied
+            view_for_editor = filtered_view
 
             # Apply the permanent vote display filter based on radio button selection
-            if st.session_state.permanent_vote_display_filter == "عرض من صوت فقط":
-                if "voted" in df_for_editor.columns:
-                    df_for_editor = df_for_editor[df_for_editor["voted"].astype(bool)].copy()
-            elif st.session_state.permanent_vote_display_filter == "عرض من لم يصوت فقط":
-                if "voted" in df_for_editor.columns:
-                    df_for_editor = df_for_editor[~df_for_editor["voted"].astype(bool)].copy()
-            # If "Show All", no further filtering is done on df_for_editor here.
+            if st.session_state.permanent_vote_display_filter != "عرض الكل" and "voted" in df_original.columns:
+                with instrumentation.stage("vote_status_view"):
+                    if SQL_BACKEND:
+                        view_for_editor = view_for_editor.where_voted(
+                            st.session_state.permanent_vote_display_filter == "عرض من صوت فقط"
+                        )
+                    elif st.session_state.permanent_vote_display_filter == "عرض من صوت فقط":
+                        view_for_editor = view_for_editor.where(df_original["voted"].to_numpy(dtype=bool))
+                    elif st.session_state.permanent_vote_display_filter == "عرض من لم يصوت فقط":
+                        view_for_editor = view_for_editor.where(~df_original["voted"].to_numpy(dtype=bool))
+            # If "Show All", no further filtering is done on view_for_editor here.
+
+            # Search box: ranked prefix/fuzzy lookup by name, family, father's name or registry number,
+            # tolerant of alef/ya/ta-marbuta spelling variants
+            search_text = st.text_input("بحث بالاسم أو الشهرة أو رقم السجل:", key="voter_search")
+            if search_text.strip():
+                with instrumentation.stage("search"):
+                    # Matches are checked against the current view before the result limit is applied
+                    within = None if view_for_editor.is_full else searchable_within(df_original, view_for_editor)
+                    found_ids = voter_search.search_ids(storage.get_pool(DB_FILE), search_text, within=within)
+                    if SQL_BACKEND:
+                        view_for_editor = view_for_editor.restrict(found_ids)  # Best match first
+                    else:
+                        positions = voter_positions(df_original, found_ids)
+                        view_for_editor = da.RowView(df_original, positions[positions >= 0])  # Best match first
+
+            # --- Pagination: only the visible page is sent to the browser ---
+            n_view_rows = len(view_for_editor)
+            page_col1, page_col2 = st.columns(2)
+            page_size = page_col1.selectbox(
+                "عدد الصفوف في الصفحة:",
+                paging.PAGE_SIZES,
+                index=paging.PAGE_SIZES.index(paging.DEFAULT_PAGE_SIZE),
+                key="voter_page_size",
+            )
+            n_pages = paging.page_count(n_view_rows, page_size)
+            if "voter_page" not in st.session_state:
+                st.session_state.voter_page = 1
+            elif st.session_state.voter_page > n_pages:  # The view shrank (new filter or search)
+                st.session_state.voter_page = n_pages
+            page_number = page_col2.number_input(
+                f"الصفحة (من {n_pages}):", min_value=1, max_value=n_pages, step=1, key="voter_page"
+            )
+            page_start, page_stop = paging.page_bounds(page_number - 1, n_view_rows, page_size)
 
-            df_display = df_for_editor
+            # The page's rows are read from the database by voter_id, so they carry the latest saved votes
+            with instrumentation.stage("page_fetch"):
+                if SQL_BACKEND:  # The view's query reads the page's rows directly (LIMIT/OFFSET)
+                    df_display = view_for_editor.take(page_start, page_stop)
+                else:
+                    page_ids = view_for_editor.take(page_start, page_stop)[st.session_state.id_column_name].tolist()
+                    df_display = storage.fetch_rows(storage.get_pool(DB_FILE), page_ids)
 
             if "voted" in df_display.columns:
                 df_display["voted"] = df_display["voted"].astype(bool)
+                overlay_pending_votes(df_display, st.session_state.id_column_name)
             else:
                 st.error("حرج: عمود 'voted' مفقود من بيانات العرض. لا يمكن المتابعة في التعديل.")
                 st.stop()
 
-            edited_df = st.data_editor(
+            # The editor's edited_rows delta is positional and outlives reruns while the key stays the same;
+            # a fresh key per consumed delta keeps it from being replayed onto the rows of the next page or view
+            id_col = st.session_state.id_column_name
+            editor_key = f"data_editor_votes_{st.session_state.get('editor_generation', 0)}"
+            df_display = df_display.set_index(id_col)
+            st.data_editor(
                 df_display,
                 column_config={
                     "voted": st.column_config.CheckboxColumn(
@@ -403,74 +839,27 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
                 },
                 # Make all columns non-editable except 'voted'
                 disabled=[col for col in df_display.columns if col != "voted"],
-                key="data_editor_votes",
-                num_rows="dynamic",
+                key=editor_key,
             )
 
             # --- Detect changes and update DB ---
-            # Compare edited_df with df_display (what was actually sent to the editor)
-            if not edited_df.equals(df_display):
-                # Merge edited_df (potentially a subset if "show_not_voted_filter" was on)
-                # with st.session_state.filtered_df_votes (the broader context from dynamic filters)
-                # to correctly identify original 'voted' status for comparison.
-                comparison_df = st.session_state.filtered_df_votes.merge(
-                    edited_df,  # Contains voter_id and new 'voted_edited' status from the editor
-                    on=st.session_state.id_column_name,
-                    suffixes=("_orig", "_edited"),
-                    how="inner",  # Ensures we only process rows that were actually in edited_df (i.e., displayed)
-                )
-                changed_rows = comparison_df[comparison_df["voted_orig"] != comparison_df["voted_edited"]]
-                if not changed_rows.empty:
-                    updated_ids_count = 0
-                    for _, row in changed_rows.iterrows():
-                        person_app_id = row[st.session_state.id_column_name]
-                        new_voted_status = row["voted_edited"]
-                        if update_voted_status(person_app_id, st.session_state.id_column_name, new_voted_status):
-                            updated_ids_count += 1
-                        else:
-                            st.warning(f"فشل تحديث حالة التصويت لمعرف التطبيق {person_app_id} في قاعدة البيانات.")
-                    if updated_ids_count > 0:
-                        st.success(f"تم تحديث حالة التصويت لـ {updated_ids_count} ناخب (ناخبين) في قاعدة البيانات.")
-                        st.session_state.df_votes = load_data_from_db()
-                        if st.session_state.df_votes is None:
-                            st.error("فشل إعادة تحميل البيانات من قاعدة البيانات بعد التحديث. خطأ حرج.")
-                            st.session_state.filtered_df_votes = pd.DataFrame()
-                            st.session_state.active_filters_votes = []
-                            st.rerun()  # Try to reset to a somewhat stable state
-                        else:
-                            # Re-apply filters
-                            temp_df_after_update = st.session_state.df_votes.copy()
-                            current_filters = st.session_state.active_filters_votes
-                            if current_filters:
-                                for filt_reapply in current_filters:
-                                    col_reapply = filt_reapply["column"]
-                                    vals_reapply = filt_reapply["values"]
-                                    if (
-                                        col_reapply != "لا شيء"
-                                        and vals_reapply
-                                        and col_reapply in temp_df_after_update.columns
-                                    ):
-                                        # Simplified re-application; assumes types are fine from previous application
-                                        try:
-                                            col_type_reapply = temp_df_after_update[col_reapply].dtype
-                                            if pd.api.types.is_numeric_dtype(col_type_reapply):
-                                                converted_vals_reapply = [pd.to_numeric(v) for v in vals_reapply]
-                                                temp_df_after_update = temp_df_after_update[
-                                                    temp_df_after_update[col_reapply].isin(converted_vals_reapply)
-                                                ]
-                                            else:
-                                                temp_df_after_update = temp_df_after_update[
-                                                    temp_df_after_update[col_reapply]
-                                                    .astype(str)
-                                                    .isin(map(str, vals_reapply))
-                                                ]
-                                        except Exception as e_reapply:
-                                            st.error(
-                                                f"خطأ في إعادة تطبيق عامل التصفية على '{col_reapply}': {e_reapply}"
-                                            )
-                            st.session_state.filtered_df_votes = temp_df_after_update
-                            st.rerun()
-            st.write(f"عرض {len(edited_df)} ناخب (ناخبين).")
+            # Only the editor's edited_rows delta is inspected, so the cost follows the number of ticks
+            with instrumentation.stage("editor_diff"):
+                editor_state = st.session_state.get(editor_key)
+                changes = collect_editor_changes(editor_state, df_display)
+            if editor_state and editor_state.get("edited_rows"):
+                st.session_state.editor_generation = st.session_state.get("editor_generation", 0) + 1
+            if changes:
+                with instrumentation.stage("vote_submit"):
+                    # Patch the roll in place at once; filtered views only hold positions into it.
+                    # The database write is queued and group-committed by the background writer.
+                    apply_voted_changes(st.session_state.df_votes, changes, id_col)
+                    submit_voted_statuses(changes)
+                st.session_state.vote_write_error = None
+                st.rerun()
+            vote_write_status()
+            follow_other_volunteers()
+            st.write(f"عرض {page_start + 1 if n_view_rows else 0}-{page_stop} من {n_view_rows} ناخب (ناخبين).")
         else:
             st.info("لا توجد بيانات لعرضها. قد تحتاج إلى إعادة تعيين قاعدة البيانات أو التحقق من ملف Excel.")
     # This else corresponds to if df_votes became None due to missing voter_id
@@ -481,9 +870,7 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
         )
         # Optionally, provide a button to attempt re-initialization or guide the user.
         if st.button("محاولة إعادة تهيئة قاعدة البيانات"):
-            if os.path.exists(DB_FILE):
-                os.remove(DB_FILE)
-            st.session_state.clear()
+            reset_database()
             st.rerun()
 
 # Placeholder for any additional UI elements or logic outside the main data-dependent block.
@@ -491,7 +878,31 @@ if st.session_state.df_votes is not None and not st.session_state.df_votes.empty
 else:  # This handles the case where df_votes is None from the start
     st.error("فشل تحميل بيانات الناخبين عند بدء التشغيل. حاول إعادة تعيين قاعدة البيانات.")
     if st.sidebar.button("إعادة تعيين قاعدة البيانات الآن"):
-        if os.path.exists(DB_FILE):
-            os.remove(DB_FILE)
-        st.session_state.clear()  # Clear session state to trigger re-initialization
+        reset_database()
         st.rerun()
+
+# --- Rerun instrumentation: log this run and optionally show where its time went ---
+instrumentation.finish(rerun_profile)
+if st.sidebar.checkbox("عرض لوحة الأداء", key="debug_panel"):
+    with st.sidebar.expander("أداء آخر تشغيل", expanded=True):
+        status = "بطيء" if rerun_profile.slow else "عادي"
+        st.caption(f"{rerun_profile.seconds * 1000:.0f} ms ({status})")
+        st.dataframe(rerun_profile.stage_frame(), hide_index=True)
+        col1_debug, col2_debug, col3_debug = st.columns(3)
+        col1_debug.metric("استعلامات SQLite", rerun_profile.queries)
+        col2_debug.metric("صفوف مقروءة", rerun_profile.rows_read)
+        col3_debug.metric("صفوف مكتوبة", rerun_profile.rows_written)
+        copied_bytes = sum(copy["bytes"] for copy in rerun_profile.copies)
+        st.caption(f"نسخ DataFrame: {len(rerun_profile.copies)} ({copied_bytes / 1024:.1f} KiB)")
+        writer = get_vote_writer(DB_FILE)
+        st.caption(
+            f"كاتب الأصوات: {writer.commits} عملية حفظ، {writer.retries} إعادة محاولة، "
+            f"{len(writer.pending_votes())} قيد الانتظار"
+        )
+        if st.session_state.get("startup_report"):
+            startup_kind = "بارد" if st.session_state.startup_report["kind"] == "cold" else "دافئ"
+            st.caption(
+                f"بدء الجلسة ({startup_kind}): {st.session_state.startup_report['seconds'] * 1000:.0f} ms؛ "
+                f"{start_database_build(DB_FILE)}"
+            )
+        st.caption(f"السجل: {instrumentation.METRICS_FILE}")